@@ -0,0 +1,898 @@
+import argparse
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.forecast.data import load_meter_blue_csv, load_meter_blue_static, stream_meter_blue_csv
+from src.forecast.feature_engineering import (
+    calculate_daytime_heat_stress, calculate_drought_index, calculate_nighttime_heat_stress,
+    calculate_yield_risk, compute_dependent, static_features,
+)
+from tests.synthetic import CURRENT_END, CURRENT_N_LOCATIONS, CURRENT_START, write_synthetic_meter_blue
+
+
+def legacy_preprocess_meter_blue_data(df):
+    """
+    Row-wise preprocessing that load_meter_blue_csv replaced, kept as the benchmark baseline.
+    """
+    df['variable'] = df.apply(
+        lambda row: f"{row['variable']}_{row['aggregation']}" if row['aggregation'] in ['max', 'min', 'sum'] else row['variable'],
+        axis=1
+    )
+    df.drop(columns=['unit', 'level', 'timeResolution', 'aggregation'], inplace=True)
+    df = df.melt(
+        id_vars=['location', 'lat', 'lon', 'asl', 'variable'],
+        var_name='date',
+        value_name='value'
+    )
+    df['date'] = pd.to_datetime(df['date'], format='%Y%m%dT%H%M', errors='coerce')
+    df['variable'] = df['variable'].apply(lambda x: '_'.join(x.split(' ')[1:]).replace(' ', '_'))
+    return df
+
+
+def legacy_compute_dependent(df, df_static):
+    """
+    Long-frame compute_dependent that the wide-first version replaced, kept as the benchmark
+    baseline: it merges TMax/TMin and the seasonal results onto the long frame, then merges the
+    pivot back and drops the duplicated rows.
+    """
+    df['year'] = df['date'].dt.year
+    growing_season_df = df[df['date'].dt.month.between(5, 8)]
+
+    df_max = df[df['variable'] == 'Temperature_max'][['location', 'date', 'value']]
+    df_min = df[df['variable'] == 'Temperature_min'][['location', 'date', 'value']]
+    df_merged = pd.merge(df_max, df_min, on=['location', 'date'], suffixes=('_max', '_min'))
+    df = df.merge(df_merged, on=['location', 'date'], how='left')
+    df.rename(columns={'value_max': 'TMax', 'value_min': 'TMin'}, inplace=True)
+    df['GDD_day'] = ((df['TMax'] + df['TMin']) / 2 - 10)
+    df['daytime_heat_stress'] = calculate_daytime_heat_stress(df['TMax'], 25, 35)
+    df['nighttime_heat_stress'] = calculate_nighttime_heat_stress(df['TMin'], 15, 25)
+
+    season_dates = growing_season_df.groupby(['location', 'year'], observed=True)['date']
+    seasonal = growing_season_df.groupby(['location', 'year', 'variable'], observed=True)['value'] \
+        .agg(['max', 'min', 'sum', 'mean']).unstack('variable')
+    seasonal.columns = pd.MultiIndex.from_tuples([(stat, str(variable)) for stat, variable in seasonal.columns])
+    seasonal['sum'] = seasonal['sum'].fillna(0)
+    season_locations = seasonal.index.get_level_values('location').astype(str)
+    static_mean = df_static.pivot_table(index='location', columns='variable', values='value', aggfunc='mean', observed=True)
+    static_sum = df_static.pivot_table(index='location', columns='variable', values='value', aggfunc='sum', observed=True)
+    static_mean.index, static_sum.index = static_mean.index.astype(str), static_sum.index.astype(str)
+    pH = static_mean['pH_in_H2O'].reindex(season_locations).to_numpy()
+    N = season_dates.nunique().to_numpy() * static_sum['Total_Nitrogen_Content'].reindex(season_locations).fillna(0).to_numpy()
+    GDD_seasonal = (seasonal[('max', 'Temperature')] + seasonal[('min', 'Temperature')]) / 2 - 10
+    cum_precip = seasonal[('sum', 'Precipitation_Total_sum')]
+    seasonal_results_df = season_dates.min().reset_index()
+    seasonal_results_df['drought_index'] = calculate_drought_index(
+        cum_precip, seasonal[('sum', 'Evapotranspiration_sum')], seasonal[('mean', 'Soil_Moisture')], seasonal[('mean', 'Temperature')]
+    ).to_numpy()
+    seasonal_results_df['yield_risk'] = calculate_yield_risk(GDD_seasonal, cum_precip, pH, N, 1000, 500, 6.5, 100, 0.3, 0.3, 0.2, 0.2).to_numpy()
+
+    merged_results_df = df.merge(seasonal_results_df, on=['location', 'year'], how='left')
+    merged_results_df.rename(columns={'date_x': 'date'}, inplace=True)
+    merged_results_df.drop(columns=['date_y'], inplace=True)
+    df_pivot = merged_results_df.pivot_table(index=['location', 'date'], columns='variable', values='value', observed=True).reset_index()
+    df_pivot = df_pivot.merge(static_features(df_static), on='location', how='left')
+    merged_results_df = merged_results_df.merge(df_pivot, on=['location', 'date'], how='left')
+    merged_results_df.drop_duplicates(inplace=True)
+    merged_results_df.drop_duplicates(subset=['location', 'date'], inplace=True)
+    merged_results_df.drop(columns=['variable', 'value'], inplace=True)
+    return merged_results_df
+
+
+def legacy_lags_features(df, dependent_vars, horizon):
+    """
+    The groupby/transform version of lags_features, kept as the reference for the rolling engine.
+    """
+    df.sort_values(['date'], inplace=True)
+    for var in dependent_vars:
+        df[f'lag_{var}'] = df.groupby('location')[var].shift(horizon)
+        df[f'lag_{var}'] = np.log(df[f'lag_{var}'] + 1)
+        df[f'lag1_{var}'] = df.groupby('location')[f'lag_{var}'].shift(1)
+        df[f'lag24_{var}'] = df.groupby('location')[f'lag_{var}'].shift(24)
+        df[f'lag_7d_{var}'] = df.groupby('location')[var].shift(horizon)
+        df[f'lag_14d_{var}'] = df.groupby('location')[var].shift(horizon)
+        df[f'rolling_mean_7d_{var}'] = df.groupby('location')[var]\
+            .transform(lambda x: x.rolling(window=horizon, min_periods=1).mean())
+        df[f'rolling_std_7d_{var}'] = df.groupby('location')[var]\
+            .transform(lambda x: x.rolling(window=horizon, min_periods=1).std())
+        df[f'rolling_q75_7d_{var}'] = df.groupby('location')[var]\
+            .transform(lambda x: x.rolling(window=horizon, min_periods=1).quantile(0.75))
+        df[f'rolling_mean_28d_{var}'] = df.groupby('location')[var]\
+            .transform(lambda x: x.rolling(window=horizon, min_periods=1).mean())
+        df[f'rolling_std_28d_{var}'] = df.groupby('location')[var]\
+            .transform(lambda x: x.rolling(window=horizon, min_periods=1).std())
+    return df
+
+
+def assert_same_long_frame(result, expected):
+    """
+    Checks a long-format frame against the reference, up to dtypes and float32 rounding.
+    """
+    assert list(result.columns) == list(expected.columns), (list(result.columns), list(expected.columns))
+    assert len(result) == len(expected), (len(result), len(expected))
+    for col in result.columns:
+        left, right = np.asarray(result[col]), np.asarray(expected[col])
+        if np.issubdtype(right.dtype, np.floating):
+            np.testing.assert_allclose(left, right, rtol=1e-6, equal_nan=True, err_msg=col)
+        else:
+            np.testing.assert_array_equal(left.astype(right.dtype), right, err_msg=col)
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def _measure_in_child(queue, fn, args):
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    fn(*args)
+    elapsed = time.perf_counter() - start
+    queue.put((elapsed, (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline) / 1024))
+
+
+def peak_memory(fn, *args):
+    """
+    Runs fn in a forked process and returns (seconds, peak RSS increase in MB).
+    """
+    context = multiprocessing.get_context('fork')
+    queue = context.Queue()
+    process = context.Process(target=_measure_in_child, args=(queue, fn, args))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def benchmark_loader(scale=10):
+    """
+    Compares the row-wise preprocessing against the columnar loader on a synthetic export
+    `scale` times the size of our current one.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        dynamic_path, _ = write_synthetic_meter_blue(directory, n_locations=CURRENT_N_LOCATIONS * scale)
+        print(f"CSV size: {os.path.getsize(dynamic_path) / 1e6:.1f} MB")
+
+        legacy, legacy_time = timed(lambda: legacy_preprocess_meter_blue_data(pd.read_csv(dynamic_path)))
+        columnar, columnar_time = timed(load_meter_blue_csv, dynamic_path)
+
+    assert_same_long_frame(columnar, legacy)
+    print(f"Rows: {len(columnar)}")
+    print(f"Row-wise preprocessing: {legacy_time:.2f}s, {legacy.memory_usage(deep=True).sum() / 1e6:.0f} MB")
+    print(f"Columnar loader:        {columnar_time:.2f}s, {columnar.memory_usage(deep=True).sum() / 1e6:.0f} MB")
+    print(f"Speedup: {legacy_time / columnar_time:.1f}x")
+
+
+def benchmark_streaming(scale=10):
+    """
+    Peak memory of the in-memory melt against the streaming ingestion at several budgets.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        dynamic_path, _ = write_synthetic_meter_blue(directory, n_locations=CURRENT_N_LOCATIONS * scale)
+        output_path = os.path.join(directory, 'meteoblue_dynamic.parquet')
+        print(f"CSV size: {os.path.getsize(dynamic_path) / 1e6:.1f} MB")
+
+        elapsed, peak = peak_memory(lambda: legacy_preprocess_meter_blue_data(pd.read_csv(dynamic_path)))
+        print(f"read_csv + melt:           {elapsed:6.2f}s, peak {peak:7.0f} MB")
+        elapsed, peak = peak_memory(load_meter_blue_csv, dynamic_path)
+        print(f"load_meter_blue_csv:       {elapsed:6.2f}s, peak {peak:7.0f} MB")
+        for max_memory_mb in [16, 64, 256]:
+            elapsed, peak = peak_memory(stream_meter_blue_csv, dynamic_path, output_path, max_memory_mb)
+            print(f"stream_meter_blue_csv {max_memory_mb:3d}: {elapsed:6.2f}s, peak {peak:7.0f} MB")
+
+
+def benchmark_incremental(scale=10, n_days=3):
+    """
+    Appends the last `n_days` one day at a time and checks the result against a full rebuild.
+    """
+    from src.forecast import incremental
+
+    with tempfile.TemporaryDirectory() as directory:
+        dynamic_path, static_path = write_synthetic_meter_blue(directory, n_locations=CURRENT_N_LOCATIONS * scale)
+        df, df_static = load_meter_blue_csv(dynamic_path), load_meter_blue_static(static_path)
+        new_days = pd.date_range(end=df['date'].max(), periods=n_days, freq='D')
+
+        incremental.build_dataset(os.path.join(directory, 'incremental'), df[df['date'] < new_days[0]], df_static)
+        for day in new_days:
+            _, elapsed = timed(incremental.append_days, os.path.join(directory, 'incremental'), df[df['date'] == day])
+            print(f"append_days {day.date()}: {elapsed:.2f}s")
+        _, elapsed = timed(incremental.build_dataset, os.path.join(directory, 'full'), df, df_static)
+        print(f"Full rebuild:           {elapsed:.2f}s")
+
+        pd.testing.assert_frame_equal(
+            incremental.load_dataset(os.path.join(directory, 'incremental')),
+            incremental.load_dataset(os.path.join(directory, 'full')),
+        )
+        print("Incremental dataset matches the full rebuild")
+
+
+def benchmark_dependent(scale=10):
+    """
+    Wall time and peak memory of compute_dependent against the long-frame version.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        dynamic_path, static_path = write_synthetic_meter_blue(directory, n_locations=CURRENT_N_LOCATIONS * scale)
+        df, df_static = load_meter_blue_csv(dynamic_path), load_meter_blue_static(static_path)
+    print(f"Long rows: {len(df)}")
+
+    elapsed, peak = peak_memory(legacy_compute_dependent, df.copy(), df_static)
+    print(f"Long-frame compute_dependent: {elapsed:6.2f}s, peak {peak:7.0f} MB")
+    elapsed, peak = peak_memory(compute_dependent, df, df_static)
+    print(f"Wide-first compute_dependent: {elapsed:6.2f}s, peak {peak:7.0f} MB")
+
+
+def _lags_input(scale):
+    with tempfile.TemporaryDirectory() as directory:
+        dynamic_path, static_path = write_synthetic_meter_blue(directory, n_locations=CURRENT_N_LOCATIONS * scale)
+        df = compute_dependent(load_meter_blue_csv(dynamic_path), load_meter_blue_static(static_path))
+    df['drought_index'] = (df['drought_index'] == 'High risk').astype('float64')
+    df['location'] = df['location'].astype(str)
+    return df
+
+
+def benchmark_rolling(scale=10):
+    """
+    lags_features on the grouped rolling engine against the groupby/transform version.
+    """
+    from src.forecast.feature_engineering import DEPENDENT_VARIABLE, LAG_HORIZON, lags_features
+
+    df = _lags_input(scale)
+    expected, legacy_time = timed(lambda: legacy_lags_features(df.copy(), DEPENDENT_VARIABLE, LAG_HORIZON))
+    result, engine_time = timed(lambda: lags_features(df.copy(), DEPENDENT_VARIABLE, LAG_HORIZON))
+
+    pd.testing.assert_index_equal(result.index, expected.index)
+    for col in expected.columns:
+        if col.startswith('rolling_std'):
+            # pandas' online rolling variance drifts over long frames; the engine does not
+            np.testing.assert_allclose(result[col], expected[col], rtol=1e-2, atol=1e-3, equal_nan=True, err_msg=col)
+        else:
+            pd.testing.assert_series_equal(result[col], expected[col], check_dtype=False)
+    print(f"Rows: {len(result)}")
+    print(f"groupby/transform lags_features: {legacy_time:.2f}s")
+    print(f"Rolling engine lags_features:    {engine_time:.2f}s")
+
+
+def benchmark_quantile(scale=10, window=120, quantiles=(0.1, 0.5, 0.75, 0.9)):
+    """
+    Rolling quantiles of every location from rolling_quantile against per-location
+    groupby/transform lambdas, on daily series with ties and gaps.
+    """
+    from src.forecast.panel import rolling_quantile
+
+    rng = np.random.default_rng(0)
+    n_locations, n_days = CURRENT_N_LOCATIONS * scale, len(pd.date_range(CURRENT_START, CURRENT_END))
+    values = rng.normal(0, 3, size=(n_locations, n_days)).round(1)
+    values[rng.random(values.shape) < 0.05] = np.nan
+    values[:, 500:650] = np.nan
+    series = pd.Series(values.ravel())
+    location = np.repeat(np.arange(n_locations), n_days)
+
+    result, kernel_time = timed(rolling_quantile, values, window, list(quantiles))
+    legacy_time = 0
+    for q, computed in zip(quantiles, result):
+        expected, elapsed = timed(lambda: series.groupby(location).transform(lambda x: x.rolling(window, min_periods=1).quantile(q)))
+        legacy_time += elapsed
+        np.testing.assert_allclose(computed.ravel(), expected.to_numpy(), rtol=1e-12, equal_nan=True, err_msg=str(q))
+    print(f"Values: {values.size}, quantiles: {list(quantiles)}, window: {window}")
+    print(f"groupby/transform quantiles: {legacy_time:.2f}s")
+    print(f"rolling_quantile:            {kernel_time:.2f}s")
+
+
+def benchmark_ffill(scale=10):
+    """
+    ffill_within_groups against groupby(['location', 'date']).apply(ffill) on the dependent
+    variables panel, with some (location, date) rows delivered twice with gaps.
+    """
+    from src.forecast.feature_engineering import ffill_within_groups
+
+    df = _lags_input(scale)
+    rng = np.random.default_rng(0)
+    duplicates = df.sample(frac=0.05, random_state=0)
+    numeric = duplicates.select_dtypes('number').columns
+    duplicates[numeric] = duplicates[numeric].mask(rng.random(duplicates[numeric].shape) < 0.5)
+    df = pd.concat([df, duplicates]).sample(frac=1, random_state=0)
+    df.loc[rng.random(len(df)) < 0.05, 'yield_risk'] = np.nan
+
+    expected, legacy_time = timed(lambda: df.groupby(['location', 'date']).apply(lambda group: group.ffill()).reset_index(drop=True))
+    result, vectorized_time = timed(ffill_within_groups, df, ['location', 'date'])
+    pd.testing.assert_frame_equal(result, expected)
+    print(f"Rows: {len(df)}, duplicated (location, date) rows: {len(duplicates)}")
+    print(f"groupby().apply(ffill): {legacy_time:.2f}s")
+    print(f"ffill_within_groups:    {vectorized_time:.2f}s")
+
+
+def benchmark_online(scale=10, n_days=5):
+    """
+    Daily OnlineFeatureState updates against rerunning feature_engineering over the history,
+    checking that the rows for each new day match.
+    """
+    from src.forecast.feature_engineering import DEPENDENT_VARIABLE, feature_engineering
+    from src.forecast.online import OnlineFeatureState
+
+    with tempfile.TemporaryDirectory() as directory:
+        dynamic_path, static_path = write_synthetic_meter_blue(directory, n_locations=CURRENT_N_LOCATIONS * scale)
+        df = compute_dependent(load_meter_blue_csv(dynamic_path), load_meter_blue_static(static_path))
+        new_days = sorted(df['date'].unique())[-n_days - 1:-1]
+
+        expected, batch_time = timed(feature_engineering, df.copy(), DEPENDENT_VARIABLE, [])
+        state, warm_time = timed(OnlineFeatureState.from_history, df[df['date'] < new_days[0]])
+        state.save(os.path.join(directory, 'state'))
+        state = OnlineFeatureState.load(os.path.join(directory, 'state'))
+
+    update_times = []
+    for day in new_days:
+        result, elapsed = timed(state.update, df[df['date'] == day])
+        update_times.append(elapsed)
+        pd.testing.assert_frame_equal(result, expected[expected['date'] == day].reset_index(drop=True), rtol=1e-6)
+    print(f"feature_engineering over the history: {batch_time:.2f}s")
+    print(f"OnlineFeatureState.from_history:      {warm_time:.2f}s")
+    print(f"OnlineFeatureState.update, per day:   {np.mean(update_times) * 1000:.1f}ms")
+
+
+def benchmark_panel(scale=10):
+    """
+    lags_features on the long frame against lags_features_panel on the location x day cube.
+    """
+    from src.forecast.feature_engineering import DEPENDENT_VARIABLE, LAG_HORIZON, lags_features
+    from src.forecast.panel import Panel, lags_features_panel
+
+    df = _lags_input(scale)
+    expected, frame_time = timed(lambda: lags_features(df.copy(), DEPENDENT_VARIABLE, LAG_HORIZON))
+    panel, build_time = timed(Panel.from_frame, df, DEPENDENT_VARIABLE)
+    result, panel_time = timed(lambda: lags_features_panel(panel, DEPENDENT_VARIABLE, LAG_HORIZON).to_frame())
+
+    expected = expected.sort_values(['location', 'date']).reset_index(drop=True)
+    for col in result.columns.drop(['location', 'date']):
+        np.testing.assert_allclose(result[col], expected[col], rtol=1e-5, atol=1e-4, equal_nan=True, err_msg=col)
+    print(f"Rows: {len(result)}, panel shape: {panel.values.shape}")
+    print(f"lags_features:            {frame_time:.2f}s")
+    print(f"Panel build:              {build_time:.2f}s")
+    print(f"lags_features_panel:      {panel_time:.2f}s")
+
+
+def benchmark_crops(scale=10):
+    """
+    compute_crop_risks for every crop in CROP_PARAMETERS in one pass, against one
+    compute_dependent run per crop.
+    """
+    from src.forecast.crops import CROP_PARAMETERS
+    from src.forecast.feature_engineering import compute_crop_risks
+
+    with tempfile.TemporaryDirectory() as directory:
+        dynamic_path, static_path = write_synthetic_meter_blue(directory, n_locations=CURRENT_N_LOCATIONS * scale)
+        df, df_static = load_meter_blue_csv(dynamic_path), load_meter_blue_static(static_path)
+
+    crops = list(CROP_PARAMETERS.index)
+    expected, loop_time = timed(lambda: [compute_dependent(df, df_static, crop) for crop in crops])
+    (keys, risks), batched_time = timed(compute_crop_risks, df, df_static)
+
+    for i, crop in enumerate(crops):
+        pd.testing.assert_frame_equal(keys, expected[i][['location', 'date']])
+        for name in ['GDD_day', 'daytime_heat_stress', 'nighttime_heat_stress', 'yield_risk']:
+            np.testing.assert_allclose(risks[name][:, i], expected[i][name], rtol=1e-6, atol=1e-4, equal_nan=True, err_msg=f'{crop} {name}')
+        drought = np.select([risks['drought_index'][:, i] > 0, risks['drought_index'][:, i] < 0], ['No risk', 'High risk'], default='Medium risk')
+        seasons = expected[i]['drought_index'].notna().to_numpy()
+        np.testing.assert_array_equal(drought[seasons], expected[i]['drought_index'][seasons], err_msg=crop)
+    print(f"Rows: {len(keys)}, crops: {len(crops)}")
+    print(f"compute_dependent per crop: {loop_time:.2f}s")
+    print(f"compute_crop_risks:         {batched_time:.2f}s")
+
+
+def legacy_spectral_features(df):
+    """
+    The groupby().apply() FFT and the separate power spectrum transform that spectral_features
+    replaced, kept as the benchmark baseline.
+    """
+    def apply_fft(group):
+        group = group.copy()
+        group['lag_Energia_fft'] = np.abs(np.fft.fft(group['lag_Energia'].values)) / len(group)
+        return group
+    df = df.groupby('Codigo', group_keys=False).apply(apply_fft)
+    df['power_spectrum'] = df.groupby('Codigo')['lag_Energia'].transform(lambda x: np.abs(np.fft.fft(x.values)) ** 2 / len(x))
+    return df
+
+
+def benchmark_spectral(scale=10, n_hours=24 * 365):
+    """
+    spectral_features (one batched FFT for magnitude and power) against the groupby().apply()
+    version, plus the cost of the causal STFT features.
+    """
+    from src.forecast.feature_transformation import spectral_features, stft_features
+
+    rng = np.random.default_rng(0)
+    n_codes = CURRENT_N_LOCATIONS * scale
+    df = pd.DataFrame({
+        'Codigo': np.repeat(np.arange(n_codes), n_hours),
+        'lag_Energia': rng.gamma(2, 3, n_codes * n_hours),
+    }).sample(frac=1, random_state=0).reset_index(drop=True)
+
+    expected, legacy_time = timed(legacy_spectral_features, df.copy())
+    result, batched_time = timed(spectral_features, df.copy())
+    for col in ['lag_Energia_fft', 'power_spectrum']:
+        np.testing.assert_allclose(result[col], expected[col], rtol=1e-10, err_msg=col)
+    _, stft_time = timed(stft_features, df.copy())
+    print(f"Rows: {len(df)}, series: {n_codes}")
+    print(f"groupby().apply(fft) + power transform: {legacy_time:.2f}s")
+    print(f"spectral_features:                      {batched_time:.2f}s")
+    print(f"stft_features (4 bins, window 24):      {stft_time:.2f}s")
+
+
+def benchmark_parallel(scale=10):
+    """
+    parallel_feature_engineering with 1, 2, 4, ... workers up to FEATURE_WORKERS against
+    feature_engineering in one process, checking the outputs are identical.
+    """
+    from src.forecast.feature_engineering import DEPENDENT_VARIABLE, feature_engineering
+    from src.forecast.parallel import FEATURE_WORKERS, parallel_feature_engineering
+
+    with tempfile.TemporaryDirectory() as directory:
+        dynamic_path, static_path = write_synthetic_meter_blue(directory, n_locations=CURRENT_N_LOCATIONS * scale)
+        df = compute_dependent(load_meter_blue_csv(dynamic_path), load_meter_blue_static(static_path))
+
+    expected, serial_time = timed(feature_engineering, df.copy(), DEPENDENT_VARIABLE, [])
+    print(f"Rows: {len(df)}, locations: {df['location'].nunique()}")
+    print(f"feature_engineering:                       {serial_time:6.2f}s")
+    n_workers = 1
+    while True:
+        result, elapsed = timed(parallel_feature_engineering, df.copy(), DEPENDENT_VARIABLE, [], n_workers=n_workers)
+        pd.testing.assert_frame_equal(result, expected)
+        print(f"parallel_feature_engineering, {n_workers:3d} workers: {elapsed:6.2f}s ({serial_time / elapsed:.1f}x)")
+        if n_workers >= FEATURE_WORKERS:
+            break
+        n_workers = min(n_workers * 2, FEATURE_WORKERS)
+
+
+def benchmark_store(scale=10):
+    """
+    Reading the features back from the feature store (all of them, and one year of a few
+    columns) against parsing the same frame from CSV.
+    """
+    from src.forecast.feature_engineering import DEPENDENT_VARIABLE, feature_engineering
+    from src.forecast.feature_store import read_features, write_features
+
+    with tempfile.TemporaryDirectory() as directory:
+        dynamic_path, static_path = write_synthetic_meter_blue(directory, n_locations=CURRENT_N_LOCATIONS * scale)
+        df = compute_dependent(load_meter_blue_csv(dynamic_path), load_meter_blue_static(static_path))
+        df_fe = feature_engineering(df, DEPENDENT_VARIABLE, []).reset_index(drop=True)
+
+        csv_path, store_dir = os.path.join(directory, 'df_fe.csv'), os.path.join(directory, 'store')
+        _, csv_write_time = timed(df_fe.to_csv, csv_path, index=False)
+        _, store_write_time = timed(write_features, df_fe, store_dir)
+
+        _, csv_time = timed(pd.read_csv, csv_path)
+        result, store_time = timed(read_features, store_dir)
+        pd.testing.assert_frame_equal(result, df_fe)
+        columns = DEPENDENT_VARIABLE + [f'lag_{var}' for var in DEPENDENT_VARIABLE]
+        result, slice_time = timed(read_features, store_dir, columns=columns, start='2023-01-01', end='2024-01-01')
+        expected = df_fe.loc[df_fe['date'].between('2023-01-01', '2024-01-01', inclusive='left'), ['location', 'date'] + columns]
+        pd.testing.assert_frame_equal(result, expected.reset_index(drop=True))
+    print(f"Rows: {len(df_fe)}, columns: {df_fe.shape[1]}")
+    print(f"Write CSV:                      {csv_write_time:6.2f}s")
+    print(f"Write feature store:            {store_write_time:6.2f}s")
+    print(f"read_csv:                       {csv_time:6.2f}s")
+    print(f"read_features, everything:      {store_time:6.2f}s")
+    print(f"read_features, 2023, 8 columns: {slice_time:6.2f}s")
+
+
+def benchmark_cv(scale=10, fold_stride=10):
+    """
+    Per-fold setup of train_model's cross-validation: .iloc copies and fresh DMatrix objects
+    (sketched again by xgb.train) against QuantileDMatrix folds binned from views of one matrix
+    with shared cuts. Each setup is timed with one boosting round; every `fold_stride`-th fold
+    is measured.
+    """
+    import xgboost as xgb
+    from src.forecast.feature_engineering import DEPENDENT_VARIABLE, feature_engineering
+    from src.forecast.train import custom_rolling_window_cv, cv_fold_matrices
+
+    with tempfile.TemporaryDirectory() as directory:
+        dynamic_path, static_path = write_synthetic_meter_blue(directory, n_locations=CURRENT_N_LOCATIONS * scale)
+        df = compute_dependent(load_meter_blue_csv(dynamic_path), load_meter_blue_static(static_path))
+    X = feature_engineering(df, DEPENDENT_VARIABLE, []).reset_index(drop=True)
+    y = X[DEPENDENT_VARIABLE]
+    X = X.drop(columns=DEPENDENT_VARIABLE)
+    n_locations = X['location'].nunique()
+    folds = list(custom_rolling_window_cv(X, 120 * n_locations, 120 * n_locations, 30 * n_locations))[::fold_stride]
+    params = {'tree_method': 'hist', 'max_depth': 6}
+
+    def legacy_setup():
+        for train_rows, val_rows in folds:
+            X_tr, X_val = X.iloc[list(range(train_rows.start, train_rows.stop))], X.iloc[list(range(val_rows.start, val_rows.stop))]
+            y_tr, y_val = y.iloc[list(range(train_rows.start, train_rows.stop))], y.iloc[list(range(val_rows.start, val_rows.stop))]
+            X_tr.drop(columns=['location', 'date'], inplace=True)
+            X_val.drop(columns=['location', 'date'], inplace=True)
+            dtrain = xgb.DMatrix(X_tr, label=y_tr, enable_categorical=True)
+            xgb.DMatrix(X_val, label=y_val, enable_categorical=True)
+            xgb.train(params, dtrain, num_boost_round=1)
+
+    def shared_setup():
+        features = X.drop(columns=['location', 'date']).to_numpy(dtype=np.float32)
+        for dtrain, _ in cv_fold_matrices(features, y.to_numpy(dtype=np.float32), folds):
+            xgb.train(params, dtrain, num_boost_round=1)
+
+    with pd.option_context('mode.chained_assignment', None):
+        _, legacy_time = timed(legacy_setup)
+    _, shared_time = timed(shared_setup)
+    print(f"Rows: {len(X)}, features: {X.shape[1] - 2}, folds measured: {len(folds)}")
+    print(f"iloc + DMatrix per fold:        {legacy_time / len(folds):.2f}s per fold")
+    print(f"Shared-cut QuantileDMatrix:     {shared_time / len(folds):.2f}s per fold (cuts sketched once, included)")
+
+
+def benchmark_cv_parallel(scale=10, n_folds=8):
+    """
+    train_model's folds trained one after the other with every core, against
+    parallel_cv_predictions with one fold per worker and the cores split between the workers.
+    The predictions must be identical to the sequential folds trained with the workers' nthread.
+    """
+    from src.forecast.train import CV_WORKERS, cv_fold_matrices, parallel_cv_predictions, params_xgb, train_fold_predictions
+
+    rng = np.random.default_rng(0)
+    n_rows = 2000 * scale
+    features = rng.normal(size=(n_rows, 40)).astype(np.float32)
+    labels = (np.abs(features[:, :4]) + 1 + rng.normal(scale=0.1, size=(n_rows, 4))).astype(np.float32)
+    step = n_rows // (n_folds + 2)
+    folds = [(slice(0, step * (k + 1)), slice(step * (k + 1), step * (k + 2))) for k in range(n_folds)]
+    n_cores = os.cpu_count() or 1
+    n_workers = max(1, min(max(CV_WORKERS, n_cores), n_folds))
+    nthread = max(1, n_cores // n_workers)
+
+    def sequential(nthread):
+        params = {**params_xgb, 'nthread': nthread}
+        return [train_fold_predictions(dtrain, dval, params) for dtrain, dval in cv_fold_matrices(features, labels, folds, nthread)]
+
+    expected, sequential_time = timed(sequential, n_cores)
+    result, parallel_time = timed(lambda: list(parallel_cv_predictions(features, labels, folds, n_workers, n_cores)))
+    # Histogram sums depend on the thread count, so the reference is trained with the workers' nthread
+    if nthread != n_cores:
+        expected = sequential(nthread)
+    for fold_expected, fold_result in zip(expected, result, strict=True):
+        np.testing.assert_array_equal(fold_result, fold_expected)
+    print(f"Rows: {n_rows}, folds: {n_folds}, cores: {n_cores}, workers: {n_workers} x {nthread} threads")
+    print(f"Sequential folds:        {sequential_time:6.2f}s")
+    print(f"parallel_cv_predictions: {parallel_time:6.2f}s")
+    print(f"Predictions match the sequential folds with nthread={nthread}")
+
+
+def benchmark_warm_start(scale=10, n_folds=8, extra_rounds=None):
+    """
+    Accuracy and time of train_model's expanding-window folds retrained from scratch, against
+    warm_start_cv_predictions continuing each fold from the previous fold's model.
+    """
+    from sklearn.metrics import mean_absolute_error
+    from src.forecast.train import WARM_START_ROUNDS, adjusted_mape, cv_fold_matrices, train_fold_predictions, warm_start_cv_predictions
+
+    rng = np.random.default_rng(0)
+    n_rows = 2000 * scale
+    features = rng.normal(size=(n_rows, 40)).astype(np.float32)
+    # Slowly drifting targets, so later windows hold something new to learn
+    drift = np.linspace(0, 1, n_rows)[:, None]
+    labels = (np.abs(features[:, :4]) * (1 + drift) + 1 + rng.normal(scale=0.1, size=(n_rows, 4))).astype(np.float32)
+    step = n_rows // (n_folds + 2)
+    folds = [(slice(0, step * (k + 2)), slice(step * (k + 2), step * (k + 3))) for k in range(n_folds)]
+    extra_rounds = WARM_START_ROUNDS if extra_rounds is None else extra_rounds
+
+    full, full_time = timed(lambda: [train_fold_predictions(dtrain, dval) for dtrain, dval in cv_fold_matrices(features, labels, folds)])
+    warm, warm_time = timed(lambda: list(warm_start_cv_predictions(features, labels, folds, extra_rounds)))
+
+    print(f"Rows: {n_rows}, folds: {n_folds}, warm start: at most {extra_rounds} extra rounds per fold")
+    print(f"{'':24s}{'time':>8s}{'MAE':>10s}{'MAPE':>10s}")
+    for name, predictions, elapsed in [('Full retraining', full, full_time), ('Warm start', warm, warm_time)]:
+        mae = np.mean([mean_absolute_error(labels[val_rows], pred) for (_, val_rows), pred in zip(folds, predictions)])
+        mape = np.mean([adjusted_mape(labels[val_rows], pred) for (_, val_rows), pred in zip(folds, predictions)])
+        print(f"{name:24s}{elapsed:7.1f}s{mae:10.4f}{mape:10.4f}")
+
+
+def benchmark_registry(scale=10, n_features=20):
+    """
+    forecast_dependents training its model, against a second call loading it from the model
+    registry, and the same call after invalidating the cutoff. The forecasts must be equal, and
+    another region with the same columns and cutoff must train its own model.
+    """
+    from src.forecast.registry import invalidate, list_models
+    from src.forecast.train import forecast_dependents
+
+    rng = np.random.default_rng(0)
+    dates = pd.date_range('2021-05-01', '2023-04-30', freq='W')
+    targets = ['yield_risk', 'drought_index', 'daytime_heat_stress', 'nighttime_heat_stress']
+
+    def region(locations):
+        X = pd.MultiIndex.from_product([locations, dates], names=['location', 'date']).to_frame(index=False)
+        features = rng.normal(size=(len(X), n_features)).astype(np.float32)
+        X = pd.concat([X, pd.DataFrame(features, columns=[f'feature_{i}' for i in range(n_features)])], axis=1)
+        return X, pd.DataFrame(np.abs(features[:, :4]) + 1, columns=targets)
+
+    X, y = region(range(4 * scale))
+    X_other, y_other = region(range(4 * scale, 8 * scale))
+
+    with tempfile.TemporaryDirectory() as registry_dir:
+        trained, train_time = timed(forecast_dependents, X.copy(), y, registry_dir=registry_dir)
+        loaded, load_time = timed(forecast_dependents, X.copy(), y, registry_dir=registry_dir)
+        pd.testing.assert_frame_equal(loaded, trained)
+        forecast_dependents(X_other.copy(), y_other, registry_dir=registry_dir)
+        models = list_models(registry_dir)
+        print(models[['name', 'cutoff', 'n_rows', 'data_hash']].to_string(index=False))
+        assert len(models) == 2, "Another region loaded the first region's model"
+        invalidate(cutoff='2023-05-01', registry_dir=registry_dir)
+        retrained, retrain_time = timed(forecast_dependents, X.copy(), y, registry_dir=registry_dir)
+        pd.testing.assert_frame_equal(retrained, trained)
+    print(f"Training rows: {len(X)}, forecast rows: {len(trained)}")
+    print(f"Train and register:      {train_time:6.2f}s")
+    print(f"Load from registry:      {load_time:6.2f}s")
+    print(f"After invalidate:        {retrain_time:6.2f}s")
+
+
+def legacy_forecast_matrix(X, forecast_start, forecast_dates):
+    """
+    The forecast grid merged with every history row of its location, as forecast_dependents
+    built it before forecast_features, kept as the benchmark baseline.
+    """
+    locations = X['location'].unique()
+    forecast_grid = pd.MultiIndex.from_product([locations, forecast_dates], names=['location', 'date']).to_frame(index=False)
+    return forecast_grid.merge(X.drop(columns=['date']), on='location', how='left')
+
+
+def _predict_forecast(build, model_xgb, X, forecast_start, forecast_dates):
+    import xgboost as xgb
+
+    X_forecast = build(X, forecast_start, forecast_dates)
+    model_xgb.predict(xgb.DMatrix(X_forecast.drop(columns=['location', 'date'])))
+
+
+def benchmark_forecast(scale=10, history_days=365, n_features=40):
+    """
+    Building and predicting the forecast matrix of forecast_dependents (4 months from
+    forecast_start) from the latest snapshot per location, against the grid x history merge.
+    """
+    import xgboost as xgb
+    from src.forecast.feature_engineering import forecast_features
+
+    rng = np.random.default_rng(0)
+    forecast_start = pd.Timestamp('2023-05-01')
+    dates = pd.date_range(end=forecast_start - pd.Timedelta(days=1), periods=history_days, freq='D')
+    X = pd.MultiIndex.from_product([range(CURRENT_N_LOCATIONS * scale), dates], names=['location', 'date']).to_frame(index=False)
+    features = rng.normal(size=(len(X), n_features)).astype(np.float32)
+    X = pd.concat([X, pd.DataFrame(features, columns=[f'feature_{i}' for i in range(n_features)])], axis=1)
+    model_xgb = xgb.train(
+        {'tree_method': 'hist', 'max_depth': 6}, xgb.DMatrix(X.drop(columns=['location', 'date']), label=features[:, 0]),
+        num_boost_round=100,
+    )
+    forecast_dates = pd.date_range(forecast_start, forecast_start + pd.DateOffset(months=4) - pd.Timedelta(days=1), freq='D')
+
+    X_forecast = forecast_features(X, forecast_start, forecast_dates)
+    assert len(X_forecast) == X['location'].nunique() * len(forecast_dates)
+    print(f"History rows: {len(X)}, forecast rows: {len(X_forecast)} "
+          f"(legacy: {X['location'].nunique() * len(forecast_dates) * history_days})")
+    for name, build in [('Grid x history merge', legacy_forecast_matrix), ('forecast_features', forecast_features)]:
+        elapsed, memory = peak_memory(_predict_forecast, build, model_xgb, X, forecast_start, forecast_dates)
+        print(f"{name:24s}{elapsed:7.2f}s{memory:9.0f} MB")
+
+
+def _serve(registry_dir, store_dir, window_ms, max_rows, port):
+    import uvicorn
+    from src.forecast.service import create_app
+
+    uvicorn.run(create_app(registry_dir, store_dir, window_ms, max_rows), host='127.0.0.1', port=port, log_level='warning')
+
+
+def _request(connections, port, method, path, body=None):
+    import http.client
+    import json
+
+    connection = getattr(connections, 'connection', None)
+    if connection is None:
+        connection = connections.connection = http.client.HTTPConnection('127.0.0.1', port)
+    try:
+        connection.request(method, path, body=None if body is None else json.dumps(body), headers={'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        payload = json.loads(response.read())
+    except OSError:
+        connection.close()
+        connections.connection = None
+        raise
+    assert response.status == 200, payload
+    return payload
+
+
+def load_test(port, payloads, concurrency=32):
+    """
+    Posts the payloads to /forecast from `concurrency` keep-alive connections and returns the
+    latency of each request in seconds and the total time.
+    """
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    connections = threading.local()
+
+    def send(payload):
+        start = time.perf_counter()
+        _request(connections, port, 'POST', '/forecast', payload)
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        latencies, elapsed = timed(lambda: np.array(list(pool.map(send, payloads))))
+    return latencies, elapsed
+
+
+def benchmark_service(scale=1, n_requests=2000, concurrency=32, days=7, n_features=40):
+    """
+    Latency and throughput of the prediction service under concurrent single-location requests,
+    with every request predicted on its own against micro-batches. The service runs in its own
+    process on a synthetic feature store and a registered booster; the forecasts are checked
+    against Booster.predict on forecast_features.
+    """
+    import socket
+    import threading
+    import xgboost as xgb
+    from src.forecast.feature_engineering import forecast_features
+    from src.forecast.feature_store import read_features, write_features
+    from src.forecast.registry import model_name, params_digest, save_model
+    from src.forecast.service import BATCH_WINDOW_MS, MAX_BATCH_ROWS
+
+    rng = np.random.default_rng(0)
+    cutoff = pd.Timestamp('2023-05-01')
+    n_locations = CURRENT_N_LOCATIONS * scale
+    dates = pd.date_range(end=cutoff - pd.Timedelta(days=1), periods=365, freq='D')
+    X = pd.MultiIndex.from_product([range(n_locations), dates], names=['location', 'date']).to_frame(index=False)
+    X = pd.concat([X, pd.DataFrame(rng.normal(size=(len(X), n_features)).astype(np.float32), columns=[f'feature_{i}' for i in range(n_features)])], axis=1)
+    location_mapping = {f'location_{code}': code for code in range(n_locations)}
+    names = list(location_mapping)
+
+    with tempfile.TemporaryDirectory() as directory:
+        store_dir, registry_dir = os.path.join(directory, 'store'), os.path.join(directory, 'models')
+        write_features(X, store_dir, location_mapping=location_mapping)
+        X = read_features(store_dir)
+        X_train = X.drop(columns=['location', 'date'])
+        params = {'tree_method': 'hist', 'max_depth': 8, 'objective': 'reg:squarederror'}
+        model_xgb = xgb.train(params, xgb.DMatrix(X_train, label=np.abs(X_train.iloc[:, :4].to_numpy()) + 1), num_boost_round=300)
+        save_model(model_xgb, model_name(cutoff, params_digest(params)), registry_dir, cutoff=cutoff, columns=list(X_train.columns))
+
+        X_forecast = forecast_features(X, cutoff, pd.date_range(cutoff, periods=days, freq='D'))
+        expected = model_xgb.predict(xgb.DMatrix(X_forecast.drop(columns=['location', 'date'])))
+        payloads = [{'locations': [names[code]], 'start': str(cutoff.date()), 'days': days} for code in rng.integers(0, n_locations, n_requests)]
+
+        print(f"Requests: {n_requests} of {days} days, concurrency: {concurrency}, locations: {n_locations}")
+        print(f"{'':28s}{'p50':>9s}{'p99':>9s}{'req/s':>9s}{'req/batch':>11s}")
+        context = multiprocessing.get_context('fork')
+        for name, window_ms, max_rows in [('One request per predict', 0, 1), (f'Micro-batches ({BATCH_WINDOW_MS:g} ms)', BATCH_WINDOW_MS, MAX_BATCH_ROWS)]:
+            with socket.socket() as sock:
+                sock.bind(('127.0.0.1', 0))
+                port = sock.getsockname()[1]
+            server = context.Process(target=_serve, args=(registry_dir, store_dir, window_ms, max_rows, port))
+            server.start()
+            try:
+                connections = threading.local()
+                for _ in range(300):
+                    try:
+                        _request(connections, port, 'GET', '/health')
+                        break
+                    except OSError:
+                        time.sleep(0.1)
+                response = _request(connections, port, 'POST', '/forecast', {'locations': names, 'start': str(cutoff.date()), 'days': days})
+                result = np.array([[row[target] for target in ['yield_risk', 'drought_index', 'daytime_heat_stress', 'nighttime_heat_stress']] for row in response['predictions']])
+                np.testing.assert_allclose(result, expected, rtol=1e-6)
+
+                latencies, elapsed = load_test(port, payloads, concurrency)
+                # The first connection idled past the keep-alive timeout during the load test
+                health = _request(threading.local(), port, 'GET', '/health')
+            finally:
+                server.terminate()
+                server.join()
+            p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+            print(f"{name:28s}{p50:7.1f}ms{p99:7.1f}ms{n_requests / elapsed:9.0f}{health['requests'] / health['batches']:11.1f}")
+
+
+def benchmark_tuning(scale=1, n_trials=10, n_folds=6):
+    """
+    A search with fold-level pruning against the same trials all run to the last fold, and a
+    search interrupted halfway and resumed from its SQLite store.
+    """
+    from src.forecast.tuning import load_trials, tune
+
+    rng = np.random.default_rng(0)
+    n_rows = 1500 * scale
+    features = rng.normal(size=(n_rows, 20)).astype(np.float32)
+    labels = (np.abs(features[:, :4]) + 1 + rng.normal(scale=0.1, size=(n_rows, 4))).astype(np.float32)
+    step = n_rows // (n_folds + 2)
+    folds = [(slice(0, step * (k + 2)), slice(step * (k + 2), step * (k + 3))) for k in range(n_folds)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        full, full_time = timed(tune, features, labels, folds, n_trials, 'full', os.path.join(directory, 'full.sqlite'), prune_after=None)
+        pruned, pruned_time = timed(tune, features, labels, folds, n_trials, 'pruned', os.path.join(directory, 'pruned.sqlite'))
+        resumed_path = os.path.join(directory, 'resumed.sqlite')
+        tune(features, labels, folds, n_trials // 2, 'resumed', resumed_path)
+        resumed = tune(features, labels, folds, n_trials, 'resumed', resumed_path)
+        assert resumed['trial'].tolist() == pruned['trial'].tolist()
+        assert resumed['params'].tolist() == pruned['params'].tolist()
+        assert len(load_trials('resumed', resumed_path)) == n_trials
+
+    print(f"Rows: {n_rows}, folds: {n_folds}, trials: {n_trials}")
+    print(f"{'':16s}{'time':>8s}{'folds run':>11s}{'pruned':>8s}{'best MAPE':>11s}")
+    for name, trials, elapsed in [('No pruning', full, full_time), ('Pruning', pruned, pruned_time)]:
+        best = trials.loc[trials['state'] == 'complete', 'value'].min()
+        print(f"{name:16s}{elapsed:7.1f}s{trials['n_folds'].sum():11d}{(trials['state'] == 'pruned').sum():8d}{best:11.4f}")
+
+
+def _backend_cv(backend, features, labels, folds, output_path):
+    from src.forecast.train import BACKENDS
+
+    np.save(output_path, np.concatenate(list(BACKENDS[backend]['cv_predictions'](features, labels, folds))))
+
+
+def benchmark_backends(scale=1, n_folds=4, n_features=40):
+    """
+    The training backends on identical folds: CV time and peak memory (in a forked process),
+    prediction latency of a model fitted on the first training window (one row, and a batch of
+    validation rows), and the MAE and adjusted MAPE of the validation predictions.
+    """
+    from sklearn.metrics import mean_absolute_error
+    from src.forecast.train import BACKENDS, adjusted_mape
+
+    rng = np.random.default_rng(0)
+    n_rows = 4000 * scale
+    features = rng.normal(size=(n_rows, n_features)).astype(np.float32)
+    labels = (np.abs(features[:, :4]) + 1 + rng.normal(scale=0.1, size=(n_rows, 4))).astype(np.float32)
+    step = n_rows // (n_folds + 2)
+    folds = [(slice(0, step * (k + 2)), slice(step * (k + 2), step * (k + 3))) for k in range(n_folds)]
+    val_labels = np.concatenate([labels[val_rows] for _, val_rows in folds])
+    train_rows, val_rows = folds[0]
+
+    print(f"Rows: {n_rows}, features: {n_features}, folds: {n_folds}")
+    print(f"{'':12s}{'CV time':>9s}{'peak':>9s}{'1 row':>9s}{f'{step} rows':>11s}{'MAE':>9s}{'MAPE':>9s}")
+    with tempfile.TemporaryDirectory() as directory:
+        for backend, spec in BACKENDS.items():
+            output_path = os.path.join(directory, f'{backend}.npy')
+            cv_time, memory = peak_memory(_backend_cv, backend, features, labels, folds, output_path)
+            predictions = np.load(output_path)
+
+            model = spec['fit'](features[train_rows], labels[train_rows], spec['params'], 300)
+            one_row = features[val_rows][:1]
+            spec['predict'](model, one_row)
+            row_time = np.median([timed(spec['predict'], model, one_row)[1] for _ in range(50)])
+            _, batch_time = timed(spec['predict'], model, features[val_rows])
+
+            mae = mean_absolute_error(val_labels, predictions)
+            mape = adjusted_mape(val_labels, predictions)
+            print(f"{spec['name']:12s}{cv_time:8.1f}s{memory:6.0f} MB{row_time * 1000:7.2f}ms{batch_time * 1000:9.1f}ms{mae:9.4f}{mape:9.4f}")
+
+
+BENCHMARKS = {
+    'loader': benchmark_loader,
+    'backends': benchmark_backends,
+    'streaming': benchmark_streaming,
+    'incremental': benchmark_incremental,
+    'dependent': benchmark_dependent,
+    'crops': benchmark_crops,
+    'cv': benchmark_cv,
+    'cv_parallel': benchmark_cv_parallel,
+    'ffill': benchmark_ffill,
+    'forecast': benchmark_forecast,
+    'online': benchmark_online,
+    'panel': benchmark_panel,
+    'parallel': benchmark_parallel,
+    'quantile': benchmark_quantile,
+    'registry': benchmark_registry,
+    'rolling': benchmark_rolling,
+    'service': benchmark_service,
+    'spectral': benchmark_spectral,
+    'store': benchmark_store,
+    'tuning': benchmark_tuning,
+    'warm_start': benchmark_warm_start,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the forecast pipeline.")
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('--scale', type=int, default=10, help="Multiple of our current data size.")
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](scale=args.scale)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import hashlib
+import glob
+import os
+
+import pyarrow as pa
+
+# Hits and misses of read_cached_frame since the process started
+CACHE_STATS = {'hits': 0, 'misses': 0}
+
+
+def file_digest(file_path, block_size=2**20):
+    """
+    SHA-256 of a file's contents, read in blocks.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def cache_key(source_paths, version):
+    """
+    Key derived from the contents of the source files and the preprocessing version,
+    so any change to either produces a new key.
+    """
+    digest = hashlib.sha256(str(version).encode())
+    for path in source_paths:
+        digest.update(file_digest(path).encode())
+    return digest.hexdigest()[:32]
+
+def cache_file_path(cache_dir, name, source_paths, version):
+    return os.path.join(cache_dir, f'{name}-{cache_key(source_paths, version)}.arrow')
+
+def read_cached_frame(cache_path, columns=None, verbose=True):
+    """
+    Returns the cached frame memory-mapped from an Arrow IPC file, or None on a miss.
+    Numeric columns are not copied until they are modified; `columns` reads only those columns.
+    """
+    if not os.path.exists(cache_path):
+        CACHE_STATS['misses'] += 1
+        if verbose:
+            print(f"Cache miss: {cache_path}")
+        return None
+    CACHE_STATS['hits'] += 1
+    if verbose:
+        print(f"Cache hit: {cache_path}")
+    with pa.memory_map(cache_path, 'r') as source:
+        table = pa.ipc.open_file(source).read_all()
+    if columns is not None:
+        table = table.select(columns)
+    return table.to_pandas(split_blocks=True)
+
+def write_cached_frame(df, cache_path):
+    """
+    Writes df as an uncompressed Arrow IPC file and removes older entries for the same name.
+    """
+    cache_dir = os.path.dirname(cache_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    tmp_path = f'{cache_path}.tmp'
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, cache_path)
+
+    name = os.path.basename(cache_path).rsplit('-', 1)[0]
+    for stale_path in glob.glob(os.path.join(cache_dir, f'{name}-*.arrow')):
+        if stale_path != cache_path:
+            os.remove(stale_path)
+
+def cache_stats():
+    return dict(CACHE_STATS)
+
+def clear_cache(cache_dir):
+    for path in glob.glob(os.path.join(cache_dir, '*.arrow')):
+        os.remove(path)
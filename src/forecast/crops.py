@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+
+# Days of the growing season (May to August) that compute_dependent aggregates
+GROWING_SEASON_DAYS = 31 + 30 + 31 + 31
+
+# Crop parameters, one row per crop. 'default' holds the example values compute_dependent has
+# always used. The other crops follow the model card (resources/Model card/weather-based
+# algorithms.pdf): cardinal temperatures as given, and the midpoint of each optimal range
+# (GDD, precipitation in mm, soil pH, nitrogen) as the optimum. The model card gives nitrogen
+# in g/kg of soil, like the Meteoblue Total Nitrogen Content; compute_dependent compares the
+# optimum with that content summed over the growing season days, so it is scaled the same way.
+CROP_PARAMETERS = pd.DataFrame(
+    [
+        # crop, TMaxOptimum, TMaxLimit, TMinOptimum, TMinLimit, Tbase, GDD_OPTIMAL, PRECIP_OPTIMAL, PH_OPTIMAL,
+        # N_OPTIMAL (g/kg summed over the GROWING_SEASON_DAYS)
+        ('default', 25, 35, 15, 25, 10, 1000, 500, 6.5, 100),
+        ('soybean', 32, 45, 22, 28, 10, 2700, 575, 6.4, 0.013 * GROWING_SEASON_DAYS),
+        ('corn', 33, 44, 22, 28, 10, 2900, 650, 6.4, 0.1155 * GROWING_SEASON_DAYS),
+        ('cotton', 32, 38, 20, 25, 10, 2400, 1000, 6.25, 0.0715 * GROWING_SEASON_DAYS),
+        ('rice', 32, 38, 22, 28, 10, 2250, 1250, 6.0, 0.077 * GROWING_SEASON_DAYS),
+        ('wheat', 25, 32, 15, 20, 10, 2250, 1250, 6.0, 0.077 * GROWING_SEASON_DAYS),
+    ],
+    columns=['crop', 'TMaxOptimum', 'TMaxLimit', 'TMinOptimum', 'TMinLimit', 'Tbase', 'GDD_OPTIMAL', 'PRECIP_OPTIMAL', 'PH_OPTIMAL', 'N_OPTIMAL'],
+).set_index('crop')
+# Yield risk weights for GDD, precipitation, pH and nitrogen (model card example)
+YIELD_RISK_WEIGHTS = (0.3, 0.3, 0.2, 0.2)
+
+
+def heat_stress(temperature, optimum, limit):
+    """
+    Heat stress from 0 (temperature at or below the optimum) to 9 (at or above the limit),
+    linear in between. Broadcasts, so temperatures of shape (n_rows, 1) against parameters of
+    shape (n_crops,) give every crop at once. Missing temperatures score 9.
+    """
+    with np.errstate(invalid='ignore'):
+        stress = np.clip(9 * ((temperature - optimum) / (limit - optimum)), 0, 9)
+    return np.where(np.isnan(stress), 9, stress)
+
+def growing_degree_days(TMax, TMin, Tbase):
+    return (TMax + TMin) / 2 - Tbase
+
+def drought_balance(cum_precip, cum_evap, soil_moisture, T_average):
+    """
+    Drought index of the model card: positive means no risk, negative high risk.
+    """
+    return (cum_precip - cum_evap) + soil_moisture / T_average
+
+def yield_risk(GDD, P, pH, N, GDD_OPTIMAL, PRECIP_OPTIMAL, PH_OPTIMAL, N_OPTIMAL, w1, w2, w3, w4):
+    GDD_risk = (GDD - GDD_OPTIMAL) * 2 * w1
+    P_risk = (P - PRECIP_OPTIMAL) * 2 * w2
+    pH_risk = (pH - PH_OPTIMAL) * 2 * w3
+    N_risk = (N - N_OPTIMAL) * 2 * w4
+    return GDD_risk + P_risk + pH_risk + N_risk
+
+def crop_parameters(crops=None) -> pd.DataFrame:
+    """
+    Rows of CROP_PARAMETERS for the given crop names, or a parameter table passed as is.
+    """
+    if crops is None:
+        return CROP_PARAMETERS
+    if isinstance(crops, pd.DataFrame):
+        return crops
+    return CROP_PARAMETERS.loc[list(crops)]
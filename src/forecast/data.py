@@ -5,15 +5,24 @@ from sklearn.metrics import mean_absolute_error
 import lightgbm as lgb
 import xgboost as xgb
 from numpy import fft
+import pyarrow as pa
+import pyarrow.parquet as pq
 
 from dotenv import load_dotenv
 import os
 
+from src.forecast.cache import cache_file_path, read_cached_frame, write_cached_frame
+
 load_dotenv()
 
 METER_BLUE_DATA_PATH = os.getenv('METER_BLUE_DATA_PATH')
 METER_BLUE_STATIC_PATH = os.getenv('METER_BLUE_STATIC_PATH')
 IN_GOV_DATA_PATH = os.getenv('IN_GOV_DATA_PATH')
+# Opt-in cache of the load_data output, keyed by the source file contents
+METER_BLUE_CACHE_DIR = os.getenv('METER_BLUE_CACHE_DIR')
+
+# Bump whenever a change to the preprocessing alters the output of load_data
+PREPROCESSING_VERSION = 2
 
 def load_csv_data(file_path):
     df = pd.read_csv(file_path)
@@ -23,49 +32,131 @@ def load_xlsx_data(file_path, sheet_name='Statewise 2009-10 & 2010-11'):
     df = pd.read_excel(file_path, sheet_name=sheet_name)
     return df
 
-def preprocess_meter_blue_data(df):    
-    # Concatenate 'variable' with 'aggregation' when 'aggregation' is 'max', 'min', or 'sum'
-    df['variable'] = df.apply(
-        lambda row: f"{row['variable']}_{row['aggregation']}" if row['aggregation'] in ['max', 'min', 'sum'] else row['variable'],
-        axis=1
-    )
-    
-    # Drop unnecessary columns
-    df.drop(columns=['unit', 'level', 'timeResolution', 'aggregation'], inplace=True)
-    
-    # Melt the DataFrame
-    df = df.melt(
-        id_vars=['location', 'lat', 'lon', 'asl', 'variable'],  
-        var_name='date',    
-        value_name='value'   
-    )
-    
-    # Convert 'date' to datetime
-    df['date'] = pd.to_datetime(df['date'], format='%Y%m%dT%H%M', errors='coerce')
-    df['variable'] = df['variable'].apply(lambda x: '_'.join(x.split(' ')[1:]).replace(' ', '_'))
+# Column schema of the wide Meteoblue exports; every other column is a date column
+METER_BLUE_SCHEMA = {
+    'location': 'category',
+    'lat': 'float64',
+    'lon': 'float64',
+    'asl': 'float64',
+    'variable': 'category',
+    'unit': 'category',
+    'level': 'category',
+    'timeResolution': 'category',
+    'aggregation': 'category',
+}
+METER_BLUE_VALUE_DTYPE = 'float32'
+METER_BLUE_DATE_FORMAT = '%Y%m%dT%H%M'
+AGGREGATION_SUFFIXES = ['max', 'min', 'sum']
+
+# Long-format schema written by the streaming ingestion
+METER_BLUE_LONG_SCHEMA = pa.schema([
+    ('location', pa.dictionary(pa.int32(), pa.string())),
+    ('lat', pa.float64()),
+    ('lon', pa.float64()),
+    ('asl', pa.float64()),
+    ('variable', pa.dictionary(pa.int32(), pa.string())),
+    ('date', pa.timestamp('ns')),
+    ('value', pa.float32()),
+])
+# Approximate bytes held per melted value while a chunk is parsed, melted and converted to Arrow
+STREAMING_BYTES_PER_VALUE = 128
+DEFAULT_STREAMING_MEMORY_MB = 256
+
+
+def meter_blue_dtypes(columns):
+    return {col: METER_BLUE_SCHEMA.get(col, METER_BLUE_VALUE_DTYPE) for col in columns}
+
+def load_meter_blue_csv(file_path):
+    """
+    Reads a wide Meteoblue export with explicit dtypes and returns it in long format.
+    """
+    header = pd.read_csv(file_path, nrows=0).columns
+    df = pd.read_csv(file_path, dtype=meter_blue_dtypes(header))
+    return preprocess_meter_blue_data(df)
+
+def stream_meter_blue_csv(file_path, output_path, max_memory_mb=DEFAULT_STREAMING_MEMORY_MB):
+    """
+    Melts a wide Meteoblue export chunk by chunk and appends each chunk to a Parquet file.
+
+    The number of rows per chunk is derived from the number of date columns, so peak memory
+    stays around `max_memory_mb` however wide the export is. Rows are written in chunk order;
+    the content is the same as load_meter_blue_csv. Returns the number of long-format rows.
+    """
+    header = pd.read_csv(file_path, nrows=0).columns
+    n_dates = sum(col not in METER_BLUE_SCHEMA for col in header)
+    rows_per_chunk = max(1, int(max_memory_mb * 2**20) // (max(n_dates, 1) * STREAMING_BYTES_PER_VALUE))
+
+    n_rows = 0
+    with pq.ParquetWriter(output_path, METER_BLUE_LONG_SCHEMA) as writer:
+        for chunk in pd.read_csv(file_path, dtype=meter_blue_dtypes(header), chunksize=rows_per_chunk):
+            long_chunk = preprocess_meter_blue_data(chunk)
+            writer.write_table(pa.Table.from_pandas(long_chunk, schema=METER_BLUE_LONG_SCHEMA, preserve_index=False))
+            n_rows += len(long_chunk)
+            del chunk, long_chunk
+    return n_rows
+
+def read_meter_blue_parquet(file_path):
+    """
+    Reads a long-format file written by stream_meter_blue_csv with categorical location/variable.
+    """
+    df = pq.read_table(file_path).to_pandas()
+    # Chunks carry their own dictionaries; sort the merged categories as read_csv would
+    for col in ['location', 'variable']:
+        categories = sorted(df[col].cat.remove_unused_categories().cat.categories)
+        df[col] = df[col].cat.set_categories(categories)
     return df
 
-def preprocess_meter_blue_data_static(df):    
+def normalize_variable_names(variable, aggregation):
+    """
+    Appends the aggregation suffix ('max', 'min', 'sum') to each variable and drops the
+    leading domain token, e.g. 'NEMSAUTO Temperature' + 'max' -> 'Temperature_max'.
+    The names are built once per distinct (variable, aggregation) pair and mapped back to the
+    rows by their category codes.
+    """
+    variable, aggregation = variable.astype('category'), aggregation.astype('category')
+    width = len(aggregation.cat.categories) + 1
+    pair_codes = variable.cat.codes.to_numpy(dtype=np.int64) * width + aggregation.cat.codes.to_numpy(dtype=np.int64) + 1
+    pairs, uniques = pd.factorize(pair_codes)
+
+    # Missing values have code -1, which from_codes turns back into NaN
+    names = pd.Series(pd.Categorical.from_codes(uniques // width, variable.cat.categories)).astype(str)
+    suffixes = pd.Series(pd.Categorical.from_codes(uniques % width - 1, aggregation.cat.categories)).astype(object)
+    has_suffix = suffixes.isin(AGGREGATION_SUFFIXES)
+    names = names.where(~has_suffix, names + '_' + suffixes.where(has_suffix, ''))
+    names = names.str.split(' ', n=1).str[1].fillna('').str.replace(' ', '_', regex=False)
+
+    categories = pd.Index(sorted(set(names)))
+    codes = categories.get_indexer(names)[pairs]
+    return pd.Series(pd.Categorical.from_codes(codes, categories), index=variable.index, name=variable.name)
+
+def preprocess_meter_blue_data(df):
     # Concatenate 'variable' with 'aggregation' when 'aggregation' is 'max', 'min', or 'sum'
-    df['variable'] = df.apply(
-        lambda row: f"{row['variable']}_{row['aggregation']}" if row['aggregation'] in ['max', 'min', 'sum'] else row['variable'],
-        axis=1
-    )
-    
-    # Drop unnecessary columns
-    df.drop(columns=['unit', 'level', 'timeResolution', 'aggregation'], inplace=True)
-    
-    # Melt the DataFrame
-    df = df.melt(
-        id_vars=['location', 'lat', 'lon', 'asl', 'variable'],  
-        var_name='date',    
-        value_name='value'   
-    )
-    
-    # Convert 'date' to datetime
-    df['date'] = pd.to_datetime(df['date'], format='%Y%m%dT%H%M', errors='coerce')
-    df['variable'] = df['variable'].apply(lambda x: '_'.join(x.split(' ')[1:]).replace(' ', '_'))
-    return df
+    df = df.copy()
+    df['variable'] = normalize_variable_names(df['variable'], df['aggregation'])
+    df['location'] = df['location'].astype('category')
+
+    id_vars = ['location', 'lat', 'lon', 'asl', 'variable']
+    date_columns = [col for col in df.columns if col not in METER_BLUE_SCHEMA]
+
+    # Melt the DataFrame column-major, the same row order as DataFrame.melt
+    n_rows, n_dates = len(df), len(date_columns)
+    values = df[date_columns].to_numpy(dtype=METER_BLUE_VALUE_DTYPE)
+    dates = pd.to_datetime(pd.Index(date_columns), format=METER_BLUE_DATE_FORMAT, errors='coerce')
+
+    long_df = {}
+    for col in id_vars:
+        column = df[col]
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            codes = np.tile(column.cat.codes.to_numpy(), n_dates)
+            long_df[col] = pd.Categorical.from_codes(codes, dtype=column.dtype)
+        else:
+            long_df[col] = np.tile(column.to_numpy(), n_dates)
+    long_df['date'] = np.repeat(dates.to_numpy(), n_rows)
+    long_df['value'] = values.ravel(order='F')
+    return pd.DataFrame(long_df)
+
+def preprocess_meter_blue_data_static(df):
+    return preprocess_meter_blue_data(df)
 
 def preprocess_gov_in_data(df):
     
@@ -75,43 +166,49 @@ def preprocess_gov_in_data(df):
 
     return df
     
-def load_data(file):
+def load_data(file, streaming_path=None, max_memory_mb=DEFAULT_STREAMING_MEMORY_MB, cache_dir=METER_BLUE_CACHE_DIR):
+    """
+    Loads a dataset in long format. 'METER_BLUE_DATA' is the dynamic Meteoblue export and
+    'METER_BLUE_STATIC' the per-location table of static soil variables.
+
+    With `streaming_path`, the dynamic export is first ingested chunk by chunk into that Parquet
+    file, which bounds the memory used by the melt. With `cache_dir`, the output is cached there
+    and reused until the source file or PREPROCESSING_VERSION change.
+    """
+    source_paths = {'METER_BLUE_DATA': METER_BLUE_DATA_PATH, 'METER_BLUE_STATIC': METER_BLUE_STATIC_PATH}
+    if cache_dir is not None and file in source_paths:
+        cache_path = cache_file_path(cache_dir, file, [source_paths[file]], PREPROCESSING_VERSION)
+        df = read_cached_frame(cache_path)
+        if df is not None:
+            return df
+
     if file == 'METER_BLUE_DATA':
-        df_dynamic = load_csv_data(METER_BLUE_DATA_PATH)
-        df_dynamic = preprocess_meter_blue_data(df_dynamic)
-        
-        df_static = load_csv_data(METER_BLUE_STATIC_PATH)
-        df_static = preprocess_meter_blue_data_static(df_static)
-        
-        # Apply forward fill to the 'value' column after sorting by 'date' within each group
-        df_static['value'] = df_static.groupby(['location', 'variable'], group_keys=False).apply(
-            lambda group: group.sort_values('date')['value'].ffill()
-        )
-        df_static = df_static.dropna(subset=['value'])
-        
-        # Create a date range that covers all dates in the dynamic DataFrame
-        date_range = pd.date_range(start=df_dynamic['date'].min(), end=df_dynamic['date'].max(), freq='D')
-        
-        # Create a DataFrame with all combinations of location, variable, and date
-        unique_combinations = df_static[['location', 'variable']].drop_duplicates()
-        expanded_dates = pd.DataFrame(date_range, columns=['date'])
-        df_static_expanded = unique_combinations.merge(expanded_dates, how='cross')
-        
-        # Merge the expanded date DataFrame with the static data
-        df_static_expanded = df_static_expanded.merge(df_static, on=['location', 'variable'], how='left')
-        
-        df_static_expanded = df_static_expanded[['location', 'variable', 'date_x', 'lat', 'lon', 'asl', 'value']]
-        df_static_expanded.rename(columns={'date_x': 'date'}, inplace=True)
-        
-        # Map the asl values from df_dynamic to df_static_expanded based on location
-        df_static_expanded = df_static_expanded.drop(columns=['asl'])
-        print(df_dynamic[['location', 'asl']])
-        df_static_expanded = df_static_expanded.merge(df_dynamic[['location', 'asl']].drop_duplicates(), on='location', how='left')
-        
-        # Concatenate the dynamic and expanded static DataFrames
-        df = pd.concat([df_dynamic, df_static_expanded], ignore_index=True)
+        if streaming_path is not None:
+            stream_meter_blue_csv(METER_BLUE_DATA_PATH, streaming_path, max_memory_mb=max_memory_mb)
+            df = read_meter_blue_parquet(streaming_path)
+        else:
+            df = load_meter_blue_csv(METER_BLUE_DATA_PATH)
+    elif file == 'METER_BLUE_STATIC':
+        df = load_meter_blue_static(METER_BLUE_STATIC_PATH)
+
+    if cache_dir is not None and file in source_paths:
+        write_cached_frame(df, cache_path)
     return df
 
+def load_meter_blue_static(file_path):
+    """
+    Loads the static soil variables as a small table of (location, variable, date, value)
+    observations, forward filled over the observation dates. It has no daily rows; the values
+    are broadcast per location by compute_dependent when the wide matrix is built.
+    """
+    df_static = load_meter_blue_csv(file_path)
+
+    # Apply forward fill to the 'value' column after sorting by 'date' within each group
+    df_static = df_static.sort_values(['location', 'variable', 'date'])
+    df_static['value'] = df_static.groupby(['location', 'variable'], observed=True)['value'].ffill()
+    df_static = df_static.dropna(subset=['value'])
+    return df_static[['location', 'variable', 'date', 'value']].reset_index(drop=True)
+
 
 
 # if __name__ == "__main__":
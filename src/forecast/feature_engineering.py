@@ -3,9 +3,19 @@ import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 import os
-from tqdm import tqdm
 from sklearn.preprocessing import OrdinalEncoder
 
+from src.forecast.crops import (
+    CROP_PARAMETERS, YIELD_RISK_WEIGHTS, crop_parameters, drought_balance, growing_degree_days, heat_stress, yield_risk,
+)
+from src.forecast.feature_graph import Feature, compute_features, feature
+
+DEPENDENT_VARIABLE = ['yield_risk', 'drought_index', 'daytime_heat_stress', 'nighttime_heat_stress']
+# Forecast horizon in days; the lag features are shifted by it
+LAG_HORIZON = 30*4
+# Rows of history a lag or rolling feature looks back on: lag24 is taken on the horizon lag
+LAG_HISTORY = LAG_HORIZON + 24
+
 def time_features(df: pd.DataFrame):
     df['hour'] = df['date'].dt.hour
     df['day_of_week'] = df['date'].dt.dayofweek  # Monday=0, Sunday=6
@@ -21,115 +31,227 @@ def cyclical_features(df: pd.DataFrame):
     df['dow_cos'] = np.cos(2 * np.pi * df['day_of_week'] / 7)
     return df
         
-def interaction_features(df: pd.DataFrame):
-    # Create interaction features for all columns starting with 'lag_' or 'rolling_'
+def interaction_features(df: pd.DataFrame, features: dict = None):
+    # Create interaction features for all columns starting with 'lag_' or 'rolling_'.
+    # `features` maps those columns to their feature graph nodes, so columns holding the same
+    # values (e.g. lag_7d and lag_14d) share one interaction node.
+    features = features or {}
+    interactions = {}
     for col in df.columns:
         if col.startswith('lag_') or col.startswith('rolling_'):
             interaction_col_name = f'{col}_dow_sin'
-            df[interaction_col_name] = df[col] * df['dow_sin']
-    return df
-    
-def lags_features(df: pd.DataFrame, dependent_vars: list, horizon: int):
-    df.sort_values(['date'], inplace=True)
+            interactions[interaction_col_name] = feature('mul', features.get(col, col), 'dow_sin')
+    return compute_features(df, interactions, known=features)
     
+def lag_feature_specs(dependent_vars: list, horizon: int) -> dict:
+    """
+    Feature graph nodes of the lags_features columns. Several columns are the same node: lag_7d
+    and lag_14d are both the horizon lag, and the 7d and 28d rolling statistics both use a
+    window of `horizon` rows.
+    """
+    features = {}
     for var in dependent_vars:
         # Primary lag features (using horizon-day window)
-        df[f'lag_{var}'] = df.groupby('location')[var].shift(horizon)
-        df[f'lag_{var}'] = np.log(df[f'lag_{var}'] + 1)
-        df[f'lag1_{var}'] = df.groupby('location')[f'lag_{var}'].shift(1)
-        df[f'lag24_{var}'] = df.groupby('location')[f'lag_{var}'].shift(24)
+        lag = feature('shift', var, group='location', periods=horizon)
+        log_lag = feature('log1p', lag)
+        features[f'lag_{var}'] = log_lag
+        features[f'lag1_{var}'] = feature('shift', log_lag, group='location', periods=1)
+        features[f'lag24_{var}'] = feature('shift', log_lag, group='location', periods=24)
         
         # Additional lag features at different windows:
-        df[f'lag_7d_{var}'] = df.groupby('location')[var].shift(horizon)
-        df[f'lag_14d_{var}'] = df.groupby('location')[var].shift(horizon)
+        features[f'lag_7d_{var}'] = lag
+        features[f'lag_14d_{var}'] = lag
         
         # Rolling statistics to smooth out noise:
+        mean = feature('rolling', var, group='location', stat='mean', window=horizon)
+        std = feature('rolling', var, group='location', stat='std', window=horizon)
         # 7-day rolling statistics
-        df[f'rolling_mean_7d_{var}'] = df.groupby('location')[var]\
-            .transform(lambda x: x.rolling(window=horizon, min_periods=1).mean())
-        df[f'rolling_std_7d_{var}'] = df.groupby('location')[var]\
-            .transform(lambda x: x.rolling(window=horizon, min_periods=1).std())
-        df[f'rolling_q75_7d_{var}'] = df.groupby('location')[var]\
-            .transform(lambda x: x.rolling(window=horizon, min_periods=1).quantile(0.75))
+        features[f'rolling_mean_7d_{var}'] = mean
+        features[f'rolling_std_7d_{var}'] = std
+        features[f'rolling_q75_7d_{var}'] = feature('rolling', var, group='location', stat='quantile', window=horizon, q=0.75)
         
         # horizon-day rolling statistics
-        df[f'rolling_mean_28d_{var}'] = df.groupby('location')[var]\
-            .transform(lambda x: x.rolling(window=horizon, min_periods=1).mean())
-        df[f'rolling_std_28d_{var}'] = df.groupby('location')[var]\
-            .transform(lambda x: x.rolling(window=horizon, min_periods=1).std())
-    return df
+        features[f'rolling_mean_28d_{var}'] = mean
+        features[f'rolling_std_28d_{var}'] = std
+    return features
 
-def encode_location(df: pd.DataFrame) -> pd.DataFrame:
-    # Sort unique locations
-    unique_locations = sorted(df['location'].unique())
-    
-    # Create a mapping from location to integer
-    location_mapping = {location: idx for idx, location in enumerate(unique_locations)}
+def lag_sources(features: dict) -> dict:
+    """
+    The columns of `features` that are only shifts (and log1p) of one source column, as
+    {column: (source, periods, log1p)}: their value on a date is known `periods` days before it.
+    """
+    lags = {}
+    for name, node in features.items():
+        periods, log = 0, False
+        while isinstance(node, Feature):
+            if node.op == 'shift':
+                periods += dict(node.params)['periods']
+            elif node.op == 'log1p':
+                log = True
+            else:
+                break
+            node = node.sources[0]
+        else:
+            if periods > 0:
+                lags[name] = (node, periods, log)
+    return lags
+
+def lags_features(df: pd.DataFrame, dependent_vars: list, horizon: int):
+    df.sort_values(['date'], inplace=True)
+    return compute_features(df, lag_feature_specs(dependent_vars, horizon))
+
+def encode_location(df: pd.DataFrame, location_mapping: dict = None) -> pd.DataFrame:
+    if location_mapping is None:
+        # Sort unique locations
+        unique_locations = sorted(df['location'].unique())
+        
+        # Create a mapping from location to integer
+        location_mapping = {location: idx for idx, location in enumerate(unique_locations)}
     
     # Map the location column to integers
-    df['location'] = df['location'].map(location_mapping)
+    df['location'] = df['location'].map(location_mapping).astype('int64')
     
     return df
 
 
-def feature_engineering(data: pd.DataFrame, dependent_variable: list, independent_variables: list):
+def ffill_within_groups(df: pd.DataFrame, keys: list) -> pd.DataFrame:
+    """
+    Same result as df.groupby(keys).apply(lambda group: group.ffill()).reset_index(drop=True):
+    rows sorted by keys, values forward filled within each group. Uses a stable sort and
+    groupby().ffill() instead of a Python call per group, and skips the fill when every
+    group is a single row.
+    """
+    df = df.sort_values(keys, kind='stable').reset_index(drop=True)
+    if not df.duplicated(keys).any():
+        return df
+    columns = df.columns.difference(keys, sort=False)
+    df[columns] = df.groupby(keys, sort=False)[columns].ffill()
+    return df
+
+def feature_engineering(data: pd.DataFrame, dependent_variable: list, independent_variables: list, location_mapping: dict = None):
     # Manually apply ordinal encoding to the `drought_index` column
     drought_index_mapping = {'High risk': 1, 'No risk': 0}
     
     data['drought_index'] = data['drought_index'].map(drought_index_mapping)
 
-    data = encode_location(data)
+    data = encode_location(data, location_mapping)
 
     # Create a stationary version of Energia via differencing
     # data['Energia_stationary'] = data['Energia'].diff()
     
-    data = lags_features(data, dependent_variable, 30*4)
+    data = lags_features(data, dependent_variable, LAG_HORIZON)
     data = time_features(data)
     data = cyclical_features(data)
-    data = interaction_features(data)
+    data = interaction_features(data, lag_feature_specs(dependent_variable, LAG_HORIZON))
     data = data.sort_values(['date', 'location'])
     
-    data = data.groupby(['location', 'date']).apply(lambda group: group.ffill()).reset_index(drop=True)
+    data = ffill_within_groups(data, ['location', 'date'])
     data.dropna(inplace=True)
     return data
 
 
+def latest_snapshot(X: pd.DataFrame, forecast_start) -> pd.DataFrame:
+    """
+    The latest complete feature row of each location before forecast_start, sorted by location.
+    """
+    history = X[X['date'] < pd.Timestamp(forecast_start)].dropna()
+    return history.sort_values(['location', 'date'], kind='stable').groupby('location', sort=True).tail(1).reset_index(drop=True)
+
+def lag_history(X: pd.DataFrame, columns=DEPENDENT_VARIABLE) -> pd.DataFrame:
+    """
+    The source columns of the lag features (the dependent variables) of X, indexed by
+    (location, date), for snapshot_rows.
+    """
+    history = X[['location', 'date'] + [col for col in columns if col in X.columns]]
+    return history.drop_duplicates(['location', 'date'], keep='last').set_index(['location', 'date']).sort_index()
+
+def snapshot_rows(snapshot: pd.DataFrame, locations, dates, history: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    One feature row per (location, date) pair: the snapshot row of the location, with the
+    calendar features (time_features, cyclical_features, their dow_sin interactions and the
+    store's year) recomputed for the date. With a lag_history, the lag features are taken from
+    it as the feature pipeline computed them: lag_yield_risk on a date is yield_risk LAG_HORIZON
+    days before, known for the whole horizon after the snapshot. Lags whose source date is not
+    in the history, and the rolling statistics (which include the date itself), keep the
+    snapshot's values.
+    """
+    positions = pd.Index(snapshot['location']).get_indexer(locations)
+    if (positions < 0).any():
+        raise KeyError(f"Locations without a snapshot: {sorted(set(np.asarray(locations)[positions < 0]))}")
+    rows = snapshot.iloc[positions].reset_index(drop=True)
+    rows['date'] = pd.DatetimeIndex(dates).to_numpy()
+    # time_features sorts its frame; the index still lines calendar up with rows
+    calendar = cyclical_features(time_features(rows[['location', 'date']].copy())).sort_index()
+    calendar['year'] = calendar['date'].dt.year
+    for col in calendar.columns.drop(['location', 'date']):
+        if col in rows.columns:
+            rows[col] = calendar[col].astype(rows[col].dtype)
+    if history is not None:
+        sources = {}
+        for col, (source, periods, log) in lag_sources(lag_feature_specs(DEPENDENT_VARIABLE, LAG_HORIZON)).items():
+            if col not in rows.columns or source not in history.columns:
+                continue
+            if periods not in sources:
+                lagged = pd.MultiIndex.from_arrays([rows['location'], rows['date'] - pd.Timedelta(days=periods)])
+                sources[periods] = history.index.get_indexer(lagged)
+            found = sources[periods] >= 0
+            values = history[source].to_numpy(dtype=np.float64)[sources[periods][found]]
+            values = np.log(values + 1) if log else values
+            lag = rows[col].to_numpy(dtype=np.float64, copy=True)
+            lag[found] = values
+            rows[col] = lag.astype(rows[col].dtype)
+    if 'dow_sin' in rows.columns:
+        for col in rows.columns:
+            if col.startswith(('lag_', 'rolling_')) and f'{col}_dow_sin' in rows.columns:
+                rows[f'{col}_dow_sin'] = (rows[col] * rows['dow_sin']).astype(rows[f'{col}_dow_sin'].dtype)
+    return rows
+
+def forecast_features(X: pd.DataFrame, forecast_start, forecast_dates, history: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    Feature rows to forecast every location on every forecast date, from the latest_snapshot
+    of each location before forecast_start and the lag features of each date taken from the
+    dependent variables before forecast_start (`history` with location, date and those columns,
+    X's own by default; see snapshot_rows). Returns exactly locations x dates rows, sorted by
+    location and date, with X's columns; locations without history before forecast_start are
+    left out.
+    """
+    forecast_start = pd.Timestamp(forecast_start)
+    forecast_dates = pd.DatetimeIndex(forecast_dates)
+    snapshot = latest_snapshot(X, forecast_start)
+    history = X if history is None else history
+    history = lag_history(history[history['date'] < forecast_start])
+    locations = np.repeat(snapshot['location'].to_numpy(), len(forecast_dates))
+    return snapshot_rows(snapshot, locations, np.tile(forecast_dates.to_numpy(), len(snapshot)), history)
+
 def calculate_daytime_heat_stress(TMax_series, TMaxOptimum, TMaxLimit):
     """
     Calculate daytime heat stress based on maximum daily temperature.
     Returns a stress score from 0 (no stress) to 9 (severe stress).
     """
-    stress = pd.Series(0, index=TMax_series.index)
-    mask_optimal = TMax_series <= TMaxOptimum
-    mask_limit = (TMax_series > TMaxOptimum) & (TMax_series < TMaxLimit)
-    stress[mask_limit] = 9 * ((TMax_series[mask_limit] - TMaxOptimum) / (TMaxLimit - TMaxOptimum))
-    stress[~mask_optimal & ~mask_limit] = 9
-    return stress
+    return pd.Series(heat_stress(TMax_series.to_numpy(dtype=np.float64), TMaxOptimum, TMaxLimit), index=TMax_series.index)
 
 def calculate_nighttime_heat_stress(TMin_series, TMinOptimum, TMinLimit):
     """
     Calculate nighttime heat stress based on minimum daily temperature.
     Returns a stress score from 0 (no stress) to 9 (severe stress).
     """
-    stress = pd.Series(0, index=TMin_series.index)
-    mask_optimal = TMin_series <= TMinOptimum
-    mask_limit = (TMin_series > TMinOptimum) & (TMin_series < TMinLimit)
-    stress[mask_limit] = 9 * ((TMin_series[mask_limit] - TMinOptimum) / (TMinLimit - TMinOptimum))
-    stress[~mask_optimal & ~mask_limit] = 9
-    return stress
+    return pd.Series(heat_stress(TMin_series.to_numpy(dtype=np.float64), TMinOptimum, TMinLimit), index=TMin_series.index)
 
 def calculate_drought_index(cum_precip, cum_evap, soil_moisture, T_average):
     """
     Calculate drought risk index based on cumulative precipitation, evaporation, soil moisture, and temperature.
     Returns qualitative drought risk levels: 'No risk', 'Medium risk', or 'High risk'.
+    Works element-wise on arrays and Series.
     """
-    drought_index = (cum_precip - cum_evap) + soil_moisture / T_average  # Compute drought balance
-    if drought_index > 0:
-        return 'No risk'  # Sufficient moisture
-    elif drought_index < 0:
-        return 'High risk'  # Significant moisture deficit
-    else:
-        return 'Medium risk'  # Moderate risk level
+    drought_index = drought_balance(cum_precip, cum_evap, soil_moisture, T_average)  # Compute drought balance
+    risk = np.select(
+        [drought_index > 0, drought_index < 0],
+        ['No risk', 'High risk'],  # Sufficient moisture, significant moisture deficit
+        default='Medium risk',  # Moderate risk level
+    ).astype(object)
+    if isinstance(drought_index, pd.Series):
+        return pd.Series(risk, index=drought_index.index)
+    return risk if risk.ndim else risk[()]
 
      
 def calculate_yield_risk(GDD, P, pH, N, GDD_OPTIMAL, PRECIP_OPTIMAL, 
@@ -149,110 +271,176 @@ def calculate_yield_risk(GDD, P, pH, N, GDD_OPTIMAL, PRECIP_OPTIMAL,
     Returns:
     - Yield Risk Score (lower is better)
     """
+    return yield_risk(GDD, P, pH, N, GDD_OPTIMAL, PRECIP_OPTIMAL, PH_OPTIMAL, N_OPTIMAL, w1, w2, w3, w4)
 
-    # Squared deviation from optimal values
-    GDD_risk = (GDD - GDD_OPTIMAL)* 2 * w1
-    P_risk = (P - PRECIP_OPTIMAL)* 2 * w2
-    pH_risk = (pH - PH_OPTIMAL)* 2 * w3
-    N_risk = (N - N_OPTIMAL) * 2 * w4
-
-    # Total Yield Risk Score
-    YR = GDD_risk + P_risk + pH_risk + N_risk
-
-    return YR
 
+def static_features(df_static: pd.DataFrame) -> pd.DataFrame:
+    """
+    One row per location with the mean of each static variable, ready to be joined on 'location'.
+    """
+    static_wide = df_static.pivot_table(index='location', columns='variable', values='value', aggfunc='mean', observed=True)
+    static_wide.columns = list(static_wide.columns)
+    return static_wide.reset_index()
 
-def compute_dependent(df: pd.DataFrame):
-    # Define optimal and limit values for stress calculations
-    TMaxOptimum = 25  # Example value, adjust as needed
-    TMaxLimit = 35    # Example value, adjust as needed
-    TMinOptimum = 15  # Example value, adjust as needed
-    TMinLimit = 25    # Example value, adjust as needed
-    Tbase = 10
-    GDD_OPTIMAL = 1000  # Example value, adjust as needed
-    PRECIP_OPTIMAL = 500  # Example value, adjust as needed
-    PH_OPTIMAL = 6.5  # Example value, adjust as needed
-    N_OPTIMAL = 100  # Example value, adjust as needed
-    w1, w2, w3, w4 = 0.3, 0.3, 0.2, 0.2  # Example weights, adjust as needed
 
+def _daily_wide(df: pd.DataFrame):
+    """
+    Pivots the long frame once to a (location, date) x variable matrix.
+    """
+    # Keep (location, date) rows whose values are all missing
+    wide = df.groupby(['location', 'date', 'variable'], observed=True)['value'].mean().unstack('variable')
+    variables = [str(variable) for variable in wide.columns]
+    wide.columns = variables
+    wide = wide.reset_index()
     # Extract year from date
-    df['year'] = df['date'].dt.year
-    df_seasonal = df.copy()
-    
-    df_seasonal['growing_period'] = df_seasonal['date'].dt.month.apply(lambda x: 1 if 5 <= x <= 8 else 0)
-    
-    # Filter the DataFrame to include only rows where growing_period is 1
-    growing_season_df = df_seasonal[df_seasonal['growing_period'] == 1]
-
-    # Filter the DataFrame for Temperature_max and Temperature_min
-    df_max = df[df['variable'] == 'Temperature_max'][['location', 'date', 'value']]
-    df_min = df[df['variable'] == 'Temperature_min'][['location', 'date', 'value']]
-
-    # Merge the max and min temperature DataFrames
-    df_merged = pd.merge(df_max, df_min, on=['location', 'date'], suffixes=('_max', '_min'))
-
-    df = df.merge(df_merged, on=['location', 'date'], how='left')
-    df.rename(columns={'value_max': 'TMax', 'value_min': 'TMin'}, inplace=True)
-    
-    df['GDD_day'] = ((df['TMax'] + df['TMin']) / 2 - Tbase)
-    
-    # Calculate heat stress using vectorized operations
-    df['daytime_heat_stress'] = calculate_daytime_heat_stress(df['TMax'], TMaxOptimum, TMaxLimit)
-    df['nighttime_heat_stress'] = calculate_nighttime_heat_stress(df['TMin'], TMinOptimum, TMinLimit)
-
-
-    seasonal_results = []
-
-
-    # Group by location for seasonal metrics
-    grouped_season = growing_season_df.groupby(['location', 'year'])
+    wide['year'] = wide['date'].dt.year
+    return wide, variables
 
-    # Calculate seasonal metrics
-    for location, group in tqdm(grouped_season, desc="Calculating seasonal metrics"):
-        TMax_season = group[group['variable'] == 'Temperature']['value'].max()
-        TMin_season = group[group['variable'] == 'Temperature']['value'].min()
-        
-        cum_precip = group[group['variable'] == 'Precipitation_Total_sum']['value'].sum()
-        cum_evap = group[group['variable'] == 'Evapotranspiration_sum']['value'].sum()
-
-        soil_moisture = group[group['variable'] == 'Soil_Moisture']['value'].mean()
-        T_average = group[group['variable'] == 'Temperature']['value'].mean()
-        pH = group[group['variable'] == 'pH_in_H2O']['value'].mean()
-        N = group[group['variable'] == 'Total_Nitrogen_Content']['value'].sum()
-        
-        GDD_seasonal = ((TMax_season + TMin_season) / 2 - Tbase)
-
-        drought_index = calculate_drought_index(cum_precip, cum_evap, soil_moisture, T_average)
-        yield_risk = calculate_yield_risk(GDD_seasonal, cum_precip, pH, N, GDD_OPTIMAL, PRECIP_OPTIMAL, PH_OPTIMAL, N_OPTIMAL, w1, w2, w3, w4)
-
-        representative_date = group['date'].min()
-
-        seasonal_results.append({
-            'location': location[0],
-            'date': representative_date,
-            'year': location[1],
-            'drought_index': drought_index,
-            'yield_risk': yield_risk
-        })
+def _seasonal_inputs(wide: pd.DataFrame, variables: list, df_static: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    Growing season (May to August) aggregates of each location and year that drought and yield
+    risk are computed from, indexed by (location, year).
+    """
+    seasonal_aggregations = {
+        'Temperature': ['max', 'min', 'mean'],
+        'Precipitation_Total_sum': ['sum'],
+        'Evapotranspiration_sum': ['sum'],
+        'Soil_Moisture': ['mean'],
+        'pH_in_H2O': ['mean'],
+        'Total_Nitrogen_Content': ['sum'],
+    }
+    growing_season = wide[wide['date'].dt.month.between(5, 8)]
+    season_groups = growing_season.groupby(['location', 'year'], observed=True)
+    seasonal = season_groups.agg({
+        variable: stats for variable, stats in seasonal_aggregations.items() if variable in variables
+    })
+    seasonal = seasonal.reindex(
+        index=season_groups.size().index,
+        columns=pd.MultiIndex.from_tuples([(variable, stat) for variable, stats in seasonal_aggregations.items() for stat in stats]),
+    )
+    # Sums over no rows are 0, like Series.sum
+    sum_columns = [col for col in seasonal.columns if col[1] == 'sum']
+    seasonal[sum_columns] = seasonal[sum_columns].fillna(0)
+
+    inputs = pd.DataFrame({
+        'TMax_season': seasonal[('Temperature', 'max')],
+        'TMin_season': seasonal[('Temperature', 'min')],
+        'cum_precip': seasonal[('Precipitation_Total_sum', 'sum')],
+        'cum_evap': seasonal[('Evapotranspiration_sum', 'sum')],
+        'soil_moisture': seasonal[('Soil_Moisture', 'mean')],
+        'T_average': seasonal[('Temperature', 'mean')],
+    }, index=seasonal.index)
+
+    if df_static is None:
+        inputs['pH'] = seasonal[('pH_in_H2O', 'mean')]
+        inputs['N'] = seasonal[('Total_Nitrogen_Content', 'sum')]
+    else:
+        # Each static observation used to be repeated on every day, so seasonal sums scale with the days
+        season_locations = seasonal.index.get_level_values('location').astype(str)
+        static_mean = df_static.pivot_table(index='location', columns='variable', values='value', aggfunc='mean', observed=True)
+        static_sum = df_static.pivot_table(index='location', columns='variable', values='value', aggfunc='sum', observed=True)
+        static_mean.index, static_sum.index = static_mean.index.astype(str), static_sum.index.astype(str)
+        inputs['pH'] = static_mean.get('pH_in_H2O', pd.Series(dtype=float)).reindex(season_locations).to_numpy()
+        inputs['N'] = season_groups.size().to_numpy() * static_sum.get('Total_Nitrogen_Content', pd.Series(dtype=float)).reindex(season_locations).fillna(0).to_numpy()
+    return inputs
 
-    seasonal_results_df = pd.DataFrame(seasonal_results)
 
-    merged_results_df = df.merge(seasonal_results_df, on=['location', 'year'], how='left')
+def compute_dependent(df: pd.DataFrame, df_static: pd.DataFrame = None, crop: str = 'default'):
+    """
+    Computes the dependent variables on a wide frame with one row per location and date.
+
+    The long frame is pivoted once to a (location, date) x variable matrix; temperatures, GDD,
+    heat stress and the seasonal metrics are computed on that matrix. Static soil variables are
+    taken from `df_static` (see load_data('METER_BLUE_STATIC')) and joined per location. Without
+    it, static variables found as rows of `df` are used as daily columns; their seasonal sums then
+    count each day once, whatever the number of static observations. The thresholds and optima
+    are the `crop` row of CROP_PARAMETERS.
+    """
+    # Optimal and limit values for stress calculations
+    params = CROP_PARAMETERS.loc[crop]
+    w1, w2, w3, w4 = YIELD_RISK_WEIGHTS
 
-    merged_results_df.rename(columns={'date_x': 'date'}, inplace=True)
-    merged_results_df.drop(columns=['date_y'], inplace=True)
+    wide, variables = _daily_wide(df)
+    coordinates = df.drop_duplicates(subset='location')[['location', 'lat', 'lon', 'asl']]
 
-    # Pivot the DataFrame to create a new column for each unique variable
-    df_pivot = merged_results_df.pivot_table(index=['location', 'date'], columns='variable', values='value').reset_index()
+    wide['TMax'] = wide['Temperature_max']
+    wide['TMin'] = wide['Temperature_min']
 
-    # Merge the pivoted DataFrame back to the original DataFrame
-    merged_results_df = merged_results_df.merge(df_pivot, on=['location', 'date'], how='left')
-    merged_results_df.drop_duplicates(inplace=True)
-    
-    
-    # Drop duplicates based on location and date
-    merged_results_df.drop_duplicates(subset=['location', 'date'], inplace=True)
-    merged_results_df.drop(columns=['variable', 'value'], inplace=True)
+    wide['GDD_day'] = growing_degree_days(wide['TMax'], wide['TMin'], params['Tbase'])
 
-    return merged_results_df
+    # Calculate heat stress using vectorized operations
+    wide['daytime_heat_stress'] = calculate_daytime_heat_stress(wide['TMax'], params['TMaxOptimum'], params['TMaxLimit'])
+    wide['nighttime_heat_stress'] = calculate_nighttime_heat_stress(wide['TMin'], params['TMinOptimum'], params['TMinLimit'])
+
+    # Aggregate the growing season of each location and year in one pass
+    seasonal = _seasonal_inputs(wide, variables, df_static)
+    GDD_seasonal = growing_degree_days(seasonal['TMax_season'], seasonal['TMin_season'], params['Tbase'])
+
+    seasonal_results_df = pd.DataFrame({
+        'drought_index': calculate_drought_index(seasonal['cum_precip'], seasonal['cum_evap'], seasonal['soil_moisture'], seasonal['T_average']).to_numpy(),
+        'yield_risk': calculate_yield_risk(
+            GDD_seasonal, seasonal['cum_precip'], seasonal['pH'], seasonal['N'],
+            params['GDD_OPTIMAL'], params['PRECIP_OPTIMAL'], params['PH_OPTIMAL'], params['N_OPTIMAL'], w1, w2, w3, w4,
+        ).to_numpy(),
+    }, index=seasonal.index).reset_index()
+
+    # Broadcast the per (location, year) and per location tables onto the daily rows
+    wide = wide.merge(seasonal_results_df, on=['location', 'year'], how='left')
+    wide = wide.merge(coordinates, on='location', how='left')
+    if df_static is not None:
+        static_wide = static_features(df_static)
+        wide = wide.merge(static_wide, on='location', how='left')
+        variables += [col for col in static_wide.columns if col != 'location']
+
+    dependent_columns = ['TMax', 'TMin', 'GDD_day', 'daytime_heat_stress', 'nighttime_heat_stress', 'drought_index', 'yield_risk']
+    return wide[['location', 'lat', 'lon', 'asl', 'date', 'year'] + dependent_columns + variables]
+
+
+def compute_crop_risks(df: pd.DataFrame, df_static: pd.DataFrame = None, crops=None):
+    """
+    Heat stress, GDD, drought and yield risk of every crop for every (location, date) row.
 
+    The pivot and the seasonal aggregation are done once; each metric is then one broadcast of
+    the (n_rows, 1) inputs against the (n_crops,) parameters of `crops` (crop names, a parameter
+    table, or all of CROP_PARAMETERS). Returns the (location, date) keys and a dict of
+    (n_rows, n_crops) float32 arrays whose columns follow the crop table. 'drought_index' is the
+    numeric balance (negative is high risk); it does not depend on the crop.
+    """
+    params = crop_parameters(crops)
+    w1, w2, w3, w4 = YIELD_RISK_WEIGHTS
+    wide, variables = _daily_wide(df)
+    seasonal = _seasonal_inputs(wide, variables, df_static)
+
+    def column(frame, name):
+        return frame[name].to_numpy(dtype=np.float64)[:, None]
+
+    def parameter(name):
+        return params[name].to_numpy(dtype=np.float64)
+
+    TMax, TMin = column(wide, 'Temperature_max'), column(wide, 'Temperature_min')
+    risks = {
+        'GDD_day': growing_degree_days(TMax, TMin, parameter('Tbase')),
+        'daytime_heat_stress': heat_stress(TMax, parameter('TMaxOptimum'), parameter('TMaxLimit')),
+        'nighttime_heat_stress': heat_stress(TMin, parameter('TMinOptimum'), parameter('TMinLimit')),
+    }
+
+    seasonal_risks = {
+        'drought_index': np.broadcast_to(
+            drought_balance(column(seasonal, 'cum_precip'), column(seasonal, 'cum_evap'), column(seasonal, 'soil_moisture'), column(seasonal, 'T_average')),
+            (len(seasonal), len(params)),
+        ),
+        'yield_risk': yield_risk(
+            growing_degree_days(column(seasonal, 'TMax_season'), column(seasonal, 'TMin_season'), parameter('Tbase')),
+            column(seasonal, 'cum_precip'), column(seasonal, 'pH'), column(seasonal, 'N'),
+            parameter('GDD_OPTIMAL'), parameter('PRECIP_OPTIMAL'), parameter('PH_OPTIMAL'), parameter('N_OPTIMAL'), w1, w2, w3, w4,
+        ),
+    }
+    # Row of each day's (location, year) in the seasonal table; days of years without a season get NaN
+    season_row = seasonal.index.get_indexer(pd.MultiIndex.from_frame(wide[['location', 'year']]))
+    for name, values in seasonal_risks.items():
+        daily = np.full((len(wide), len(params)), np.nan, dtype=np.float32)
+        daily[season_row >= 0] = values[season_row[season_row >= 0]]
+        risks[name] = daily
+
+    risks = {name: values.astype(np.float32, copy=False) for name, values in risks.items()}
+    return wide[['location', 'date']], risks
@@ -0,0 +1,278 @@
+import hashlib
+import os
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from src.forecast.cache import read_cached_frame, write_cached_frame
+from src.forecast.rolling import _pack, grouped_rolling
+
+FEATURE_CACHE_DIR = os.getenv('FEATURE_CACHE_DIR')
+# Bump when an op changes so results memoized on disk are recomputed
+FEATURE_GRAPH_VERSION = 1
+# Ops whose results are worth memoizing on disk; the others are cheaper to recompute than to read
+MEMOIZED_OPS = {'rolling', 'fft', 'stft'}
+# Ops whose nodes over the same source are computed together, with the params they must share
+BATCHED_OPS = {'rolling': ('group',), 'stft': ('group', 'window', 'power')}
+# Values per chunk of sliding windows transformed at once by the STFT
+STFT_CHUNK_SIZE = 2 ** 24
+
+# A node of the feature graph. `sources` are column names or other Features and `params` is a
+# sorted tuple of (name, value) pairs, so equal specs compare and hash equal wherever they are
+# declared and each one is computed once.
+Feature = namedtuple('Feature', ['op', 'sources', 'params'])
+
+
+def feature(op, *sources, **params):
+    return Feature(op, sources, tuple(sorted(params.items())))
+
+def _grouped(values, df, group):
+    return pd.Series(values, copy=False).groupby(df[group].to_numpy())
+
+def _shift(values, df, group, periods):
+    return _grouped(values, df, group).shift(periods).to_numpy()
+
+def _log1p(values, df):
+    return np.log(values + 1)
+
+def _mul(values, other, df):
+    return values * other
+
+def _diff(values, df, group):
+    return _grouped(values, df, group).diff().to_numpy()
+
+def _fillna_group_mean(values, df, group):
+    series = pd.Series(values, copy=False)
+    return series.fillna(_grouped(values, df, group).transform('mean')).to_numpy()
+
+def _pack_values(values, df, group):
+    """
+    The rows of each group in a padded (groups, longest group) array, and the row index,
+    group and position of each packed value.
+    """
+    codes, uniques = pd.factorize(df[group])
+    keep = np.flatnonzero(codes >= 0)
+    order, sorted_codes, position, width = _pack(codes[keep], len(uniques))
+    rows = keep[order]
+    packed = np.full((len(uniques), width), np.nan)
+    packed[sorted_codes, position] = values[rows]
+    return packed, rows, sorted_codes, position
+
+def _fft(values, df, group):
+    """
+    |FFT| / n of each group's series. The groups are packed into one padded array and groups of
+    the same length (usually all of them) are transformed by one batched call.
+    """
+    packed, rows, sorted_codes, position = _pack_values(values, df, group)
+    lengths = np.bincount(sorted_codes, minlength=len(packed))
+    spectra = np.full(packed.shape, np.nan)
+    for length in np.unique(lengths[lengths > 0]):
+        members = np.flatnonzero(lengths == length)
+        spectra[members, :length] = np.abs(np.fft.fft(packed[members, :length], axis=1)) / length
+    out = np.full(len(values), np.nan)
+    out[rows] = spectra[sorted_codes, position]
+    return out
+
+def _fft_power(magnitude, df, group):
+    """
+    |FFT|^2 / n of each group's series, from the |FFT| / n of an fft node.
+    """
+    return magnitude ** 2 * df.groupby(group)[group].transform('size').to_numpy()
+
+def _stft(values, df, group, window, bins, power=False):
+    """
+    Causal short-time FFT: for every row, |FFT| / window (or |FFT|^2 / window with `power`) at
+    each of `bins` over the group's last `window` values up to and including the row. Rows with
+    fewer than `window` values so far are NaN. All groups and bins come from one batched rfft
+    over sliding windows of the packed array, chunked to bound memory. Returns one array per bin.
+    """
+    bins = np.asarray(bins)
+    if bins.min() < 0 or bins.max() > window // 2:
+        raise ValueError(f"STFT bins must be between 0 and {window // 2} for a window of {window}")
+    packed, rows, sorted_codes, position = _pack_values(values, df, group)
+    spectra = np.full((len(bins),) + packed.shape, np.nan)
+    if packed.shape[1] >= window:
+        windows = np.lib.stride_tricks.sliding_window_view(packed, window, axis=1)
+        chunk = max(1, STFT_CHUNK_SIZE // (windows.shape[1] * window))
+        for start in range(0, len(packed), chunk):
+            spectrum = np.abs(np.fft.rfft(windows[start:start + chunk], axis=2)[..., bins])
+            spectrum = (spectrum ** 2 if power else spectrum) / window
+            spectra[:, start:start + chunk, window - 1:] = np.moveaxis(spectrum, 2, 0)
+    outputs = []
+    for spectrum in spectra:
+        out = np.full(len(values), np.nan)
+        out[rows] = spectrum[sorted_codes, position]
+        outputs.append(out)
+    return outputs
+
+OPS = {
+    'shift': _shift,
+    'log1p': _log1p,
+    'mul': _mul,
+    'diff': _diff,
+    'fillna_group_mean': _fillna_group_mean,
+    'fft': _fft,
+    'fft_power': _fft_power,
+}
+
+
+def _columns(node):
+    """
+    Input columns a node reads, including the group columns of every op below it.
+    """
+    if isinstance(node, str):
+        return {node}
+    params = dict(node.params)
+    columns = {params['group']} if 'group' in params else set()
+    for source in node.sources:
+        columns |= _columns(source)
+    return columns
+
+def _walk(node, memo):
+    """
+    The node and every Feature below it, stopping at nodes already in memo.
+    """
+    if isinstance(node, str) or node in memo:
+        return
+    yield node
+    for source in node.sources:
+        yield from _walk(source, memo)
+
+def _rolling_spec(node):
+    params = dict(node.params)
+    if params['stat'] == 'quantile':
+        return ('quantile', params['window'], params['q'])
+    return (params['stat'], params['window'])
+
+
+class FeatureGraph:
+    """
+    Evaluates a {column name: Feature} mapping on a frame. Identical nodes are computed once and
+    shared by every name (and every downstream node) that uses them. Rolling nodes over the same
+    source and group are batched into one grouped_rolling call, and STFT bins of one window into
+    one transform. With a cache directory, the results of MEMOIZED_OPS are stored on disk keyed
+    by the node spec and the contents of the input columns it reads, so unchanged features are
+    read back instead of recomputed.
+    """
+
+    def __init__(self, df, known=None, cache_dir=FEATURE_CACHE_DIR):
+        self.df = df
+        self.cache_dir = cache_dir
+        self.memo = {}
+        self.column_digests = {}
+        self.stats = {'computed': 0, 'cached': 0}
+        # Columns already holding a node, e.g. lag features used by the interaction features
+        for name, node in (known or {}).items():
+            if name in df.columns:
+                self.memo[node] = df[name].to_numpy(dtype=np.float64)
+
+    def _column_digest(self, column):
+        if column not in self.column_digests:
+            hashed = pd.util.hash_pandas_object(self.df[column], index=False).to_numpy()
+            self.column_digests[column] = hashlib.sha256(hashed.tobytes()).hexdigest()
+        return self.column_digests[column]
+
+    def _cache_path(self, node):
+        if self.cache_dir is None or node.op not in MEMOIZED_OPS:
+            return None
+        spec_digest = hashlib.sha256(f'{FEATURE_GRAPH_VERSION}:{node!r}'.encode()).hexdigest()[:16]
+        input_digest = hashlib.sha256()
+        for column in sorted(_columns(node)):
+            input_digest.update(self._column_digest(column).encode())
+        return os.path.join(self.cache_dir, f'feature-{spec_digest}-{input_digest.hexdigest()[:32]}.arrow')
+
+    def _load(self, node):
+        cache_path = self._cache_path(node)
+        if cache_path is None:
+            return None
+        cached = read_cached_frame(cache_path, verbose=False)
+        if cached is None:
+            return None
+        self.stats['cached'] += 1
+        return cached['value'].to_numpy()
+
+    def _store(self, node, values):
+        self.stats['computed'] += 1
+        cache_path = self._cache_path(node)
+        if cache_path is not None:
+            write_cached_frame(pd.DataFrame({'value': values}), cache_path)
+        self.memo[node] = values
+
+    def _evaluate_rolling(self, nodes):
+        """
+        Computes the rolling nodes sharing a source and group with one grouped_rolling call.
+        """
+        source, group = nodes[0].sources[0], dict(nodes[0].params)['group']
+        frame = pd.DataFrame({'group': self.df[group].to_numpy(), 'value': self.evaluate(source)})
+        results = grouped_rolling(frame, 'group', ['value'], [_rolling_spec(node) for node in nodes])
+        for node in nodes:
+            self._store(node, results[('value', _rolling_spec(node))])
+
+    def _evaluate_stft(self, nodes):
+        """
+        Computes the bins of the STFT nodes sharing a source, group, window and power with one
+        transform.
+        """
+        params = dict(nodes[0].params)
+        bins = [dict(node.params)['bin'] for node in nodes]
+        results = _stft(self.evaluate(nodes[0].sources[0]), self.df, params['group'], params['window'], bins, params.get('power', False))
+        for node, values in zip(nodes, results):
+            self._store(node, values)
+
+    def _evaluate_batch(self, nodes):
+        if nodes[0].op == 'rolling':
+            self._evaluate_rolling(nodes)
+        else:
+            self._evaluate_stft(nodes)
+
+    def evaluate(self, node):
+        if isinstance(node, str):
+            return self.df[node].to_numpy(dtype=np.float64)
+        if node in self.memo:
+            return self.memo[node]
+        values = self._load(node)
+        if values is not None:
+            self.memo[node] = values
+        elif node.op in BATCHED_OPS:
+            self._evaluate_batch([node])
+        else:
+            params = dict(node.params)
+            inputs = [self.evaluate(source) for source in node.sources]
+            self._store(node, OPS[node.op](*inputs, self.df, **params))
+        return self.memo[node]
+
+    def evaluate_all(self, features):
+        # Batch the rolling and STFT nodes anywhere in the graph that are not available yet
+        batches = {}
+        for node in dict.fromkeys(n for root in features.values() for n in _walk(root, self.memo)):
+            if node.op not in BATCHED_OPS:
+                continue
+            values = self._load(node)
+            if values is not None:
+                self.memo[node] = values
+            else:
+                params = dict(node.params)
+                key = (node.op, node.sources[0]) + tuple(params.get(name) for name in BATCHED_OPS[node.op])
+                batches.setdefault(key, []).append(node)
+        for nodes in batches.values():
+            self._evaluate_batch(nodes)
+        return {name: self.evaluate(node) for name, node in features.items()}
+
+def compute_features(df: pd.DataFrame, features: dict, known: dict = None, cache_dir=FEATURE_CACHE_DIR,
+                     verbose=False) -> pd.DataFrame:
+    """
+    Adds the {column name: Feature} columns to df through a FeatureGraph. Names that share a
+    node get their own copy of the values. `known` maps existing columns of df to the nodes
+    they hold, so features declared on top of them reuse those columns. `verbose` prints how
+    many nodes were computed and read from the cache.
+    """
+    graph = FeatureGraph(df, known, cache_dir)
+    seen = {id(values) for values in graph.memo.values()}
+    for name, values in graph.evaluate_all(features).items():
+        df[name] = values.copy() if id(values) in seen else values
+        seen.add(id(values))
+    if verbose:
+        print(f"Features: {len(features)} columns from {graph.stats['computed'] + graph.stats['cached']} "
+              f"unique nodes, {graph.stats['cached']} read from cache")
+    return df
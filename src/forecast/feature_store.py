@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+import shutil
+
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+# Relative to the working directory, so the store is never written inside the installed package
+FEATURE_STORE_DIR = os.getenv('FEATURE_STORE_DIR', os.path.join('data', 'feature_store'))
+# Bump when feature_engineering's output changes, so training never reads features of an older version
+FEATURE_STORE_VERSION = 1
+# Rows per Parquet row group. Rows are sorted by location and date within a year, so a row group
+# covers a few locations and a date range, and its min/max statistics let readers skip it.
+ROW_GROUP_ROWS = 2 ** 16
+
+# Layout of a feature store directory:
+#   v1/metadata.json                          version, source, columns, dtypes and location encoding
+#   v1/features/year=2023/part-0.parquet      rows of one year, sorted by location and date
+
+
+def _version_dir(store_dir, version):
+    return os.path.join(store_dir, f'v{version}')
+
+def _features_dir(store_dir, version):
+    return os.path.join(_version_dir(store_dir, version), 'features')
+
+def _partitioning(year_type):
+    return ds.partitioning(pa.schema([('year', year_type)]), flavor='hive')
+
+def read_metadata(store_dir=FEATURE_STORE_DIR, version=FEATURE_STORE_VERSION):
+    """
+    The metadata of a stored version, or None when it has not been written.
+    """
+    path = os.path.join(_version_dir(store_dir, version), 'metadata.json')
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def frame_digest(*frames):
+    """
+    Digest of the columns and values of the frames, to key stored features on the data they
+    were computed from.
+    """
+    digest = hashlib.sha256()
+    for frame in frames:
+        digest.update(str(list(frame.columns)).encode())
+        digest.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+    return digest.hexdigest()[:32]
+
+def clear_features(store_dir=FEATURE_STORE_DIR, version=FEATURE_STORE_VERSION):
+    shutil.rmtree(_version_dir(store_dir, version), ignore_errors=True)
+
+def write_features(df: pd.DataFrame, store_dir=FEATURE_STORE_DIR, version=FEATURE_STORE_VERSION, location_mapping=None,
+                   source=None):
+    """
+    Writes the feature_engineering output as Parquet partitioned by year and clustered by
+    location. Years present in df replace the stored ones; the other years are kept. The
+    location encoding used for df is kept in the metadata to decode predictions, and `source`,
+    a digest of the data df was computed from, to tell whether the store is stale.
+    """
+    if 'year' not in df.columns:
+        df = df.assign(year=df['date'].dt.year)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.take(pc.sort_indices(table, [('location', 'ascending'), ('date', 'ascending')]))
+    ds.write_dataset(
+        table, _features_dir(store_dir, version), format='parquet', partitioning=_partitioning(table.schema.field('year').type),
+        existing_data_behavior='delete_matching', basename_template='part-{i}.parquet',
+        max_rows_per_group=ROW_GROUP_ROWS, min_rows_per_group=ROW_GROUP_ROWS,
+    )
+    metadata = {
+        'version': version,
+        'source': source,
+        'columns': list(df.columns),
+        'dtypes': {col: str(dtype) for col, dtype in df.dtypes.items()},
+        'location_mapping': {str(location): int(code) for location, code in (location_mapping or {}).items()},
+    }
+    with open(os.path.join(_version_dir(store_dir, version), 'metadata.json'), 'w') as f:
+        json.dump(metadata, f, indent=2)
+    print(f"Feature store: wrote {len(df)} rows to {_features_dir(store_dir, version)}")
+
+def read_features(store_dir=FEATURE_STORE_DIR, columns=None, start=None, end=None, locations=None,
+                  version=FEATURE_STORE_VERSION) -> pd.DataFrame:
+    """
+    Reads the rows with start <= date < end (either bound optional) of the given locations, and
+    only `columns` (all by default; 'location' and 'date' are always read). The date bounds prune
+    whole years, and the date and location bounds skip row groups by their statistics, so little
+    more than the matching data is decoded. Rows come back ordered by location and date.
+    """
+    metadata = read_metadata(store_dir, version)
+    if metadata is None:
+        raise FileNotFoundError(f"No features of version {version} in {store_dir}")
+    year_type = pa.from_numpy_dtype(np.dtype(metadata['dtypes']['year']))
+    dataset = ds.dataset(_features_dir(store_dir, version), format='parquet', partitioning=_partitioning(year_type))
+
+    conditions = []
+    if start is not None:
+        start = pd.Timestamp(start)
+        conditions += [ds.field('year') >= start.year, ds.field('date') >= start]
+    if end is not None:
+        end = pd.Timestamp(end)
+        conditions += [ds.field('year') <= end.year, ds.field('date') < end]
+    if locations is not None:
+        conditions.append(ds.field('location').isin(list(locations)))
+    predicate = None
+    for condition in conditions:
+        predicate = condition if predicate is None else predicate & condition
+
+    if columns is not None:
+        columns = list(dict.fromkeys(['location', 'date'] + list(columns)))
+    else:
+        columns = metadata['columns']
+    table = dataset.to_table(columns=columns, filter=predicate)
+    # Years are read one after the other; the sort is stable, so rows of a day keep their order
+    table = table.take(pc.sort_indices(table, [('location', 'ascending'), ('date', 'ascending')]))
+    return table.to_pandas()
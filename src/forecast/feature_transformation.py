@@ -1,4 +1,3 @@
-import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 from sklearn.metrics import mean_absolute_error
@@ -6,69 +5,81 @@ import lightgbm as lgb
 import xgboost as xgb
 from numpy import fft
 
+from src.forecast.feature_graph import compute_features, feature
+
 
 def rolling_mean_features(df: pd.DataFrame):
     features = ['lag_Energia', 'lag_PrecEuro']
     groups = ['Codigo', 'Categoria']
     times = [12, 24, 48, 168]
+    specs = {}
     for group in groups:
-        for feature in features:
+        for feature_name in features:
             for time in times:
-                df[f'roll{time}_mean_{feature}'] = df.groupby(group)[feature] \
-                    .transform(lambda x: x.rolling(window=time, min_periods=1).mean())
-    return df
+                specs[f'roll{time}_mean_{feature_name}'] = feature('rolling', feature_name, group=group, stat='mean', window=time)
+    return compute_features(df, specs)
 
 def ewm_features(df: pd.DataFrame):
     features = ['lag_Energia', 'lag_PrecEuro']
     groups = ['Codigo', 'Categoria']
     spans = [12, 24, 48, 168]
+    specs = {}
     for group in groups:
-        for feature in features:
+        for feature_name in features:
             for span in spans:
-                df[f'ewm{span}_mean_{feature}'] = df.groupby(group)[feature] \
-                    .transform(lambda x: x.ewm(span=span, min_periods=1).mean())
-    return df
+                specs[f'ewm{span}_mean_{feature_name}'] = feature('rolling', feature_name, group=group, stat='ewm', window=span)
+    return compute_features(df, specs)
 
 def diff_features(df: pd.DataFrame):
     features = ['lag_Energia', 'lag_PrecEuro']
-    for feature in features:
-        df[f'diff_{feature}'] = df.groupby('Codigo')[feature].diff()
-        df[f'diff_{feature}'] = df.groupby(['Codigo'])[f'diff_{feature}'].transform(lambda x: x.fillna(x.mean()))
-    return df
+    specs = {}
+    for feature_name in features:
+        diff = feature('diff', feature_name, group='Codigo')
+        specs[f'diff_{feature_name}'] = feature('fillna_group_mean', diff, group='Codigo')
+    return compute_features(df, specs)
 
 def volatility_features(df: pd.DataFrame):
     features = ['lag_Energia', 'lag_PrecEuro']
     groups = ['Codigo', 'Categoria']
     windows = [12, 24, 48, 168]
+    specs = {}
     for group in groups:
-        for feature in features:
+        for feature_name in features:
             for window in windows:
-                df[f'volatility_{window}_{feature}'] = df.groupby(group)[feature] \
-                    .transform(lambda x: x.rolling(window=window, min_periods=1).std())
-                df[f'volatility_{window}_{feature}'] = df.groupby(['Codigo'])[f'volatility_{window}_{feature}'].transform(lambda x: x.fillna(x.mean()))
+                volatility = feature('rolling', feature_name, group=group, stat='std', window=window)
+                specs[f'volatility_{window}_{feature_name}'] = feature('fillna_group_mean', volatility, group='Codigo')
+    return compute_features(df, specs)
 
-    return df
+# One |FFT| / n node per series; the power spectrum is derived from it, not transformed again
+ENERGY_FFT = feature('fft', 'lag_Energia', group='Codigo')
+ENERGY_POWER = feature('fft_power', ENERGY_FFT, group='Codigo')
 
-def fourrier_features(df: pd.DataFrame):    
-    def apply_fft(group):
-            X = fft.fft(group['lag_Energia'])
-            N = len(X)
-            group['lag_Energia_fft'] = np.abs(X) / N  # Normalize by length
-            return group
+def spectral_features(df: pd.DataFrame):
+    return compute_features(df, {'lag_Energia_fft': ENERGY_FFT, 'power_spectrum': ENERGY_POWER})
 
-    df = df.groupby('Codigo', group_keys=False).apply(apply_fft)
-    return df
+def fourrier_features(df: pd.DataFrame):
+    return compute_features(df, {'lag_Energia_fft': ENERGY_FFT})
 
 def frequency_power_features(df: pd.DataFrame):
-    df['power_spectrum'] = df.groupby('Codigo')['lag_Energia'].transform(lambda x: np.abs(fft.fft(x))**2 / len(x))
-    return df
+    return compute_features(df, {'power_spectrum': ENERGY_POWER}, known={'lag_Energia_fft': ENERGY_FFT})
+
+def stft_features(df: pd.DataFrame, window: int = 24, bins=(1, 2, 3, 4)):
+    """
+    Causal spectral features: the magnitude of each bin over the last `window` rows of each
+    Codigo, so a row only sees its own past.
+    """
+    specs = {}
+    for feature_name in ['lag_Energia']:
+        for frequency_bin in bins:
+            specs[f'stft{window}_bin{frequency_bin}_{feature_name}'] = feature('stft', feature_name, group='Codigo', window=window, bin=frequency_bin)
+    return compute_features(df, specs)
 
 def feature_transformation(x_train: pd.DataFrame, dependent_variables: list, independent_variables: list):
     # x_train = rolling_mean_features(x_train)
     # x_train = ewm_features(x_train)
     # x_train = diff_features(x_train)
     x_train = volatility_features(x_train)
-    x_train = fourrier_features(x_train)
-    x_train = frequency_power_features(x_train)
+    x_train = spectral_features(x_train)
+    # x_train = stft_features(x_train)
     # x_train['zero_indicator'] = (x_train['lag_Energia'] == 0).astype(int)
     return x_train
@@ -0,0 +1,142 @@
+import glob
+import json
+import os
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from src.forecast.feature_engineering import DEPENDENT_VARIABLE, LAG_HISTORY, compute_dependent, feature_engineering
+
+# Layout of a persisted dataset directory:
+#   raw/part-00000.parquet   long-format dynamic Meteoblue data, one part per ingested batch
+#   static.parquet           static soil table from load_data('METER_BLUE_STATIC')
+#   features/2023.parquet    feature_engineering output, one file per year
+#   locations.json           location encoding shared by every year
+RAW_KEYS = ['location', 'variable', 'date']
+RAW_DTYPES = {
+    'location': 'category',
+    'lat': 'float64',
+    'lon': 'float64',
+    'asl': 'float64',
+    'variable': 'category',
+    'date': 'datetime64[ns]',
+    'value': 'float32',
+}
+
+
+def _raw_dir(dataset_dir):
+    return os.path.join(dataset_dir, 'raw')
+
+def _features_dir(dataset_dir):
+    return os.path.join(dataset_dir, 'features')
+
+def _write_raw_part(dataset_dir, df):
+    os.makedirs(_raw_dir(dataset_dir), exist_ok=True)
+    batch = len(glob.glob(os.path.join(_raw_dir(dataset_dir), 'part-*.parquet')))
+    df = df[list(RAW_DTYPES)].astype(RAW_DTYPES)
+    df['batch'] = batch
+    df.to_parquet(os.path.join(_raw_dir(dataset_dir), f'part-{batch:05d}.parquet'), index=False)
+
+def read_raw(dataset_dir, start=None):
+    """
+    Reads the persisted long-format data from `start` onward. When a batch re-delivers a
+    (location, variable, date), the value from the latest batch wins.
+    """
+    filters = [('date', '>=', pd.Timestamp(start))] if start is not None else None
+    df = pq.read_table(_raw_dir(dataset_dir), filters=filters).to_pandas()
+    for col in ['location', 'variable']:
+        df[col] = df[col].cat.set_categories(sorted(df[col].cat.remove_unused_categories().cat.categories))
+    df = df.sort_values(RAW_KEYS + ['batch'], kind='stable')
+    df = df.drop_duplicates(subset=RAW_KEYS, keep='last').drop(columns=['batch'])
+    return df.reset_index(drop=True)
+
+def _read_locations(dataset_dir):
+    with open(os.path.join(dataset_dir, 'locations.json')) as f:
+        return json.load(f)
+
+def _compute_features(df, df_static, location_mapping):
+    df = compute_dependent(df, df_static)
+    return feature_engineering(df, DEPENDENT_VARIABLE, [], location_mapping)
+
+def _history_start(dataset_dir, cutoff):
+    """
+    First day of the year from which every location has LAG_HISTORY days before `cutoff`.
+    """
+    days = pq.read_table(_raw_dir(dataset_dir), columns=['location', 'date'], filters=[('date', '<', cutoff)]).to_pandas()
+    if days.empty:
+        return cutoff
+    days = days.drop_duplicates().sort_values('date')
+    start = days.groupby('location', observed=True).tail(LAG_HISTORY)['date'].min()
+    return pd.Timestamp(year=start.year, month=1, day=1)
+
+def _write_features(dataset_dir, features, years):
+    os.makedirs(_features_dir(dataset_dir), exist_ok=True)
+    for year in years:
+        features_year = features[features['date'].dt.year == year]
+        features_year.to_parquet(os.path.join(_features_dir(dataset_dir), f'{year}.parquet'), index=False)
+
+
+def build_dataset(dataset_dir, df, df_static):
+    """
+    Persists the long-format data from load_data and computes the features for all of it.
+    """
+    os.makedirs(dataset_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(_raw_dir(dataset_dir), '*.parquet')) + glob.glob(os.path.join(_features_dir(dataset_dir), '*.parquet')):
+        os.remove(path)
+    _write_raw_part(dataset_dir, df)
+    df_static.to_parquet(os.path.join(dataset_dir, 'static.parquet'), index=False)
+    return rebuild_dataset(dataset_dir)
+
+def rebuild_dataset(dataset_dir):
+    """
+    Recomputes every year of features from the persisted data.
+    """
+    df = read_raw(dataset_dir)
+    locations = sorted(df['location'].unique())
+    with open(os.path.join(dataset_dir, 'locations.json'), 'w') as f:
+        json.dump(locations, f)
+    location_mapping = {location: idx for idx, location in enumerate(locations)}
+
+    features = _compute_features(df, pd.read_parquet(os.path.join(dataset_dir, 'static.parquet')), location_mapping)
+    _write_features(dataset_dir, features, sorted(df['date'].dt.year.unique()))
+    return features
+
+def append_days(dataset_dir, df_new):
+    """
+    Appends newly received long-format rows (e.g. one day per location) and recomputes only the
+    affected tail of the features.
+
+    Seasonal drought and yield risk are broadcast over the whole year, so every year from the
+    earliest new date onward is recomputed. Lag and rolling features need LAG_HISTORY rows before
+    that, which are read back from the previous whole year so its seasonal metrics are complete.
+    The result is the same as rebuild_dataset.
+    """
+    _write_raw_part(dataset_dir, df_new)
+    locations = _read_locations(dataset_dir)
+    if not set(df_new['location'].unique()) <= set(locations):
+        print("New locations received, rebuilding the whole dataset...")
+        return rebuild_dataset(dataset_dir)
+
+    first_year = df_new['date'].min().year
+    cutoff = pd.Timestamp(year=first_year, month=1, day=1)
+
+    history_start = _history_start(dataset_dir, cutoff)
+    df = read_raw(dataset_dir, start=history_start)
+    location_mapping = {location: idx for idx, location in enumerate(locations)}
+    features = _compute_features(df, pd.read_parquet(os.path.join(dataset_dir, 'static.parquet')), location_mapping)
+    features = features[features['date'] >= cutoff]
+    _write_features(dataset_dir, features, sorted(df.loc[df['date'] >= cutoff, 'date'].dt.year.unique()))
+    return load_dataset(dataset_dir)
+
+def load_dataset(dataset_dir, start=None, end=None):
+    """
+    Reads the persisted features, optionally only the years overlapping [start, end].
+    """
+    paths = sorted(glob.glob(os.path.join(_features_dir(dataset_dir), '*.parquet')))
+    years = [int(os.path.basename(path).split('.')[0]) for path in paths]
+    paths = [
+        path for path, year in zip(paths, years)
+        if (start is None or year >= pd.Timestamp(start).year) and (end is None or year <= pd.Timestamp(end).year)
+    ]
+    features = pd.concat([pd.read_parquet(path) for path in paths], ignore_index=True)
+    return features.sort_values(['location', 'date'], kind='stable').reset_index(drop=True)
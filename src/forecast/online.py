@@ -0,0 +1,199 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.forecast.feature_engineering import (
+    DEPENDENT_VARIABLE, LAG_HORIZON, cyclical_features, encode_location, ffill_within_groups,
+    interaction_features, lag_feature_specs, time_features,
+)
+
+STATE_ARRAYS = ['history', 'n_seen', 'centre', 'window_sum', 'window_sum_sq', 'window_count', 'last_valid', 'run', 'window_sorted']
+
+
+class OnlineFeatureState:
+    """
+    Per-location state that turns one new day of compute_dependent rows into the rows
+    feature_engineering would produce for that day, without going back over the history.
+
+    For every location and dependent variable it keeps a ring buffer of the last
+    horizon + 25 values (the lags reach back horizon + 24 rows), running sums of the last
+    `horizon` values for the rolling mean and std, and those values in a sorted buffer for the
+    rolling quantiles. Like lags_features it counts rows, so a location advances only on the
+    days it reports.
+    """
+
+    def __init__(self, location_mapping, dependent_vars=DEPENDENT_VARIABLE, horizon=LAG_HORIZON):
+        self.location_mapping = dict(location_mapping)
+        self.dependent_vars = list(dependent_vars)
+        self.horizon = horizon
+        self.specs = lag_feature_specs(self.dependent_vars, horizon)
+        n_locations, n_vars = len(self.location_mapping), len(self.dependent_vars)
+        capacity = horizon + 25
+        self.history = np.full((n_locations, n_vars, capacity), np.nan)
+        self.n_seen = np.zeros(n_locations, dtype=np.int64)
+        # Running sums are taken around the first value seen, which keeps them small
+        self.centre = np.full((n_locations, n_vars), np.nan)
+        self.window_sum = np.zeros((n_locations, n_vars))
+        self.window_sum_sq = np.zeros((n_locations, n_vars))
+        self.window_count = np.zeros((n_locations, n_vars), dtype=np.int64)
+        # Run of equal values ending at the newest one: pandas reports a std of exactly 0 over it
+        self.last_valid = np.full((n_locations, n_vars), np.nan)
+        self.run = np.zeros((n_locations, n_vars), dtype=np.int64)
+        # The valid values of the window in ascending order, padded with +inf
+        self.window_sorted = np.full((n_locations, n_vars, horizon), np.inf)
+
+    @classmethod
+    def from_history(cls, df: pd.DataFrame, location_mapping: dict = None, dependent_vars=DEPENDENT_VARIABLE, horizon=LAG_HORIZON):
+        """
+        Builds the state from compute_dependent output, replaying only the rows each location
+        still needs.
+        """
+        if location_mapping is None:
+            location_mapping = {location: idx for idx, location in enumerate(sorted(df['location'].unique()))}
+        state = cls(location_mapping, dependent_vars, horizon)
+        df = state._prepare(df).sort_values(['date', 'location'], kind='stable')
+        df = df.groupby('location').tail(state.history.shape[2])
+        for _, day in df.groupby('date', sort=True):
+            state._push(day['location'].to_numpy(), day[state.dependent_vars].to_numpy(dtype=np.float64))
+        return state
+
+    def _prepare(self, df):
+        df = df.copy()
+        # float64 as in feature_engineering, where years without a season leave NaN in the mapping
+        df['drought_index'] = df['drought_index'].map({'High risk': 1, 'No risk': 0}).astype('float64')
+        return encode_location(df, self.location_mapping)
+
+    def _value_at(self, locations, var_idx, steps_back):
+        """
+        Value pushed `steps_back` rows before the newest one, NaN before the first row.
+        """
+        capacity = self.history.shape[2]
+        index = self.n_seen[locations] - 1 - steps_back
+        values = self.history[locations, var_idx, index % capacity]
+        return np.where(index >= 0, values, np.nan)
+
+    def _push(self, locations, values):
+        capacity, window = self.history.shape[2], self.horizon
+        rows = np.arange(len(locations))
+        valid = ~np.isnan(values)
+        n_seen = self.n_seen[locations]
+
+        # The value leaving the rolling window
+        outgoing = np.full(values.shape, np.nan)
+        has_outgoing = n_seen >= window
+        outgoing[has_outgoing] = self.history[locations[has_outgoing], :, (n_seen[has_outgoing] - window) % capacity]
+        leaving = ~np.isnan(outgoing)
+        self.history[locations, :, n_seen % capacity] = values
+
+        centre = self.centre[locations]
+        centre = np.where(np.isnan(centre) & valid, values, centre)
+        self.centre[locations] = centre
+        incoming_centred = np.where(valid, values - centre, 0)
+        outgoing_centred = np.where(leaving, outgoing - centre, 0)
+        self.window_sum[locations] += incoming_centred - outgoing_centred
+        self.window_sum_sq[locations] += incoming_centred ** 2 - outgoing_centred ** 2
+        self.window_count[locations] += valid.astype(np.int64) - leaving
+
+        last_valid = self.last_valid[locations]
+        self.run[locations] = np.where(valid, np.where(values == last_valid, self.run[locations] + 1, 1), self.run[locations])
+        self.last_valid[locations] = np.where(valid, values, last_valid)
+
+        # Remove the outgoing value from the sorted window, then insert the incoming one
+        window_sorted = self.window_sorted[locations]
+        columns = np.arange(window)
+        position = np.where(leaving, (window_sorted < outgoing[..., None]).sum(axis=2), window)
+        window_sorted[..., :-1] = np.where(columns[:-1] >= position[..., None], window_sorted[..., 1:], window_sorted[..., :-1])
+        window_sorted[..., -1] = np.where(leaving, np.inf, window_sorted[..., -1])
+        position = np.where(valid, (window_sorted < values[..., None]).sum(axis=2), window)
+        window_sorted[..., 1:] = np.where(columns[1:] > position[..., None], window_sorted[..., :-1], window_sorted[..., 1:])
+        insert = np.nonzero(valid)
+        window_sorted[rows[insert[0]], insert[1], position[insert]] = values[insert]
+        self.window_sorted[locations] = window_sorted
+
+        self.n_seen[locations] += 1
+        # Resynchronise the running sums from the window once per window length
+        resync = locations[self.n_seen[locations] % window == 0]
+        if len(resync):
+            finite = np.isfinite(self.window_sorted[resync])
+            centred = np.where(finite, self.window_sorted[resync] - self.centre[resync][..., None], 0)
+            self.window_sum[resync] = centred.sum(axis=2)
+            self.window_sum_sq[resync] = (centred ** 2).sum(axis=2)
+
+    def _rolling(self, locations, var_idx, stat, q=None):
+        count = self.window_count[locations, var_idx]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if stat == 'mean':
+                out = self.window_sum[locations, var_idx] / count + self.centre[locations, var_idx]
+            elif stat == 'std':
+                total = self.window_sum[locations, var_idx]
+                var = np.maximum(self.window_sum_sq[locations, var_idx] - total * total / count, 0) / (count - 1)
+                var[self.run[locations, var_idx] >= count] = 0
+                out = np.where(count >= 2, np.sqrt(var), np.nan)
+            elif stat == 'quantile':
+                position = (np.maximum(count, 1) - 1) * q
+                lower, upper = np.floor(position).astype(np.intp), np.ceil(position).astype(np.intp)
+                window_sorted = self.window_sorted[locations, var_idx]
+                rows = np.arange(len(locations))
+                low, high = window_sorted[rows, lower], window_sorted[rows, upper]
+                out = np.where(upper > lower, low + (high - low) * (position - lower), low)
+            else:
+                raise ValueError(f"Rolling statistic {stat} is not kept online")
+        return np.where(count >= 1, out, np.nan)
+
+    def _evaluate(self, node, locations, steps_back=0):
+        """
+        Value of a lag_feature_specs node for the newest row, `steps_back` rows earlier.
+        """
+        if isinstance(node, str):
+            return self._value_at(locations, self.dependent_vars.index(node), steps_back)
+        params = dict(node.params)
+        if node.op == 'shift':
+            return self._evaluate(node.sources[0], locations, steps_back + params['periods'])
+        if node.op == 'log1p':
+            return np.log(self._evaluate(node.sources[0], locations, steps_back) + 1)
+        if node.op == 'rolling' and steps_back == 0 and params['window'] == self.horizon:
+            return self._rolling(locations, self.dependent_vars.index(node.sources[0]), params['stat'], params.get('q'))
+        raise ValueError(f"Feature {node} is not kept online")
+
+    def update(self, df_day: pd.DataFrame) -> pd.DataFrame:
+        """
+        Adds one day of compute_dependent rows (one per location) and returns their feature rows,
+        with the columns and order of feature_engineering's output. Unlike feature_engineering,
+        rows whose lags do not reach back far enough yet are kept, with NaN.
+        """
+        unknown = set(df_day['location'].unique()) - set(self.location_mapping)
+        if unknown:
+            raise ValueError(f"Locations not in the state: {sorted(unknown)}")
+        df = self._prepare(df_day)
+        locations = df['location'].to_numpy()
+        self._push(locations, df[self.dependent_vars].to_numpy(dtype=np.float64))
+
+        for name, node in self.specs.items():
+            df[name] = self._evaluate(node, locations)
+        df = time_features(df)
+        df = cyclical_features(df)
+        df = interaction_features(df, self.specs)
+        return ffill_within_groups(df, ['location', 'date'])
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        np.savez(os.path.join(directory, 'state.npz'), **{name: getattr(self, name) for name in STATE_ARRAYS})
+        with open(os.path.join(directory, 'state.json'), 'w') as f:
+            json.dump({
+                'locations': list(self.location_mapping),
+                'codes': [int(code) for code in self.location_mapping.values()],
+                'dependent_vars': self.dependent_vars,
+                'horizon': self.horizon,
+            }, f)
+
+    @classmethod
+    def load(cls, directory):
+        with open(os.path.join(directory, 'state.json')) as f:
+            config = json.load(f)
+        state = cls(dict(zip(config['locations'], config['codes'])), config['dependent_vars'], config['horizon'])
+        with np.load(os.path.join(directory, 'state.npz')) as arrays:
+            for name in STATE_ARRAYS:
+                setattr(state, name, arrays[name])
+        return state
@@ -0,0 +1,252 @@
+import json
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+
+
+def shift(values, periods):
+    """
+    Shifts a (groups, time) array along time, filling with NaN.
+    """
+    out = np.full(values.shape, np.nan, dtype=values.dtype)
+    if periods >= 0:
+        out[:, periods:] = values[:, :values.shape[1] - periods]
+    else:
+        out[:, :periods] = values[:, -periods:]
+    return out
+
+def ffill(values):
+    """
+    Forward fills NaN along time in a (groups, time) array.
+    """
+    positions = np.where(np.isnan(values), 0, np.arange(values.shape[1]))
+    np.maximum.accumulate(positions, axis=1, out=positions)
+    return values[np.arange(values.shape[0])[:, None], positions]
+
+def _window_diff(cumulative, window):
+    out = cumulative.copy()
+    out[:, window:] -= cumulative[:, :-window]
+    return out
+
+def _window_sum(values, window):
+    """
+    Trailing window sums along time. Cumulative sums restart every `window` steps, so a window
+    combines at most two blocks and rounding does not build up over the whole series.
+    """
+    n_groups, n_times = values.shape
+    n_blocks = -(-n_times // window)
+    blocks = np.zeros((n_groups, n_blocks * window), dtype=np.float64)
+    blocks[:, :n_times] = values
+    block_cum = np.cumsum(blocks.reshape(n_groups, n_blocks, window), axis=2)
+    out = block_cum.copy()
+    # Add the part of the window that lies in the previous block
+    out[:, 1:, :] += block_cum[:, :-1, -1:] - block_cum[:, :-1, :]
+    return out.reshape(n_groups, -1)[:, :n_times]
+
+def _run_lengths(values):
+    """
+    Length of the run of equal valid values ending at each position, skipping NaN like
+    pandas' rolling variance does.
+    """
+    valid = ~np.isnan(values)
+    # Carry the last valid value over NaN so a gap does not break a run
+    last_valid = ffill(values)
+    new_run = valid & ~(last_valid == shift(last_valid, 1))
+    n_valid = np.cumsum(valid, axis=1)
+    run_start = np.where(new_run, n_valid, 0)
+    np.maximum.accumulate(run_start, axis=1, out=run_start)
+    return n_valid - run_start + 1
+
+def rolling_moments(values, window, min_periods=1):
+    """
+    Rolling count, mean and sample standard deviation (ddof=1) of a (groups, time) array,
+    ignoring NaN like pandas' rolling(window, min_periods). Uses cumulative sums in float64
+    over values centred per group, so each step is O(1) whatever the window.
+    """
+    valid = ~np.isnan(values)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        centre = np.nan_to_num(np.nanmean(values, axis=1, keepdims=True))
+    centred = np.where(valid, values - centre, 0).astype(np.float64)
+
+    count = _window_diff(np.cumsum(valid, axis=1), window)
+    total = _window_sum(centred, window)
+    total_sq = _window_sum(centred * centred, window)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+        var = np.maximum(total_sq - total * mean, 0) / (count - 1)
+    # A window of identical values has exactly zero variance, as in pandas
+    var[_run_lengths(values) >= count] = 0
+    mean += centre
+    mean[count < max(min_periods, 1)] = np.nan
+    var[(count < max(min_periods, 1)) | (count < 2)] = np.nan
+    return count, mean, np.sqrt(var)
+
+def rolling_quantile(values, window, quantiles, min_periods=1):
+    """
+    Rolling quantiles (linear interpolation) of a (groups, time) array, ignoring NaN like
+    pandas' rolling(window, min_periods).quantile(q). `quantiles` is one q or a list of them;
+    a list returns an array of shape (len(quantiles), groups, time).
+
+    Every group becomes a column of one frame, so pandas' skiplist (O(log w) per step) runs once
+    over all groups for each q, with no per-group Python calls.
+    """
+    frame = pd.DataFrame(np.asarray(values, dtype=np.float64).T, copy=False)
+    rolling = frame.rolling(window, min_periods=max(min_periods, 1))
+    out = np.stack([rolling.quantile(q).to_numpy().T for q in np.atleast_1d(quantiles)])
+    return out if np.ndim(quantiles) else out[0]
+
+class Panel:
+    """
+    Dense float32 cube of location x day x variable.
+
+    Each location owns a contiguous block of the full daily date range, so lags, rolling
+    windows and forward fills are array operations along the time axis with no groupby or
+    sorting. `present` marks the (location, day) rows that exist in the source frame; missing
+    values are NaN. The values can be backed by a memory-mapped .npy file.
+    """
+
+    def __init__(self, values, present, locations, dates, variables):
+        self.values = values
+        self.present = present
+        self.locations = pd.Index(locations)
+        self.dates = pd.DatetimeIndex(dates)
+        self.variables = list(variables)
+
+    @classmethod
+    def empty(cls, locations, dates, variables, memmap_path=None):
+        shape = (len(locations), len(dates), len(variables))
+        if memmap_path is not None:
+            values = np.lib.format.open_memmap(memmap_path, mode='w+', dtype=np.float32, shape=shape)
+            values[:] = np.nan
+        else:
+            values = np.full(shape, np.nan, dtype=np.float32)
+        present = np.zeros(shape[:2], dtype=bool)
+        return cls(values, present, locations, dates, variables)
+
+    @classmethod
+    def from_frame(cls, df, variables=None, memmap_path=None):
+        """
+        Builds a panel from a wide frame with 'location' and 'date' columns, such as the output
+        of compute_dependent. Duplicate (location, date) rows keep the last one.
+        """
+        if variables is None:
+            variables = [col for col in df.columns if col not in ('location', 'date') and pd.api.types.is_numeric_dtype(df[col])]
+        locations = np.sort(df['location'].unique())
+        dates = pd.date_range(df['date'].min(), df['date'].max(), freq='D')
+        panel = cls.empty(locations, dates, variables, memmap_path)
+
+        location_idx, time_idx = panel._positions(df)
+        panel.values[location_idx, time_idx, :] = df[variables].to_numpy(dtype=np.float32)
+        panel.present[location_idx, time_idx] = True
+        return panel
+
+    @classmethod
+    def from_long(cls, df, memmap_path=None):
+        """
+        Builds a panel from a long frame with 'location', 'date', 'variable' and 'value' columns,
+        such as the output of load_data('METER_BLUE_DATA').
+        """
+        variables = sorted(df['variable'].astype(str).unique())
+        locations = np.sort(df['location'].unique())
+        dates = pd.date_range(df['date'].min(), df['date'].max(), freq='D')
+        panel = cls.empty(locations, dates, variables, memmap_path)
+
+        location_idx, time_idx = panel._positions(df)
+        variable_idx = pd.Categorical(df['variable'].astype(str), categories=variables).codes
+        panel.values[location_idx, time_idx, variable_idx] = df['value'].to_numpy(dtype=np.float32)
+        panel.present[location_idx, time_idx] = True
+        return panel
+
+    def _positions(self, df):
+        location_idx = self.locations.get_indexer(df['location'])
+        time_idx = ((df['date'] - self.dates[0]) // pd.Timedelta(days=1)).to_numpy()
+        return location_idx, time_idx
+
+    def to_frame(self, variables=None):
+        """
+        Wide frame of the present rows, ordered by location and date.
+        """
+        variables = self.variables if variables is None else variables
+        location_idx, time_idx = np.nonzero(self.present)
+        df = pd.DataFrame({'location': self.locations[location_idx], 'date': self.dates[time_idx]})
+        for variable in variables:
+            df[variable] = self[variable][location_idx, time_idx]
+        return df
+
+    @property
+    def mask(self):
+        """
+        True where a value is missing.
+        """
+        return np.isnan(self.values)
+
+    def __getitem__(self, variable):
+        """
+        (location, day) view of one variable.
+        """
+        return self.values[:, :, self.variables.index(variable)]
+
+    def with_variables(self, new_variables, memmap_path=None):
+        """
+        Returns a panel with the given {name: (location, day) array} variables appended.
+        """
+        variables = self.variables + list(new_variables)
+        panel = Panel.empty(self.locations, self.dates, variables, memmap_path)
+        panel.values[:, :, :len(self.variables)] = self.values
+        for i, array in enumerate(new_variables.values(), start=len(self.variables)):
+            panel.values[:, :, i] = array
+        panel.present = self.present.copy()
+        return panel
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, 'values.npy'), self.values)
+        np.save(os.path.join(directory, 'present.npy'), self.present)
+        with open(os.path.join(directory, 'axes.json'), 'w') as f:
+            json.dump({
+                'locations': self.locations.tolist(),
+                'dates': self.dates.strftime('%Y-%m-%d').tolist(),
+                'variables': self.variables,
+            }, f)
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        """
+        Opens a saved panel; with `mmap_mode` the values stay on disk and are paged in on use.
+        """
+        with open(os.path.join(directory, 'axes.json')) as f:
+            axes = json.load(f)
+        values = np.load(os.path.join(directory, 'values.npy'), mmap_mode=mmap_mode)
+        present = np.load(os.path.join(directory, 'present.npy'))
+        return cls(values, present, axes['locations'], pd.to_datetime(axes['dates']), axes['variables'])
+
+
+def lags_features_panel(panel: Panel, dependent_vars: list, horizon: int) -> Panel:
+    """
+    The lags_features columns computed on a panel. Shifts and windows count days, which is the
+    same as lags_features' row counts when every location reports every day.
+    """
+    features = {}
+    for var in dependent_vars:
+        values = panel[var]
+        lag = shift(values, horizon)
+        with np.errstate(invalid='ignore'):
+            log_lag = np.log(lag + 1)
+        _, mean, std = rolling_moments(values, horizon)
+        q75 = rolling_quantile(values, horizon, 0.75)
+
+        features[f'lag_{var}'] = log_lag
+        features[f'lag1_{var}'] = shift(log_lag, 1)
+        features[f'lag24_{var}'] = shift(log_lag, 24)
+        features[f'lag_7d_{var}'] = lag
+        features[f'lag_14d_{var}'] = lag
+        features[f'rolling_mean_7d_{var}'] = mean
+        features[f'rolling_std_7d_{var}'] = std
+        features[f'rolling_q75_7d_{var}'] = q75
+        features[f'rolling_mean_28d_{var}'] = mean
+        features[f'rolling_std_28d_{var}'] = std
+    return panel.with_variables(features)
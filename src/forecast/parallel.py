@@ -0,0 +1,111 @@
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from src.forecast.feature_engineering import feature_engineering
+
+# Worker processes used by the parallel feature functions
+FEATURE_WORKERS = int(os.getenv('FEATURE_WORKERS', os.cpu_count() or 1))
+# Workers fork from a server process that has imported this module once, so they start fast and
+# share nothing with the parent but the files they are pointed at
+START_METHOD = 'forkserver'
+
+
+def _write_arrow(df, path, preserve_index=False):
+    table = pa.Table.from_pandas(df, preserve_index=preserve_index)
+    with pa.OSFile(path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+def _read_arrow(path, start=0, stop=None):
+    """
+    Rows [start, stop) of an Arrow IPC file, memory-mapped: only those rows are paged in.
+    """
+    with pa.memory_map(path, 'r') as source:
+        table = pa.ipc.open_file(source).read_all()
+    stop = table.num_rows if stop is None else stop
+    return table.slice(start, stop - start).to_pandas()
+
+def shard_bounds(codes, n_shards):
+    """
+    [start, stop) row ranges splitting rows sorted by location code into at most n_shards
+    contiguous shards of about the same number of rows, never splitting a location.
+    """
+    if len(codes) == 0:
+        return []
+    # Rows where a new location starts; shards are cut at the first of them past each target
+    boundaries = np.flatnonzero(np.diff(codes)) + 1
+    cuts = []
+    if len(boundaries):
+        targets = np.linspace(0, len(codes), n_shards + 1)[1:-1]
+        cuts = np.unique(boundaries[np.minimum(np.searchsorted(boundaries, targets), len(boundaries) - 1)])
+    edges = [0, *cuts, len(codes)]
+    return [(start, stop) for start, stop in zip(edges[:-1], edges[1:]) if stop > start]
+
+def _run_shard(fn, input_path, start, stop, output_path, args, kwargs):
+    df = _read_arrow(input_path, start, stop)
+    # Labels are the rows of the location-sorted frame, so they stay unique across shards
+    df.index = pd.RangeIndex(start, stop)
+    _write_arrow(fn(df, *args, **kwargs), output_path, preserve_index=True)
+    return output_path
+
+def map_locations(fn, df: pd.DataFrame, *args, codes=None, n_workers=FEATURE_WORKERS, **kwargs) -> pd.DataFrame:
+    """
+    Runs fn(shard, *args, **kwargs) on shards of df holding whole locations, in a process pool,
+    and concatenates the results in location order. fn must be a module-level function whose
+    result for a location only depends on that location's rows.
+
+    df is sorted by `codes` (by default the location column) with a stable sort, so each
+    location keeps its row order, and written once to an uncompressed Arrow file. Workers
+    memory-map their rows from it and write their result to Arrow files that are mapped back,
+    so no frame is pickled. With a single worker or shard, fn runs in this process.
+    """
+    codes = (df['location'] if codes is None else pd.Series(codes, index=df.index)).to_numpy()
+    order = np.argsort(codes, kind='stable')
+    df = df.iloc[order].reset_index(drop=True)
+    bounds = shard_bounds(codes[order], n_workers)
+    if n_workers <= 1 or len(bounds) <= 1:
+        return fn(df, *args, **kwargs)
+
+    with tempfile.TemporaryDirectory() as directory:
+        input_path = os.path.join(directory, 'input.arrow')
+        _write_arrow(df, input_path)
+        del df
+        context = multiprocessing.get_context(START_METHOD)
+        if START_METHOD == 'forkserver':
+            context.set_forkserver_preload([__name__, fn.__module__])
+        with ProcessPoolExecutor(max_workers=min(n_workers, len(bounds)), mp_context=context) as pool:
+            futures = [
+                pool.submit(_run_shard, fn, input_path, start, stop, os.path.join(directory, f'shard-{i:05d}.arrow'), args, kwargs)
+                for i, (start, stop) in enumerate(bounds)
+            ]
+            # Collected in submission order, so the result does not depend on which worker finishes first
+            return pd.concat([_read_arrow(future.result()) for future in futures])
+
+
+def _feature_engineering_shard(df, dependent_variable, independent_variables, location_mapping):
+    start = df.index[0]
+    df = feature_engineering(df, dependent_variable, independent_variables, location_mapping)
+    # feature_engineering numbers its rows from 0 after sorting by (location, date); in the full
+    # run this shard's rows come after those of every earlier location
+    df.index = df.index + start
+    return df
+
+def parallel_feature_engineering(data: pd.DataFrame, dependent_variable: list, independent_variables: list,
+                                 location_mapping: dict = None, n_workers=FEATURE_WORKERS) -> pd.DataFrame:
+    """
+    feature_engineering run on shards of locations in `n_workers` processes, with the same
+    rows, index and columns as a single-process run.
+    """
+    if location_mapping is None:
+        location_mapping = {location: idx for idx, location in enumerate(sorted(data['location'].unique()))}
+    codes = data['location'].map(location_mapping).astype('int64')
+    return map_locations(
+        _feature_engineering_shard, data, dependent_variable, independent_variables, location_mapping,
+        codes=codes, n_workers=n_workers,
+    )
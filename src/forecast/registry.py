@@ -0,0 +1,111 @@
+import glob
+import hashlib
+import json
+import os
+import time
+
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from src.forecast.feature_store import FEATURE_STORE_VERSION
+
+MODEL_REGISTRY_DIR = os.getenv('MODEL_REGISTRY_DIR', os.path.join(os.path.dirname(__file__), 'data', 'models'))
+
+# Name prefix and file extension of the models of each training backend
+MODEL_FORMATS = {'xgboost': ('xgb', '.ubj'), 'lightgbm': ('lgb', '.lgb')}
+
+# Layout of the registry directory, one pair of files per trained model:
+#   xgb-20230501-v1-<params digest>.ubj     an xgboost booster in UBJSON format
+#   lgb-20230501-v1-<params digest>.lgb     LightGBM boosters (one per target) as a JSON list of model strings
+#   xgb-20230501-v1-<params digest>.json    what it was trained with, for listing and invalidation
+
+
+def params_digest(params, **training):
+    """
+    Digest of the booster parameters and of anything else the training depends on
+    (rounds, objective, feature columns, data_fingerprint), so a change to any of them selects
+    another model.
+    """
+    spec = json.dumps({'params': params, **training}, sort_keys=True, default=str)
+    return hashlib.sha256(spec.encode()).hexdigest()[:16]
+
+def data_fingerprint(X_train, y_train) -> dict:
+    """
+    What identifies a training set: its locations, date range, number of rows and a hash of
+    the feature and target values, so data of another region or revised history with the same
+    columns and cutoff selects another model.
+    """
+    content = hashlib.sha256()
+    for frame in (X_train, y_train):
+        content.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+        content.update(np.asarray(frame.columns, dtype=str).tobytes())
+    return {
+        'locations': sorted(X_train['location'].unique().tolist()),
+        'start': X_train['date'].min(),
+        'end': X_train['date'].max(),
+        'n_rows': len(X_train),
+        'hash': content.hexdigest()[:16],
+    }
+
+def model_name(cutoff, digest, feature_version=FEATURE_STORE_VERSION, backend='xgboost'):
+    return f'{MODEL_FORMATS[backend][0]}-{pd.Timestamp(cutoff):%Y%m%d}-v{feature_version}-{digest}'
+
+def load_model(name, registry_dir=MODEL_REGISTRY_DIR, backend='xgboost'):
+    """
+    The registered model, or None when it has not been trained yet.
+    """
+    path = os.path.join(registry_dir, name + MODEL_FORMATS[backend][1])
+    if not os.path.exists(path):
+        print(f"Model registry miss: {name}")
+        return None
+    print(f"Model registry hit: {name}")
+    if backend == 'lightgbm':
+        with open(path) as f:
+            return [lgb.Booster(model_str=model_str) for model_str in json.load(f)]
+    return xgb.Booster(model_file=path)
+
+def save_model(model, name, registry_dir=MODEL_REGISTRY_DIR, backend='xgboost', **metadata):
+    os.makedirs(registry_dir, exist_ok=True)
+    path = os.path.join(registry_dir, name + MODEL_FORMATS[backend][1])
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        if backend == 'lightgbm':
+            f.write(json.dumps([booster.model_to_string() for booster in model]).encode())
+        else:
+            f.write(model.save_raw(raw_format='ubj'))
+    os.replace(tmp_path, path)
+    with open(os.path.join(registry_dir, f'{name}.json'), 'w') as f:
+        json.dump({
+            'name': name, 'backend': backend, 'feature_version': FEATURE_STORE_VERSION, 'trained_at': time.time(), **metadata,
+        }, f, indent=2, default=str)
+
+def list_models(registry_dir=MODEL_REGISTRY_DIR) -> pd.DataFrame:
+    records = []
+    for path in sorted(glob.glob(os.path.join(registry_dir, '*.json'))):
+        with open(path) as f:
+            # Models registered before the LightGBM backend are xgboost boosters, and those
+            # registered before trained_at was recorded have no training time
+            records.append({'backend': 'xgboost', 'trained_at': np.nan, **json.load(f)})
+    return pd.DataFrame(records)
+
+def invalidate(cutoff=None, feature_version=None, registry_dir=MODEL_REGISTRY_DIR):
+    """
+    Removes the registered models of a training cutoff and/or feature version (all models
+    when neither is given), e.g. after late data arrived before the cutoff. Returns how many
+    were removed.
+    """
+    pattern = '*-{}-{}-*'.format(
+        '*' if cutoff is None else f'{pd.Timestamp(cutoff):%Y%m%d}',
+        '*' if feature_version is None else f'v{feature_version}',
+    )
+    paths = glob.glob(os.path.join(registry_dir, f'{pattern}.json'))
+    for path in paths:
+        stem = path[:-len('.json')]
+        for _, extension in MODEL_FORMATS.values():
+            if os.path.exists(stem + extension):
+                os.remove(stem + extension)
+        os.remove(path)
+    print(f"Model registry: removed {len(paths)} models")
+    return len(paths)
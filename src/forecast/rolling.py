@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+from scipy.signal import lfilter
+
+from src.forecast.panel import rolling_moments, rolling_quantile
+
+# Statistics understood by grouped_rolling. A spec is a tuple:
+#   ('mean', window), ('std', window), ('quantile', window, q), ('ewm', span)
+MOMENT_STATS = ('mean', 'std')
+
+
+def _pack(codes, n_groups):
+    """
+    Row order that sorts the rows by group (keeping their order within a group), and the
+    (group, position) of each sorted row in a padded (groups, longest group) array.
+    """
+    order = np.argsort(codes, kind='stable')
+    sorted_codes = codes[order]
+    starts = np.searchsorted(sorted_codes, np.arange(n_groups))
+    position = np.arange(len(codes)) - starts[sorted_codes]
+    width = int(position.max()) + 1 if len(position) else 0
+    return order, sorted_codes, position, width
+
+def ewm_mean(values, span, min_periods=1):
+    """
+    Exponentially weighted mean of a (groups, time) array along time, like pandas'
+    ewm(span=span, min_periods=min_periods).mean() with adjust=True. NaN values keep their
+    place in the decay but add no weight.
+    """
+    decay = 1 - 2 / (span + 1)
+    valid = ~np.isnan(values)
+    weighted = lfilter([1], [1, -decay], np.where(valid, values, 0).astype(np.float64), axis=1)
+    weights = lfilter([1], [1, -decay], valid.astype(np.float64), axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out = weighted / weights
+    out[np.cumsum(valid, axis=1) < max(min_periods, 1)] = np.nan
+    return out
+
+def grouped_rolling(df: pd.DataFrame, group, columns: list, specs: list, min_periods=1) -> dict:
+    """
+    Computes every rolling spec for every column within each group, in the frame's row order,
+    like df.groupby(group)[column].transform(lambda x: x.rolling(...).stat()).
+
+    The rows are sorted by group once and packed into a padded (groups, rows) array, so all
+    groups are handled by the same array kernels. Mean and std of a window share one pass of
+    cumulative sums. Returns {(column, spec): array aligned with the rows of df}; rows whose
+    group key is missing get NaN, as in groupby.
+    """
+    codes, uniques = pd.factorize(df[group])
+    keep = codes >= 0
+    row_idx = np.flatnonzero(keep)
+    order, sorted_codes, position, width = _pack(codes[keep], len(uniques))
+    rows = row_idx[order]
+
+    moment_windows = sorted({spec[1] for spec in specs if spec[0] in MOMENT_STATS})
+    quantile_windows = sorted({spec[1] for spec in specs if spec[0] == 'quantile'})
+    results = {}
+    for column in columns:
+        packed = np.full((len(uniques), width), np.nan)
+        packed[sorted_codes, position] = df[column].to_numpy(dtype=np.float64)[rows]
+
+        computed = {}
+        for window in moment_windows:
+            _, mean, std = rolling_moments(packed, window, min_periods)
+            computed[('mean', window)] = mean
+            computed[('std', window)] = std
+        for window in quantile_windows:
+            quantiles = [spec[2] for spec in specs if spec[0] == 'quantile' and spec[1] == window]
+            for q, result in zip(quantiles, rolling_quantile(packed, window, quantiles, min_periods)):
+                computed[('quantile', window, q)] = result
+        for spec in specs:
+            if spec[0] == 'ewm':
+                computed[spec] = ewm_mean(packed, spec[1], min_periods)
+            elif spec[0] not in MOMENT_STATS + ('quantile',):
+                raise ValueError(f"Unknown rolling statistic: {spec[0]}")
+
+        for spec in specs:
+            out = np.full(len(df), np.nan)
+            out[rows] = computed[spec][sorted_codes, position]
+            results[(column, spec)] = out
+    return results
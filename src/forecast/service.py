@@ -0,0 +1,207 @@
+import asyncio
+import contextlib
+import datetime
+import os
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+import uvicorn
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel, Field
+
+from src.forecast.feature_engineering import DEPENDENT_VARIABLE, lag_history, latest_snapshot, snapshot_rows
+from src.forecast.feature_store import FEATURE_STORE_DIR, FEATURE_STORE_VERSION, read_features, read_metadata
+from src.forecast.registry import MODEL_REGISTRY_DIR, list_models, load_model
+from src.forecast.train import BACKENDS
+
+# Requests arriving within this many milliseconds of the first one are predicted together
+BATCH_WINDOW_MS = float(os.getenv('BATCH_WINDOW_MS', 2))
+# Rows of one prediction call at most
+MAX_BATCH_ROWS = int(os.getenv('MAX_BATCH_ROWS', 2 ** 16))
+
+
+class ForecastRequest(BaseModel):
+    locations: List[str] = Field(min_length=1)
+    start: datetime.date
+    days: int = Field(default=1, ge=1, le=366)
+    # Training cutoff of the model to use; by default the latest one not after start
+    cutoff: Optional[datetime.date] = None
+
+
+def load_served_models(registry_dir=MODEL_REGISTRY_DIR, store_dir=FEATURE_STORE_DIR) -> dict:
+    """
+    The registered models of the current feature version, one per training cutoff (the most
+    recently trained if several, of any backend), each with the features forecast_dependents
+    builds its forecast rows from: the latest feature row of every location before its cutoff
+    and the dependent variables before it, for the lag features. Keyed by cutoff.
+    """
+    models = list_models(registry_dir)
+    if models.empty:
+        raise RuntimeError(f"No models in {registry_dir}; run forecast_dependents first")
+    # Models registered before trained_at was recorded count as the oldest
+    models = models[models['feature_version'] == FEATURE_STORE_VERSION].sort_values('trained_at', na_position='first')
+    stored = read_metadata(store_dir)['dtypes']
+    served = {}
+    for record in models.groupby('cutoff').tail(1).to_dict('records'):
+        cutoff = pd.Timestamp(record['cutoff'])
+        dependent = [col for col in DEPENDENT_VARIABLE if col in stored and col not in record['columns']]
+        features = read_features(store_dir, columns=record['columns'] + dependent, end=cutoff)
+        snapshot = latest_snapshot(features[['location', 'date'] + record['columns']], cutoff)
+        served[cutoff] = {
+            'name': record['name'],
+            'model': load_model(record['name'], registry_dir, record['backend']),
+            'predict': BACKENDS[record['backend']]['predict'],
+            'columns': record['columns'],
+            'snapshot': snapshot,
+            'history': lag_history(features),
+            'locations': set(snapshot['location'].tolist()),
+        }
+    return served
+
+def predict_rows(model: dict, locations: np.ndarray, dates: np.ndarray) -> np.ndarray:
+    """
+    Predictions of one served model for (location code, date) pairs, in one call.
+    """
+    rows = snapshot_rows(model['snapshot'], locations, dates, model['history'])
+    return model['predict'](model['model'], rows[model['columns']].to_numpy(dtype=np.float32))
+
+
+class MicroBatcher:
+    """
+    Collects the requests submitted within `window_ms` of the first one (up to max_rows rows)
+    and predicts them in one call per model. Predictions run in a worker thread, so requests
+    arriving meanwhile queue up for the next batch.
+    """
+
+    def __init__(self, predict, window_ms=BATCH_WINDOW_MS, max_rows=MAX_BATCH_ROWS):
+        self.predict = predict
+        self.window = window_ms / 1000
+        self.max_rows = max_rows
+        self.n_batches = 0
+        self.n_requests = 0
+
+    def start(self):
+        self.queue = asyncio.Queue()
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self.task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self.task
+
+    async def submit(self, key, locations: np.ndarray, dates: np.ndarray) -> np.ndarray:
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((key, locations, dates, future))
+        return await future
+
+    async def _collect(self):
+        batch = [await self.queue.get()]
+        n_rows = len(batch[0][1])
+        deadline = asyncio.get_running_loop().time() + self.window
+        while n_rows < self.max_rows:
+            if self.queue.empty():
+                timeout = deadline - asyncio.get_running_loop().time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            else:
+                item = self.queue.get_nowait()
+            batch.append(item)
+            n_rows += len(item[1])
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            self.n_batches += 1
+            self.n_requests += len(batch)
+            for key in dict.fromkeys(item[0] for item in batch):
+                items = [item for item in batch if item[0] == key]
+                try:
+                    predictions = await loop.run_in_executor(
+                        None, self.predict, key,
+                        np.concatenate([item[1] for item in items]), np.concatenate([item[2] for item in items]),
+                    )
+                except Exception as error:
+                    for *_, future in items:
+                        if not future.done():
+                            future.set_exception(error)
+                    continue
+                bounds = np.cumsum([0] + [len(item[1]) for item in items])
+                for (*_, future), start, stop in zip(items, bounds[:-1], bounds[1:]):
+                    if not future.done():
+                        future.set_result(predictions[start:stop])
+
+
+def create_app(registry_dir=MODEL_REGISTRY_DIR, store_dir=FEATURE_STORE_DIR, window_ms=BATCH_WINDOW_MS,
+               max_rows=MAX_BATCH_ROWS) -> FastAPI:
+    """
+    Prediction service: loads the registered models and their feature snapshots once at
+    startup and answers POST /forecast with the four targets per location and date.
+    """
+    state = {}
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        state['models'] = load_served_models(registry_dir, store_dir)
+        state['codes'] = read_metadata(store_dir)['location_mapping']
+        state['batcher'] = MicroBatcher(lambda key, locations, dates: predict_rows(state['models'][key], locations, dates), window_ms, max_rows)
+        state['batcher'].start()
+        print(f"Serving {len(state['models'])} models for {len(state['codes'])} locations")
+        yield
+        await state['batcher'].stop()
+
+    app = FastAPI(title="Agricultural risk forecasts", lifespan=lifespan)
+
+    @app.get('/health')
+    def health():
+        batcher = state['batcher']
+        return {
+            'models': [{'cutoff': str(cutoff.date()), 'name': model['name']} for cutoff, model in state['models'].items()],
+            'batches': batcher.n_batches,
+            'requests': batcher.n_requests,
+        }
+
+    @app.post('/forecast')
+    async def forecast(request: ForecastRequest):
+        start = pd.Timestamp(request.start)
+        if request.cutoff is not None:
+            cutoff = pd.Timestamp(request.cutoff)
+            if cutoff not in state['models']:
+                raise HTTPException(404, f"No model trained up to {request.cutoff}")
+        else:
+            cutoffs = [cutoff for cutoff in state['models'] if cutoff <= start]
+            if not cutoffs:
+                raise HTTPException(404, f"No model trained before {request.start}")
+            cutoff = max(cutoffs)
+        locations = state['models'][cutoff]['locations']
+        unknown = [location for location in request.locations if state['codes'].get(location) not in locations]
+        if unknown:
+            raise HTTPException(404, f"No features before {cutoff.date()} for locations: {unknown}")
+
+        dates = pd.date_range(start, periods=request.days, freq='D')
+        codes = np.array([state['codes'][location] for location in request.locations], dtype=np.int64)
+        predictions = await state['batcher'].submit(cutoff, np.repeat(codes, len(dates)), np.tile(dates.to_numpy(), len(codes)))
+
+        forecast_df = pd.DataFrame(predictions, columns=DEPENDENT_VARIABLE)
+        forecast_df.insert(0, 'location', np.repeat(request.locations, len(dates)))
+        forecast_df.insert(1, 'date', np.tile(dates.strftime('%Y-%m-%d'), len(codes)))
+        return {'cutoff': str(cutoff.date()), 'predictions': forecast_df.to_dict('records')}
+
+    return app
+
+
+app = create_app()
+
+
+def main():
+    uvicorn.run(app, host=os.getenv('SERVICE_HOST', '127.0.0.1'), port=int(os.getenv('SERVICE_PORT', 8000)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,9 @@
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
@@ -6,28 +12,57 @@ import lightgbm as lgb
 import xgboost as xgb
 from numpy import fft
 
-from src.forecast.data import load_data
-from src.forecast.feature_engineering import feature_engineering, compute_dependent
+from src.forecast.cache import cache_key
+from src.forecast.data import METER_BLUE_DATA_PATH, METER_BLUE_STATIC_PATH, PREPROCESSING_VERSION, load_data
+from src.forecast.feature_engineering import DEPENDENT_VARIABLE, compute_dependent, forecast_features
+from src.forecast.feature_store import FEATURE_STORE_DIR, clear_features, frame_digest, read_features, read_metadata, write_features
 from src.forecast.feature_transformation import feature_transformation
+from src.forecast.parallel import FEATURE_WORKERS, START_METHOD, parallel_feature_engineering
+from src.forecast.registry import MODEL_REGISTRY_DIR, data_fingerprint, load_model, model_name, params_digest, save_model
+
+# Folds trained at once by train_model; the cores are split between them
+CV_WORKERS = int(os.getenv('CV_WORKERS', 1))
+# Rounds added to the previous fold's model in train_model's warm-start mode
+WARM_START_ROUNDS = 100
+# Training backend of train_model and forecast_dependents, a key of BACKENDS
+TRAINING_BACKEND = os.getenv('TRAINING_BACKEND', 'xgboost')
 
 
-def prepare_training_data(df: pd.DataFrame) -> pd.DataFrame:
+def prepare_training_data(df: pd.DataFrame = None, df_static: pd.DataFrame = None, start=None, end=None, columns=None,
+                          store_dir=FEATURE_STORE_DIR, n_workers=FEATURE_WORKERS, source=None) -> pd.DataFrame:
     """
     Applies the complete feature engineering pipeline to the training data.
+
+    The features are read from the feature store, only the rows with start <= date < end and
+    only `columns` (all by default) plus the dependent variables. When the store has no features
+    of the current version, or they were computed from another `source` (a digest of the input
+    data, frame_digest(df, df_static) by default when df is given), they are computed from df
+    and df_static and the store is rewritten first, with the locations split between
+    `n_workers` processes (parallel_feature_engineering).
     """
-    df_fe = pd.read_csv('/Users/armandhubler/Documents/coding_project/syngenta-start-global-hackathon-2025/src/forecast/data/df_fe.csv')
-    
-    print("Computing dependent variables...")
-    # df = compute_dependent(df)
-        
     DEPENDENT_VARIABLE = ['yield_risk', 'drought_index', 'daytime_heat_stress', 'nighttime_heat_stress']
-    # INDEPENDENT_FEATURES = df[~df.isin(DEPENDENT_VARIABLE)].columns.tolist()
-    
-    print("Feature engineering...")
-    # df_fe = feature_engineering(df.copy(), DEPENDENT_VARIABLE, INDEPENDENT_FEATURES)
-    # print("Feature transformation...")
-    # df_fe = feature_transformation(df_fe, DEPENDENT_VARIABLE, INDEPENDENT_FEATURES)
-    # df_fe.to_csv('/Users/armandhubler/Documents/coding_project/syngenta-start-global-hackathon-2025/src/forecast/data/df_fe.csv', index=False)
+
+    if df is not None and source is None:
+        source = frame_digest(df, df_static)
+    metadata = read_metadata(store_dir)
+    if metadata is None or (source is not None and metadata.get('source') != source):
+        if df is None:
+            raise ValueError(f"No features of this source in {store_dir}; pass df and df_static to compute them")
+        if metadata is not None:
+            print("Feature store was computed from other data, rebuilding...")
+            clear_features(store_dir)
+        print("Computing dependent variables...")
+        df = compute_dependent(df, df_static)
+        INDEPENDENT_FEATURES = df[~df.isin(DEPENDENT_VARIABLE)].columns.tolist()
+        location_mapping = {location: idx for idx, location in enumerate(sorted(df['location'].unique()))}
+
+        print("Feature engineering...")
+        df_fe = parallel_feature_engineering(df, DEPENDENT_VARIABLE, INDEPENDENT_FEATURES, location_mapping, n_workers)
+        # print("Feature transformation...")
+        # df_fe = feature_transformation(df_fe, DEPENDENT_VARIABLE, INDEPENDENT_FEATURES)
+        write_features(df_fe, store_dir, location_mapping=location_mapping, source=source)
+
+    df_fe = read_features(store_dir, columns=None if columns is None else DEPENDENT_VARIABLE + list(columns), start=start, end=end)
     
     print(df_fe.info())
     
@@ -76,15 +111,38 @@ def winsorize_column(df, columns, multipliers):
 # Rolling Window Cross-Validation
 def custom_rolling_window_cv(data: pd.DataFrame, initial_train_window: int, forecast_horizon: int, step: int):
     """
-    Custom rolling window cross-validation.
+    Custom rolling window cross-validation. Yields (train, test) slices of contiguous rows, so
+    selecting a fold from an array or with .iloc gives a view instead of a copy.
     """
     n = len(data)
     train_end = initial_train_window  
     while (train_end + forecast_horizon) <= n:
-        train_idx = list(range(0, train_end))
-        test_idx = list(range(train_end, train_end + forecast_horizon))
-        yield train_idx, test_idx
+        yield slice(0, train_end), slice(train_end, train_end + forecast_horizon)
         train_end += step
+
+def cv_windows(X: pd.DataFrame):
+    """
+    Rows of the initial training window, of each validation window and of the step between
+    folds in train_model's rolling window CV: 120, 120 and 30 days of every location.
+    """
+    nunique_location = X['location'].nunique()
+    timestamp = 30*4
+    return timestamp*nunique_location, timestamp*nunique_location, 30*nunique_location
+
+def _fold_matrices(reference, features, labels, train_rows, val_rows, nthread=None):
+    dtrain = xgb.QuantileDMatrix(features[train_rows], label=labels[train_rows], ref=reference, nthread=nthread)
+    dval = xgb.QuantileDMatrix(features[val_rows], label=labels[val_rows], ref=reference, nthread=nthread)
+    return dtrain, dval
+
+def cv_fold_matrices(features: np.ndarray, labels: np.ndarray, folds, nthread=None):
+    """
+    Yields the (train, val) QuantileDMatrix of each fold of one feature matrix. The feature
+    quantiles are sketched once over all rows; each fold is then only binned against those cuts,
+    from views of its rows.
+    """
+    reference = xgb.QuantileDMatrix(features, label=labels, nthread=nthread)
+    for train_rows, val_rows in folds:
+        yield _fold_matrices(reference, features, labels, train_rows, val_rows, nthread)
         
 
 def adjusted_mape(y_true, y_pred, epsilon=0.001):
@@ -102,8 +160,14 @@ def mape_eval(preds, dtrain):
     mape = np.mean(np.abs(preds - labels) / (np.abs(labels) + epsilon))
     return 'mape', mape
 
+def mape_eval_lgb(preds, eval_data):
+    """mape_eval for LightGBM, which also needs to know that lower is better."""
+    name, mape = mape_eval(preds, eval_data)
+    return name, mape, False
+
 params_xgb = {
     'objective': 'reg:squarederror',
+    'tree_method': 'hist',
     'learning_rate': 0.08996762182053374,
     'max_depth': 12,
     'min_child_weight': 15,
@@ -116,6 +180,23 @@ params_xgb = {
     'verbosity': 1
 }
 
+# params_xgb in LightGBM's terms; the objective is asymmetric_mape_obj_lgb, set when training
+params_lgb = {
+    'learning_rate': params_xgb['learning_rate'],
+    'max_depth': params_xgb['max_depth'],
+    'num_leaves': 255,
+    'min_sum_hessian_in_leaf': params_xgb['min_child_weight'],
+    'bagging_fraction': params_xgb['subsample'],
+    'bagging_freq': 1,
+    'feature_fraction': params_xgb['colsample_bytree'],
+    'min_gain_to_split': params_xgb['gamma'],
+    'lambda_l1': params_xgb['reg_alpha'],
+    'lambda_l2': params_xgb['reg_lambda'],
+    'metric': 'None',
+    'seed': 42,
+    'verbosity': -1
+}
+
 # Asymmetric Loss Function
 def asymmetric_mape_obj(preds, dtrain):
     """
@@ -159,20 +240,197 @@ def asymmetric_mape_obj_lgb(preds, train_data):
     return grad.flatten(), hess.flatten()
 
 
+def train_fold(dtrain, dval, params=None, xgb_model=None, num_boost_round=1000):
+    """
+    Trains on one fold with early stopping on its validation rows, continuing from `xgb_model`
+    when given.
+    """
+    watchlist = [(dtrain, 'train'), (dval, 'eval')]
+    
+    return xgb.train(
+        params_xgb if params is None else params,
+        dtrain,
+        num_boost_round=num_boost_round,
+        evals=watchlist,
+        early_stopping_rounds=50,
+        verbose_eval=False,
+        obj=asymmetric_mape_obj,
+        custom_metric=mape_eval,
+        xgb_model=xgb_model
+    )
+
+def best_rounds(model_xgb):
+    """
+    The model cut to its best iteration when early stopping recorded one.
+    """
+    if hasattr(model_xgb, 'best_iteration'):
+        return model_xgb[:model_xgb.best_iteration + 1]
+    return model_xgb
+
+def train_fold_predictions(dtrain, dval, params=None):
+    """
+    Trains on one fold with early stopping on its validation rows and predicts them.
+    """
+    return best_rounds(train_fold(dtrain, dval, params)).predict(dval)
+
+def warm_start_cv_predictions(features: np.ndarray, labels: np.ndarray, folds, extra_rounds=WARM_START_ROUNDS, params=None):
+    """
+    Validation predictions of every fold, in fold order. The first fold is trained from scratch;
+    each later fold continues boosting from the previous fold's model (cut to its best
+    iteration) for at most `extra_rounds` rounds on its extended window, with the same early
+    stopping. Early stopping only sees the new rounds, so the previous model is scored on the
+    fold's validation rows first and kept when no new round beats it.
+    """
+    model_xgb = None
+    for dtrain, dval in cv_fold_matrices(features, labels, folds):
+        if model_xgb is None:
+            model_xgb = best_rounds(train_fold(dtrain, dval, params))
+        else:
+            _, incoming_score = mape_eval(model_xgb.predict(dval), dval)
+            continued = train_fold(dtrain, dval, params, xgb_model=model_xgb, num_boost_round=extra_rounds)
+            if continued.best_score < incoming_score:
+                model_xgb = best_rounds(continued)
+        yield model_xgb.predict(dval)
+
+# State of a CV worker process, set once by _init_cv_worker
+_CV_WORKER = {}
+
+def _init_cv_worker(features_path, labels_path, nthread):
+    features = np.load(features_path, mmap_mode='r')
+    labels = np.load(labels_path, mmap_mode='r')
+    _CV_WORKER.update(
+        features=features,
+        labels=labels,
+        nthread=nthread,
+        reference=xgb.QuantileDMatrix(features, label=labels, nthread=nthread),
+        params={**params_xgb, 'nthread': nthread},
+    )
+
+def _run_cv_fold(train_rows, val_rows):
+    state = _CV_WORKER
+    dtrain, dval = _fold_matrices(state['reference'], state['features'], state['labels'], train_rows, val_rows, state['nthread'])
+    return train_fold_predictions(dtrain, dval, state['params'])
+
+def parallel_cv_predictions(features: np.ndarray, labels: np.ndarray, folds, n_workers=CV_WORKERS, n_cores=None):
+    """
+    Validation predictions of every fold, in fold order, with up to n_workers folds trained
+    at once in worker processes. The cores are split evenly between the workers through
+    xgboost's nthread. The matrices are saved once as .npy files that every worker
+    memory-maps; each worker sketches the quantile cuts once and bins its folds against them.
+    """
+    n_cores = n_cores or os.cpu_count() or 1
+    n_workers = max(1, min(n_workers, len(folds)))
+    nthread = max(1, n_cores // n_workers)
+    with tempfile.TemporaryDirectory() as directory:
+        features_path, labels_path = os.path.join(directory, 'features.npy'), os.path.join(directory, 'labels.npy')
+        np.save(features_path, features)
+        np.save(labels_path, labels)
+        context = multiprocessing.get_context(START_METHOD)
+        if START_METHOD == 'forkserver':
+            context.set_forkserver_preload([__name__])
+        with ProcessPoolExecutor(n_workers, mp_context=context, initializer=_init_cv_worker,
+                                 initargs=(features_path, labels_path, nthread)) as pool:
+            futures = [pool.submit(_run_cv_fold, train_rows, val_rows) for train_rows, val_rows in folds]
+            # Yielded in fold order while later folds are still training
+            for future in futures:
+                yield future.result()
+
+
+def xgb_cv_predictions(features: np.ndarray, labels: np.ndarray, folds, params=None):
+    return (train_fold_predictions(dtrain, dval, params) for dtrain, dval in cv_fold_matrices(features, labels, folds))
+
+def fit_xgb(X_train, y_train, params=None, num_boost_round=1000):
+    dtrain = xgb.DMatrix(X_train, label=y_train, enable_categorical=True)
+    return xgb.train(
+        params_xgb if params is None else params,
+        dtrain,
+        num_boost_round=num_boost_round,
+        verbose_eval=False,
+        obj=asymmetric_mape_obj,
+        custom_metric=mape_eval
+    )
+
+def predict_xgb(model_xgb, features):
+    return model_xgb.inplace_predict(features)
+
+def _lgb_datasets(features, labels, params):
+    """
+    One LightGBM dataset per target (LightGBM trees have a single output), binned once over
+    all rows; folds are subsets of them and reuse the bins.
+    """
+    labels = np.asarray(labels)
+    return [
+        lgb.Dataset(features, label=np.ascontiguousarray(labels[:, i]), params=params, free_raw_data=False).construct()
+        for i in range(labels.shape[1])
+    ]
+
+def _restore_verbosity(env):
+    """
+    LightGBM 4.1 resets its log level when the first round switches to the custom objective, then
+    warns on every tree that stops short of num_leaves. Sets the params' verbosity again from the
+    second round on; resetting it in every round would change the trees.
+    """
+    if env.iteration == env.begin_iteration + 1:
+        env.model.reset_parameter({'verbosity': env.params.get('verbosity', -1)})
 
-def train_model(X, y):
+_restore_verbosity.before_iteration = True
+_restore_verbosity.order = 0
+
+def _rows(rows):
+    return np.arange(rows.start, rows.stop) if isinstance(rows, slice) else np.asarray(rows)
+
+def lgb_cv_predictions(features: np.ndarray, labels: np.ndarray, folds, params=None):
+    """
+    Validation predictions of every fold, in fold order, with one LightGBM model per target
+    trained with asymmetric_mape_obj_lgb and the same early stopping as train_fold.
+    """
+    params = params_lgb if params is None else params
+    datasets = _lgb_datasets(features, labels, params)
+    params = {**params, 'objective': asymmetric_mape_obj_lgb}
+    for train_rows, val_rows in folds:
+        predictions = []
+        for dataset in datasets:
+            dtrain, dval = dataset.subset(_rows(train_rows)), dataset.subset(_rows(val_rows))
+            model_lgb = lgb.train(
+                params, dtrain, num_boost_round=1000, valid_sets=[dval], feval=mape_eval_lgb,
+                callbacks=[_restore_verbosity, lgb.early_stopping(50, verbose=False)],
+            )
+            predictions.append(model_lgb.predict(features[val_rows], num_iteration=model_lgb.best_iteration))
+        yield np.column_stack(predictions)
+
+def fit_lgb(X_train, y_train, params=None, num_boost_round=1000):
+    params = params_lgb if params is None else params
+    datasets = _lgb_datasets(X_train, y_train, params)
+    params = {**params, 'objective': asymmetric_mape_obj_lgb}
+    return [lgb.train(params, dataset, num_boost_round=num_boost_round, callbacks=[_restore_verbosity]) for dataset in datasets]
+
+def predict_lgb(models_lgb, features):
+    return np.column_stack([model_lgb.predict(features) for model_lgb in models_lgb])
+
+# Training backends: rolling window CV predictions, fit on a training set and predict; each has
+# the asymmetric objective and its parameters. xgboost trains with the hist tree method.
+BACKENDS = {
+    'xgboost': {'name': 'XGBoost', 'params': params_xgb, 'objective': asymmetric_mape_obj.__name__,
+                'cv_predictions': xgb_cv_predictions, 'fit': fit_xgb, 'predict': predict_xgb},
+    'lightgbm': {'name': 'LightGBM', 'params': params_lgb, 'objective': asymmetric_mape_obj_lgb.__name__,
+                 'cv_predictions': lgb_cv_predictions, 'fit': fit_lgb, 'predict': predict_lgb},
+}
+
+
+def train_model(X, y, cv_workers=CV_WORKERS, warm_start_rounds=None, backend=TRAINING_BACKEND):
+    """
+    Rolling window cross-validation of the model of a training backend (see BACKENDS). With
+    `warm_start_rounds`, each XGBoost fold continues from the previous fold's model for at most
+    that many rounds instead of training from scratch (see warm_start_cv_predictions); folds
+    then run one after the other. cv_workers and warm_start_rounds apply to XGBoost only.
+    """
     # Convert 'date' to a datetime type
     X['date'] = pd.to_datetime(X['date'])
     
     forecast_start = pd.Timestamp('2020-05-01')
     forecast_end   = pd.Timestamp('2021-01-01')
     
-    nunique_location = X['location'].nunique()
-    timestamp = 30*4
-
-    INITIAL_TRAIN_WINDOW = timestamp*nunique_location
-    FORECAST_HORIZON = timestamp*nunique_location
-    STEP = 30*nunique_location
+    INITIAL_TRAIN_WINDOW, FORECAST_HORIZON, STEP = cv_windows(X)
     DEPENDENT_VARIABLE = ['yield_risk', 'drought_index', 'daytime_heat_stress', 'nighttime_heat_stress']
 
     # Initialize dictionaries to store scores for each dependent variable
@@ -191,37 +449,25 @@ def train_model(X, y):
     # Initialize fold counter
     fold_count = 0
     
-    for fold, (train_index, val_index) in enumerate(custom_rolling_window_cv(X, INITIAL_TRAIN_WINDOW, FORECAST_HORIZON, STEP)):
+    # Build the feature and label matrices once; folds are row ranges of them
+    features = X.drop(columns=['location', 'date']).to_numpy(dtype=np.float32)
+    labels = y[DEPENDENT_VARIABLE].to_numpy(dtype=np.float32)
+    folds = list(custom_rolling_window_cv(X, INITIAL_TRAIN_WINDOW, FORECAST_HORIZON, STEP))
+    
+    name = BACKENDS[backend]['name']
+    cv_start = time.time()
+    if backend != 'xgboost':
+        predictions = BACKENDS[backend]['cv_predictions'](features, labels, folds)
+    elif warm_start_rounds is not None:
+        predictions = warm_start_cv_predictions(features, labels, folds, warm_start_rounds)
+    elif cv_workers > 1:
+        predictions = parallel_cv_predictions(features, labels, folds, cv_workers)
+    else:
+        predictions = xgb_cv_predictions(features, labels, folds)
+    
+    for fold, ((train_index, val_index), y_pred_xgb) in enumerate(zip(folds, predictions)):
         fold_count += 1  # Increment fold counter
-        X_tr = X.iloc[train_index]
-        y_tr = y.iloc[train_index]
-        X_val_fold = X.iloc[val_index]
         y_val_fold = y.iloc[val_index]
-                
-        X_tr.drop(columns=['location', 'date'], inplace=True)
-        X_val_fold.drop(columns=['location', 'date'], inplace=True)
-                
-        # ----- Train XGBoost -----
-        dtrain = xgb.DMatrix(X_tr, label=y_tr[DEPENDENT_VARIABLE], enable_categorical=True)
-        dval = xgb.DMatrix(X_val_fold, label=y_val_fold[DEPENDENT_VARIABLE], enable_categorical=True)
-        watchlist = [(dtrain, 'train'), (dval, 'eval')]
-        
-        model_xgb = xgb.train(
-            params_xgb,
-            dtrain,
-            num_boost_round=1000,
-            evals=watchlist,
-            early_stopping_rounds=50,
-            verbose_eval=False,
-            obj=asymmetric_mape_obj,
-            custom_metric=mape_eval
-        )
-        
-        dX_val = xgb.DMatrix(X_val_fold, enable_categorical=True)
-        if hasattr(model_xgb, 'best_iteration'):
-            y_pred_xgb = model_xgb.predict(dX_val, iteration_range=(0, model_xgb.best_iteration + 1))
-        else:
-            y_pred_xgb = model_xgb.predict(dX_val)
         
         # Calculate MAE and MAPE for each target
         for i, target in enumerate(DEPENDENT_VARIABLE):
@@ -231,24 +477,26 @@ def train_model(X, y):
             mae_scores[target].append(mae_xgb)
             mape_scores[target].append(mape_xgb)
             
-            print(f"XGBoost {target} --> MAE: {mae_xgb:.4f}, MAPE: {mape_xgb:.4f}")
+            print(f"{name} {target} --> MAE: {mae_xgb:.4f}, MAPE: {mape_xgb:.4f}")
         
         fold += 1
 
     # Print the total number of folds
     print(f"Total number of folds: {fold_count}")
+    print(f"Cross-validation time: {time.time() - cv_start:.1f}s")
 
     # Calculate and print average scores for each target
     for target in DEPENDENT_VARIABLE:
         avg_mae = np.mean(mae_scores[target])
         avg_mape = np.mean(mape_scores[target])
         print("--------------------------------------------")
-        print(f"\nAverage XGB MAE for {target} across folds: {avg_mae}")
-        print(f"Average XGB MAPE for {target} across folds: {avg_mape}")
+        print(f"\nAverage {name} MAE for {target} across folds: {avg_mae}")
+        print(f"Average {name} MAPE for {target} across folds: {avg_mape}")
         print("--------------------------------------------")
 
 
-def forecast_dependents(X, y, forecast_start='2023-05-01', forecast_duration=4):
+def forecast_dependents(X, y, forecast_start='2023-05-01', forecast_duration=4, registry_dir=MODEL_REGISTRY_DIR, retrain=False,
+                        backend=TRAINING_BACKEND, history=None):
     """
     Forecast the dependent variables starting from a given date for a specified duration.
     
@@ -257,6 +505,14 @@ def forecast_dependents(X, y, forecast_start='2023-05-01', forecast_duration=4):
     - y: DataFrame containing the dependent variables.
     - forecast_start: The start date for forecasting (string in 'YYYY-MM-DD' format).
     - forecast_duration: The number of months to forecast.
+    - registry_dir: Model registry holding the models trained up to each forecast_start
+      (None to always train). A model of the same backend trained with the same cutoff,
+      feature version, columns, parameters and training data is loaded instead of training again.
+    - retrain: Train (and register) the model even if the registry already has it.
+    - backend: Training backend, a key of BACKENDS.
+    - history: DataFrame with location, date and the dependent variables as the feature pipeline
+      computed them, which the lag features of the forecast days are taken from (X's own dependent
+      columns by default; prepare_training_data winsorizes those).
     
     Returns:
     - DataFrame with forecasted values for each dependent variable.
@@ -275,40 +531,48 @@ def forecast_dependents(X, y, forecast_start='2023-05-01', forecast_duration=4):
     # Filter the data to include only the training period
     X_train = X[X['date'] < forecast_start]
     y_train = y[X['date'] < forecast_start]
+    training_data = data_fingerprint(X_train, y_train[DEPENDENT_VARIABLE])
     
-    # Create a complete grid of locations and dates for the forecast period
-    locations = X['location'].unique()
+    # One feature row per location and forecast date, from the latest row of each location and
+    # the dependent variables LAG_HORIZON days before each date
     forecast_dates = pd.date_range(start=forecast_start, end=forecast_end - pd.Timedelta(days=1), freq='D')
-    forecast_grid = pd.MultiIndex.from_product([locations, forecast_dates], names=['location', 'date']).to_frame(index=False)
-    
-    # Merge the forecast grid with the original features to prepare the forecast dataset
-    X_forecast = forecast_grid.merge(X.drop(columns=['date']), on='location', how='left')
+    X_forecast = forecast_features(X, forecast_start, forecast_dates, history)
+    forecast_grid = X_forecast[['location', 'date']]
     
     # Drop unnecessary columns from the training data
     X_train.drop(columns=['location', 'date'], inplace=True)
     
-    # Train the model on the training data
-    dtrain = xgb.DMatrix(X_train, label=y_train[DEPENDENT_VARIABLE], enable_categorical=True)
-    model_xgb = xgb.train(
-        params_xgb,
-        dtrain,
-        num_boost_round=1000,
-        verbose_eval=False,
-        obj=asymmetric_mape_obj,
-        custom_metric=mape_eval
+    # Load the model trained up to forecast_start, or train it on the training data
+    num_boost_round = 1000
+    params = BACKENDS[backend]['params']
+    digest = params_digest(
+        params, num_boost_round=num_boost_round, objective=BACKENDS[backend]['objective'],
+        columns=list(X_train.columns), targets=DEPENDENT_VARIABLE, data=training_data,
     )
+    name = model_name(forecast_start, digest, backend=backend)
+    model = None
+    if registry_dir is not None and not retrain:
+        model = load_model(name, registry_dir, backend)
+    if model is None:
+        model = BACKENDS[backend]['fit'](X_train, y_train[DEPENDENT_VARIABLE], params, num_boost_round)
+        if registry_dir is not None:
+            save_model(
+                model, name, registry_dir, backend, cutoff=forecast_start, params=params,
+                num_boost_round=num_boost_round, columns=list(X_train.columns), n_rows=len(X_train),
+                locations=training_data['locations'], start=training_data['start'], end=training_data['end'],
+                data_hash=training_data['hash'],
+            )
     
     # Prepare the forecast data
     X_forecast.drop(columns=['location', 'date'], inplace=True)
-    dX_forecast = xgb.DMatrix(X_forecast, enable_categorical=True)
     
     # Forecast using the trained model
-    y_pred_forecast = model_xgb.predict(dX_forecast)
+    y_pred_forecast = BACKENDS[backend]['predict'](model, X_forecast)
     
     # Create a DataFrame for the forecasted values
     forecast_df = pd.DataFrame(y_pred_forecast, columns=DEPENDENT_VARIABLE)
-    forecast_df['location'] = forecast_grid['location']
-    forecast_df['date'] = forecast_grid['date']
+    forecast_df['location'] = forecast_grid['location'].to_numpy()
+    forecast_df['date'] = forecast_grid['date'].to_numpy()
     
     return forecast_df
 
@@ -322,17 +586,25 @@ def decode_location(df: pd.DataFrame, location_mapping: dict) -> pd.DataFrame:
     return df
 
 def main():
-    df = load_data('METER_BLUE_DATA')
-    
-    df = df[(df['date'] >= pd.to_datetime('2017-01-01')) & (df['date'] <= pd.to_datetime('2024-01-01'))]
-    
-    X, y = prepare_training_data(df.copy())
-    
-    # Forecast for May 2023 for 4 months
-    forecast_df = forecast_dependents(X, y, forecast_start='2023-05-01', forecast_duration=4)
-
-    # Decode the location
-    location_mapping = {location: idx for idx, location in enumerate(sorted(df['location'].unique()))}
+    # The store is keyed on the source files and the rows kept from them, so the raw data is
+    # only loaded when the stored features are missing or were computed from other data
+    data_start, data_end = '2017-01-01', '2024-01-01'
+    source = cache_key([METER_BLUE_DATA_PATH, METER_BLUE_STATIC_PATH], f'{PREPROCESSING_VERSION}:{data_start}:{data_end}')
+    df, df_static = None, None
+    metadata = read_metadata()
+    if metadata is None or metadata.get('source') != source:
+        df = load_data('METER_BLUE_DATA')
+        df_static = load_data('METER_BLUE_STATIC')
+        df = df[(df['date'] >= pd.to_datetime(data_start)) & (df['date'] <= pd.to_datetime(data_end))]
+    
+    X, y = prepare_training_data(df, df_static, start='2017-01-01', end='2024-01-02', source=source)
+    
+    # Forecast for May 2023 for 4 months, with the lags taken from the stored (not winsorized) dependent variables
+    history = read_features(columns=DEPENDENT_VARIABLE, start='2017-01-01', end='2023-05-01')
+    forecast_df = forecast_dependents(X, y, forecast_start='2023-05-01', forecast_duration=4, history=history)
+
+    # Decode the location with the encoding the stored features were built with
+    location_mapping = read_metadata()['location_mapping']
     forecast_df = decode_location(forecast_df, location_mapping)
 
     # Save the forecasted values to a CSV file
@@ -0,0 +1,243 @@
+import contextlib
+import json
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from src.forecast.feature_engineering import DEPENDENT_VARIABLE
+from src.forecast.parallel import START_METHOD
+from src.forecast.train import (
+    _fold_matrices, adjusted_mape, best_rounds, custom_rolling_window_cv, cv_windows, params_xgb, train_fold,
+)
+
+TUNING_DB = os.getenv('TUNING_DB', os.path.join(os.path.dirname(__file__), 'data', 'tuning.sqlite'))
+TUNING_WORKERS = int(os.getenv('TUNING_WORKERS', 1))
+# A trial is pruned after this many folds when its mean adjusted MAPE so far is worse than the
+# median of the other trials over the same folds...
+PRUNE_AFTER_FOLDS = 2
+# ...once that many trials have been completed
+PRUNE_STARTUP_TRIALS = 5
+
+# params_xgb entries searched: (low, high, scale); 'log' samples log-uniformly, 'int' uniform integers
+SEARCH_SPACE = {
+    'learning_rate': (0.01, 0.3, 'log'),
+    'max_depth': (3, 12, 'int'),
+    'min_child_weight': (1, 30, 'log'),
+    'subsample': (0.5, 1.0, 'uniform'),
+    'colsample_bytree': (0.5, 1.0, 'uniform'),
+    'gamma': (1e-8, 1.0, 'log'),
+    'reg_alpha': (1e-8, 10.0, 'log'),
+    'reg_lambda': (1e-8, 10.0, 'log'),
+}
+
+
+@contextlib.contextmanager
+def _connect(db_path):
+    """
+    A connection to the study store, committed and closed on exit. WAL lets the workers write
+    their fold scores while others read them.
+    """
+    connection = sqlite3.connect(db_path, timeout=60)
+    try:
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.executescript("""
+            CREATE TABLE IF NOT EXISTS trials (
+                study TEXT, trial INTEGER, params TEXT, state TEXT, value REAL, n_folds INTEGER,
+                started REAL, finished REAL, PRIMARY KEY (study, trial)
+            );
+            CREATE TABLE IF NOT EXISTS fold_scores (
+                study TEXT, trial INTEGER, fold INTEGER, mape REAL, PRIMARY KEY (study, trial, fold)
+            );
+        """)
+        yield connection
+        connection.commit()
+    finally:
+        connection.close()
+
+def sample_params(trial, seed=0, search_space=SEARCH_SPACE) -> dict:
+    """
+    Parameters of a trial, drawn from search_space with a generator seeded by (seed, trial), so a
+    resumed search draws the same parameters for the same trial numbers.
+    """
+    rng = np.random.default_rng([seed, trial])
+    params = {}
+    for name, (low, high, scale) in search_space.items():
+        if scale == 'int':
+            params[name] = int(rng.integers(low, high + 1))
+        elif scale == 'log':
+            params[name] = float(np.exp(rng.uniform(np.log(low), np.log(high))))
+        else:
+            params[name] = float(rng.uniform(low, high))
+    return params
+
+def load_trials(study='default', db_path=TUNING_DB) -> pd.DataFrame:
+    with _connect(db_path) as connection:
+        trials = pd.read_sql_query('SELECT * FROM trials WHERE study = ? ORDER BY trial', connection, params=(study,))
+    trials['params'] = trials['params'].map(json.loads)
+    return trials
+
+def best_params(study='default', db_path=TUNING_DB) -> dict:
+    """
+    params_xgb with the parameters of the study's best completed trial.
+    """
+    trials = load_trials(study, db_path)
+    complete = trials[trials['state'] == 'complete']
+    if complete.empty:
+        raise ValueError(f"No completed trials in study {study}")
+    return {**params_xgb, **complete.loc[complete['value'].idxmin(), 'params']}
+
+
+# State of a tuning worker process, set once by _init_tuning_worker
+_TUNING_WORKER = {}
+
+def _init_tuning_worker(features_path, labels_path, folds, nthread, db_path, study, prune_after):
+    features = np.load(features_path, mmap_mode='r')
+    labels = np.load(labels_path, mmap_mode='r')
+    _TUNING_WORKER.update(
+        features=features,
+        labels=labels,
+        folds=folds,
+        nthread=nthread,
+        db_path=db_path,
+        study=study,
+        prune_after=prune_after,
+        # Every worker sketches its own cuts: a QuantileDMatrix cannot be sent to another process
+        reference=xgb.QuantileDMatrix(features, label=labels, nthread=nthread),
+    )
+
+def _fold(state, fold):
+    # Binned for each trial rather than kept: caching every fold would hold n_folds binned
+    # copies of the matrix per worker, and binning against the cuts is cheap next to training
+    train_rows, val_rows = state['folds'][fold]
+    return _fold_matrices(state['reference'], state['features'], state['labels'], train_rows, val_rows, state['nthread'])
+
+def _should_prune(connection, study, trial, n_folds):
+    """
+    Whether the trial's mean score over its first n_folds folds is worse than the median of the
+    other trials' means over the same folds.
+    """
+    n_complete = connection.execute("SELECT COUNT(*) FROM trials WHERE study = ? AND state = 'complete'", (study,)).fetchone()[0]
+    if n_complete < PRUNE_STARTUP_TRIALS:
+        return False
+    rows = connection.execute(
+        'SELECT trial, AVG(mape) FROM fold_scores WHERE study = ? AND fold < ? GROUP BY trial HAVING COUNT(*) = ?',
+        (study, n_folds, n_folds),
+    ).fetchall()
+    scores = dict(rows)
+    others = [score for other, score in scores.items() if other != trial]
+    return bool(others) and scores[trial] > np.median(others)
+
+def _run_trial(trial, params):
+    """
+    Cross-validates one trial fold by fold, recording each fold's score. Returns the trial's
+    state ('complete' or 'pruned'), mean score and number of folds run.
+    """
+    state = _TUNING_WORKER
+    params = {**params_xgb, **params, 'nthread': state['nthread']}
+    scores = []
+    with _connect(state['db_path']) as connection:
+        for fold in range(len(state['folds'])):
+            dtrain, dval = _fold(state, fold)
+            predictions = best_rounds(train_fold(dtrain, dval, params)).predict(dval)
+            labels = dval.get_label().reshape(predictions.shape)
+            scores.append(np.mean([adjusted_mape(labels[:, i], predictions[:, i]) for i in range(labels.shape[1])]))
+            connection.execute('INSERT OR REPLACE INTO fold_scores VALUES (?, ?, ?, ?)', (state['study'], trial, fold, float(scores[-1])))
+            connection.commit()
+            prune_after = state['prune_after']
+            if prune_after is not None and prune_after <= fold + 1 < len(state['folds']) and _should_prune(connection, state['study'], trial, fold + 1):
+                return 'pruned', float(np.mean(scores)), fold + 1
+    return 'complete', float(np.mean(scores)), len(scores)
+
+def tune(features: np.ndarray, labels: np.ndarray, folds, n_trials=50, study='default', db_path=TUNING_DB,
+         n_workers=TUNING_WORKERS, n_cores=None, seed=0, search_space=SEARCH_SPACE, prune_after=PRUNE_AFTER_FOLDS) -> pd.DataFrame:
+    """
+    Random search over search_space, scored by the mean adjusted MAPE of the rolling window CV
+    folds, until the study holds n_trials finished trials. Trials run in up to n_workers worker
+    processes that memory-map the matrices and sketch the quantile cuts once (one binned copy of
+    the matrix per worker); each fold is binned against them when a trial reaches it and freed
+    after. The cores are split between the workers through nthread. Trials and fold
+    scores are stored in SQLite, so running it again resumes the study: interrupted trials are
+    run again with the same parameters, then new trial numbers are drawn. Trials are pruned from
+    `prune_after` folds on (never with None).
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    n_cores = n_cores or os.cpu_count() or 1
+    n_workers = max(1, n_workers)
+    nthread = max(1, n_cores // n_workers)
+    with _connect(db_path) as connection:
+        trials = dict(connection.execute('SELECT trial, state FROM trials WHERE study = ?', (study,)).fetchall())
+        # Fold scores of interrupted trials would count twice in the pruning medians
+        connection.execute("DELETE FROM fold_scores WHERE study = ? AND trial IN (SELECT trial FROM trials WHERE study = ? AND state = 'running')", (study, study))
+    pending = sorted(trial for trial, state in trials.items() if state == 'running')
+    n_finished = len(trials) - len(pending)
+    next_trial = max(trials, default=-1) + 1
+    pending += list(range(next_trial, next_trial + max(0, n_trials - n_finished - len(pending))))
+    if not pending:
+        print(f"Study {study}: {n_finished} trials already finished")
+        return load_trials(study, db_path)
+    print(f"Study {study}: {len(pending)} trials to run in {n_workers} workers ({n_finished} already finished)")
+
+    def started(connection, trial):
+        connection.execute(
+            "INSERT OR REPLACE INTO trials VALUES (?, ?, ?, 'running', NULL, 0, ?, NULL)",
+            (study, trial, json.dumps(sample_params(trial, seed, search_space)), time.time()),
+        )
+        connection.commit()
+
+    def finished(connection, trial, result):
+        state, value, n_folds = result
+        connection.execute(
+            'UPDATE trials SET state = ?, value = ?, n_folds = ?, finished = ? WHERE study = ? AND trial = ?',
+            (state, value, n_folds, time.time(), study, trial),
+        )
+        connection.commit()
+        print(f"Trial {trial}: {state} after {n_folds} folds, adjusted MAPE {value:.4f}")
+
+    with tempfile.TemporaryDirectory() as directory, _connect(db_path) as connection:
+        features_path, labels_path = os.path.join(directory, 'features.npy'), os.path.join(directory, 'labels.npy')
+        np.save(features_path, features)
+        np.save(labels_path, labels)
+        initargs = (features_path, labels_path, list(folds), nthread, db_path, study, prune_after)
+        if n_workers == 1:
+            _init_tuning_worker(*initargs)
+            for trial in pending:
+                started(connection, trial)
+                finished(connection, trial, _run_trial(trial, sample_params(trial, seed, search_space)))
+            _TUNING_WORKER.clear()
+        else:
+            context = multiprocessing.get_context(START_METHOD)
+            if START_METHOD == 'forkserver':
+                context.set_forkserver_preload([__name__])
+            with ProcessPoolExecutor(n_workers, mp_context=context, initializer=_init_tuning_worker, initargs=initargs) as pool:
+                # Trials are submitted as workers free up, so later trials are pruned against more results
+                running = {}
+                while pending or running:
+                    while pending and len(running) < n_workers:
+                        trial = pending.pop(0)
+                        started(connection, trial)
+                        running[pool.submit(_run_trial, trial, sample_params(trial, seed, search_space))] = trial
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        finished(connection, running.pop(future), future.result())
+    trials = load_trials(study, db_path)
+    complete = trials[trials['state'] == 'complete']
+    if not complete.empty:
+        best = complete.loc[complete['value'].idxmin()]
+        print(f"Best trial {best['trial']}: adjusted MAPE {best['value']:.4f}, params {best['params']}")
+    return trials
+
+def tune_model(X, y, n_trials=50, study='default', db_path=TUNING_DB, n_workers=TUNING_WORKERS, seed=0) -> pd.DataFrame:
+    """
+    tune on the folds of train_model's rolling window CV over the prepare_training_data output.
+    """
+    features = X.drop(columns=['location', 'date']).to_numpy(dtype=np.float32)
+    labels = y[DEPENDENT_VARIABLE].to_numpy(dtype=np.float32)
+    folds = list(custom_rolling_window_cv(X, *cv_windows(X)))
+    return tune(features, labels, folds, n_trials, study, db_path, n_workers, seed=seed)
@@ -0,0 +1,56 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# Size of our current Meteoblue exports (locations x days from 2017 onward)
+CURRENT_N_LOCATIONS = 44
+CURRENT_START, CURRENT_END = '2017-01-01', '2024-01-01'
+
+DYNAMIC_VARIABLES = [
+    ('NEMSAUTO Temperature', 'mean'),
+    ('NEMSAUTO Temperature', 'max'),
+    ('NEMSAUTO Temperature', 'min'),
+    ('NEMSAUTO Precipitation Total', 'sum'),
+    ('NEMSAUTO Evapotranspiration', 'sum'),
+    ('NEMSAUTO Soil Moisture', 'mean'),
+]
+STATIC_VARIABLES = [
+    ('SOILGRIDS2 Total Nitrogen Content', 'none'),
+    ('SOILGRIDS2 pH in H2O', 'none'),
+]
+
+
+def write_synthetic_meter_blue(directory, n_locations=CURRENT_N_LOCATIONS, start=CURRENT_START, end=CURRENT_END, seed=42):
+    """
+    Writes a dynamic and a static CSV in the wide Meteoblue export layout and returns their paths.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start, end, freq='D')
+    locations = [f'State_{i // 10}_cropField#{i}' for i in range(n_locations)]
+    coords = rng.uniform([8, 68, 0], [35, 97, 500], size=(n_locations, 3)).round(3)
+
+    def wide_frame(variables, date_columns, values):
+        meta = pd.DataFrame(
+            [(loc, *coords[i], var, 'unit', 'sfc', 'daily', agg)
+             for i, loc in enumerate(locations) for var, agg in variables],
+            columns=['location', 'lat', 'lon', 'asl', 'variable', 'unit', 'level', 'timeResolution', 'aggregation'],
+        )
+        return pd.concat([meta, pd.DataFrame(values, columns=date_columns)], axis=1)
+
+    date_columns = dates.strftime('%Y%m%dT%H%M')
+    day_of_year = dates.dayofyear.to_numpy()
+    seasonal = 10 * np.sin(2 * np.pi * (day_of_year - 100) / 365.25)
+    n_rows = n_locations * len(DYNAMIC_VARIABLES)
+    dynamic = (25 + seasonal + rng.normal(0, 3, size=(n_rows, len(dates)))).round(2)
+    dynamic_path = os.path.join(directory, 'meteoblue_dynamic.csv')
+    wide_frame(DYNAMIC_VARIABLES, date_columns, dynamic).to_csv(dynamic_path, index=False)
+
+    # Soil grids are only published every few years, with gaps that load_data forward fills
+    static_dates = pd.date_range(start, end, freq='2YS')
+    static = rng.uniform(0.05, 7.5, size=(n_locations * len(STATIC_VARIABLES), len(static_dates))).round(3)
+    static[rng.random(static.shape) < 0.3] = np.nan
+    static[:, 0] = rng.uniform(0.05, 7.5, size=static.shape[0]).round(3)
+    static_path = os.path.join(directory, 'meteoblue_static.csv')
+    wide_frame(STATIC_VARIABLES, static_dates.strftime('%Y%m%dT%H%M'), static).to_csv(static_path, index=False)
+    return dynamic_path, static_path
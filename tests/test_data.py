@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+
+from src.forecast.data import normalize_variable_names
+
+
+def row_wise_name(variable, aggregation):
+    # The per-row rule of the former preprocessing (legacy_preprocess_meter_blue_data)
+    if aggregation in ['max', 'min', 'sum']:
+        variable = f'{variable}_{aggregation}'
+    return '_'.join(variable.split(' ')[1:]).replace(' ', '_')
+
+
+def test_normalize_variable_names_matches_row_wise():
+    rng = np.random.default_rng(0)
+    variables = ['NEMSAUTO Temperature', 'NEMSAUTO Precipitation Total', 'SOILGRIDS2 pH in H2O', 'Temperature']
+    aggregations = np.array(['max', 'min', 'sum', 'mean', 'none', np.nan], dtype=object)
+    variable = pd.Series(rng.choice(variables, 500), index=np.arange(500) * 2, name='variable').astype('category')
+    aggregation = pd.Series(rng.choice(aggregations, 500), index=variable.index).astype('category')
+
+    result = normalize_variable_names(variable, aggregation)
+    expected = [row_wise_name(var, agg) for var, agg in zip(variable, aggregation)]
+    assert result.index.equals(variable.index)
+    assert list(result.cat.categories) == sorted(set(expected))
+    assert result.astype(str).tolist() == expected
+
+
+def test_normalize_variable_names_missing_variable():
+    variable = pd.Series(['NEMSAUTO Temperature', np.nan, 'NEMSAUTO Soil Moisture'], dtype=object)
+    aggregation = pd.Series(['max', 'sum', np.nan], dtype=object)
+    assert normalize_variable_names(variable, aggregation).tolist() == ['Temperature_max', '', 'Soil_Moisture']
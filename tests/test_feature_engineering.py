@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.forecast.feature_engineering import (
+    DEPENDENT_VARIABLE, LAG_HORIZON, cyclical_features, ffill_within_groups, forecast_features, interaction_features,
+    lag_feature_specs, lag_sources, lags_features, time_features,
+)
+
+
+def panel(duplicated_frac, seed=0):
+    # Shuffled (location, date) rows, some of them delivered twice with gaps in the values
+    rng = np.random.default_rng(seed)
+    locations, dates = ['a', 'b', 'c'], pd.date_range('2023-01-01', periods=20)
+    df = pd.DataFrame({
+        'location': np.repeat(locations, len(dates)),
+        'date': np.tile(dates, len(locations)),
+        'Temperature': rng.normal(25, 3, len(locations) * len(dates)),
+        'yield_risk': rng.random(len(locations) * len(dates)),
+        'drought_index': rng.integers(0, 2, len(locations) * len(dates)).astype('float64'),
+    })
+    duplicates = df.sample(frac=duplicated_frac, random_state=seed)
+    numeric = duplicates.select_dtypes('number').columns
+    duplicates[numeric] = duplicates[numeric].mask(rng.random(duplicates[numeric].shape) < 0.5)
+    df = pd.concat([df, duplicates]).sample(frac=1, random_state=seed)
+    df.loc[rng.random(len(df)) < 0.1, 'yield_risk'] = np.nan
+    return df
+
+
+@pytest.mark.parametrize('duplicated_frac', [0.0, 0.3])
+@pytest.mark.parametrize('seed', [0, 1])
+def test_ffill_within_groups_matches_groupby_apply(duplicated_frac, seed):
+    df = panel(duplicated_frac, seed)
+    expected = df.groupby(['location', 'date']).apply(lambda group: group.ffill()).reset_index(drop=True)
+    pd.testing.assert_frame_equal(ffill_within_groups(df, ['location', 'date']), expected)
+
+
+def test_forecast_features_lags_match_the_pipeline():
+    # Lags computed on the whole series are what the pipeline gives once the forecast days are known
+    rng = np.random.default_rng(0)
+    dates = pd.date_range('2022-01-01', '2023-12-31')
+    df = pd.MultiIndex.from_product([[0, 1, 2], dates], names=['location', 'date']).to_frame(index=False)
+    for var in DEPENDENT_VARIABLE:
+        df[var] = rng.random(len(df))
+    df['Temperature'] = rng.normal(25, 3, len(df))
+    df = cyclical_features(time_features(df))
+    df = interaction_features(lags_features(df, DEPENDENT_VARIABLE, LAG_HORIZON), lag_feature_specs(DEPENDENT_VARIABLE, LAG_HORIZON))
+    df = df.sort_values(['location', 'date']).reset_index(drop=True)
+
+    forecast_start = pd.Timestamp('2023-05-01')
+    forecast_dates = pd.date_range(forecast_start, periods=LAG_HORIZON + 30)
+    X_forecast = forecast_features(df[df['date'] < forecast_start], forecast_start, forecast_dates)
+    assert list(X_forecast.columns) == list(df.columns)
+    assert len(X_forecast) == 3 * len(forecast_dates)
+
+    expected = df[df['date'].isin(forecast_dates)].reset_index(drop=True)
+    snapshot = df[df['date'] == forecast_start - pd.Timedelta(days=1)].set_index('location')
+    lags = lag_sources(lag_feature_specs(DEPENDENT_VARIABLE, LAG_HORIZON))
+    assert {'lag_yield_risk', 'lag1_yield_risk', 'lag24_yield_risk', 'lag_7d_yield_risk'} <= set(lags)
+    for col, (_, periods, _) in lags.items():
+        in_history = (X_forecast['date'] < forecast_start + pd.Timedelta(days=periods)).to_numpy()
+        columns = [col] + [f'{col}_dow_sin'] * (f'{col}_dow_sin' in df.columns)
+        np.testing.assert_allclose(X_forecast.loc[in_history, columns], expected.loc[in_history, columns], err_msg=col)
+        # Past the history, the lag keeps the snapshot's value
+        np.testing.assert_allclose(X_forecast.loc[~in_history, col], snapshot.loc[X_forecast.loc[~in_history, 'location'], col], err_msg=col)
+    for col in ['rolling_mean_7d_yield_risk', 'Temperature']:
+        np.testing.assert_array_equal(X_forecast[col], snapshot.loc[X_forecast['location'], col])
+    np.testing.assert_allclose(X_forecast['dow_sin'], expected['dow_sin'])
@@ -0,0 +1,38 @@
+import pandas as pd
+import pytest
+
+from src.forecast import incremental
+from src.forecast.data import load_meter_blue_csv, load_meter_blue_static
+from tests.synthetic import write_synthetic_meter_blue
+
+
+@pytest.fixture(scope='module')
+def export(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('export')
+    dynamic_path, static_path = write_synthetic_meter_blue(directory, n_locations=3, start='2021-01-01', end='2023-01-02')
+    return load_meter_blue_csv(dynamic_path), load_meter_blue_static(static_path)
+
+
+@pytest.mark.parametrize('n_days', [1, 3])
+def test_append_days_matches_rebuild(export, tmp_path, n_days):
+    # The last days straddle a new year, so a whole year is recomputed from the previous one
+    df, df_static = export
+    new_days = pd.date_range(end=df['date'].max(), periods=n_days, freq='D')
+    incremental.build_dataset(tmp_path / 'incremental', df[df['date'] < new_days[0]], df_static)
+    for day in new_days:
+        appended = incremental.append_days(tmp_path / 'incremental', df[df['date'] == day])
+
+    incremental.build_dataset(tmp_path / 'full', df, df_static)
+    pd.testing.assert_frame_equal(appended, incremental.load_dataset(tmp_path / 'full'))
+
+
+def test_append_days_with_new_location_rebuilds(export, tmp_path):
+    df, df_static = export
+    last_day = df['date'].max()
+    first_location = df['location'].iloc[0]
+    earlier = df[(df['date'] < last_day) & (df['location'] != first_location)]
+    incremental.build_dataset(tmp_path / 'incremental', earlier, df_static)
+    appended = incremental.append_days(tmp_path / 'incremental', df[df['date'] == last_day])
+
+    incremental.build_dataset(tmp_path / 'full', pd.concat([earlier, df[df['date'] == last_day]]), df_static)
+    pd.testing.assert_frame_equal(appended.reset_index(drop=True), incremental.load_dataset(tmp_path / 'full').reset_index(drop=True))
@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.forecast.panel import rolling_quantile
+
+
+@pytest.fixture
+def values():
+    # Rounded values for ties, scattered NaN and a gap longer than the window
+    rng = np.random.default_rng(0)
+    values = rng.normal(0, 3, size=(5, 200)).round(1)
+    values[rng.random(values.shape) < 0.05] = np.nan
+    values[:, 80:120] = np.nan
+    return values
+
+
+def expected_quantile(values, window, q, min_periods=1):
+    series = pd.Series(values.ravel())
+    groups = np.repeat(np.arange(values.shape[0]), values.shape[1])
+    return series.groupby(groups).transform(lambda x: x.rolling(window, min_periods=min_periods).quantile(q)).to_numpy()
+
+
+@pytest.mark.parametrize('window', [1, 7, 30])
+def test_rolling_quantile_matches_pandas(values, window):
+    quantiles = [0.1, 0.5, 0.75, 0.9]
+    result = rolling_quantile(values, window, quantiles)
+    assert result.shape == (len(quantiles), *values.shape)
+    for q, computed in zip(quantiles, result):
+        np.testing.assert_allclose(computed.ravel(), expected_quantile(values, window, q), rtol=1e-12, equal_nan=True, err_msg=str(q))
+
+
+def test_rolling_quantile_single_q_and_min_periods(values):
+    result = rolling_quantile(values, 30, 0.75, min_periods=10)
+    assert result.shape == values.shape
+    np.testing.assert_allclose(result.ravel(), expected_quantile(values, 30, 0.75, min_periods=10), rtol=1e-12, equal_nan=True)
@@ -0,0 +1,39 @@
+import pandas as pd
+import pytest
+
+from src.forecast.data import load_meter_blue_csv, load_meter_blue_static
+from src.forecast.feature_store import read_metadata
+from src.forecast.train import prepare_training_data
+from tests.synthetic import write_synthetic_meter_blue
+
+
+@pytest.fixture(scope='module')
+def export(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('export')
+    dynamic_path, static_path = write_synthetic_meter_blue(directory, n_locations=2, start='2022-01-01', end='2023-01-01')
+    return load_meter_blue_csv(dynamic_path), load_meter_blue_static(static_path)
+
+
+def test_prepare_training_data_rebuilds_store_from_other_data(export, tmp_path):
+    df, df_static = export
+    store_dir = tmp_path / 'store'
+    first_location = df['location'].iloc[0]
+    prepare_training_data(df[df['location'] == first_location], df_static, store_dir=store_dir, n_workers=1)
+    X, _ = prepare_training_data(df, df_static, store_dir=store_dir, n_workers=1)
+
+    X_full, _ = prepare_training_data(df, df_static, store_dir=tmp_path / 'full', n_workers=1)
+    pd.testing.assert_frame_equal(X, X_full)
+    assert X['location'].nunique() == 2
+
+
+def test_prepare_training_data_without_data_needs_matching_store(export, tmp_path):
+    df, df_static = export
+    store_dir = tmp_path / 'store'
+    with pytest.raises(ValueError):
+        prepare_training_data(store_dir=store_dir)
+
+    prepare_training_data(df, df_static, store_dir=store_dir, n_workers=1, source='export')
+    assert read_metadata(store_dir)['source'] == 'export'
+    prepare_training_data(store_dir=store_dir, source='export')
+    with pytest.raises(ValueError):
+        prepare_training_data(store_dir=store_dir, source='other export')